@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Журнал активности в памяти с индексами
+- Загружается из листа Activity один раз, дальше пополняется при записи
+- Индекс по типу события: выборка и подсчёт без перебора всех записей
+- Время записей неубывающее: диапазон since/until - бинарным поиском
+- Курсор - порядковый номер записи, страницы идут от новых к старым
+"""
+
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+
+def parse_time(value):
+    """Время записи/параметра: ISO-строка, 'YYYY-MM-DD HH:MM:SS' или epoch -> epoch (float) или None"""
+    if value in (None, ''):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+
+class ActivityStore:
+    def __init__(self, max_entries=50000):
+        self.max_entries = max_entries
+        self._entries = []  # записи по возрастанию seq
+        self._times = []  # epoch записей (неубывающие) - для диапазонов времени
+        self._by_type = {}  # {type: [seq, ...]} по возрастанию
+        self._base = 0  # seq первой записи в _entries
+        self._next_seq = 0
+        self._loaded = False
+        self._during_load = None  # записи, пришедшие во время загрузки листа
+        self._lock = threading.RLock()
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    # --- Пополнение ---
+    def _add(self, entry):
+        seq = self._next_seq
+        self._next_seq += 1
+        ts = parse_time(entry.get('time'))
+        last = self._times[-1] if self._times else 0.0
+        # Записи без времени или с временем "из прошлого" не ломают порядок
+        self._times.append(last if ts is None or ts < last else ts)
+        self._entries.append(dict(entry, seq=seq))
+        self._by_type.setdefault(entry.get('type') or '', []).append(seq)
+
+    def _trim(self):
+        extra = len(self._entries) - self.max_entries
+        if extra <= 0:
+            return
+        del self._entries[:extra]
+        del self._times[:extra]
+        self._base += extra
+        for event_type, seqs in list(self._by_type.items()):
+            del seqs[:bisect_left(seqs, self._base)]
+            if not seqs:
+                del self._by_type[event_type]
+
+    def append(self, entry):
+        """Новая запись (dict: type, user_id, username, details, guild_id, guild_name, time)"""
+        with self._lock:
+            if self._during_load is not None:
+                self._during_load.append(entry)
+            self._add(entry)
+            self._trim()
+
+    def load(self, read_entries):
+        """
+        Заменить журнал записями из источника: read_entries() -> [entry] от старых к новым.
+        Записи, добавленные во время чтения, сохраняются.
+        """
+        with self._lock:
+            self._during_load = []
+        try:
+            entries = read_entries()
+        except Exception:
+            with self._lock:
+                self._during_load = None
+            raise
+        with self._lock:
+            pending, self._during_load = self._during_load, None
+            self._entries, self._times, self._by_type = [], [], {}
+            self._base = self._next_seq
+            for entry in entries + pending:
+                self._add(entry)
+            self._trim()
+            self._loaded = True
+        return len(self._entries)
+
+    def mark_loaded(self):
+        with self._lock:
+            self._loaded = True
+
+    # --- Выборка ---
+    def _seq_range(self, since, until):
+        """[first, last) по seq для диапазона времени"""
+        first = self._base + (bisect_left(self._times, since) if since is not None else 0)
+        last = self._base + (bisect_right(self._times, until) if until is not None else len(self._times))
+        return first, last
+
+    def _type_slices(self, types, first, last):
+        for event_type in types:
+            seqs = self._by_type.get(event_type, [])
+            yield event_type, seqs, bisect_left(seqs, first), bisect_left(seqs, last)
+
+    def query(self, types=None, since=None, until=None, cursor=None, limit=100):
+        """
+        Записи от новых к старым: (entries, next_cursor).
+        types - список типов (None - все), since/until - epoch, cursor - seq последней полученной записи.
+        """
+        with self._lock:
+            first, last = self._seq_range(since, until)
+            if cursor is not None:
+                last = min(last, int(cursor))
+            if types is None:
+                start = max(first, last - limit)
+                seqs = range(last - 1, start - 1, -1)
+                has_more = start > first
+            else:
+                candidates = []
+                for _, type_seqs, lo, hi in self._type_slices(types, first, last):
+                    # С каждого типа достаточно limit+1 самых новых
+                    candidates.extend(type_seqs[max(lo, hi - limit - 1):hi])
+                candidates.sort(reverse=True)
+                seqs = candidates[:limit]
+                has_more = len(candidates) > limit
+            page = [self._entries[seq - self._base] for seq in seqs]
+            next_cursor = str(page[-1]['seq']) if page and has_more else None
+            return page, next_cursor
+
+    def count(self, types=None, since=None, until=None):
+        """(всего, {type: количество}) без выборки записей"""
+        with self._lock:
+            first, last = self._seq_range(since, until)
+            types = list(self._by_type) if types is None else types
+            by_type = {}
+            for event_type, _, lo, hi in self._type_slices(types, first, last):
+                if hi > lo:
+                    by_type[event_type] = hi - lo
+            return sum(by_type.values()), by_type
+
+    def stats(self):
+        with self._lock:
+            return {
+                'loaded': self._loaded,
+                'entries': len(self._entries),
+                'types': len(self._by_type)
+            }
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Асинхронный HTTP-сервер API в event loop бота (aiohttp)
+- Async-обработчики из реестра вызываются напрямую через await
+- Остальные маршруты Flask обслуживаются через WSGI в пуле потоков
+- Проверка авторизации та же, что у require_auth
+- Поток событий (SSE) без выделения потока на клиента
+"""
+
+import asyncio
+import re
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+from event_bus import AsyncSubscription, EventBus, parse_last_event_id
+from http_encoding import dumps_bytes
+
+# Заголовки, которые aiohttp выставляет сам
+HOP_BY_HOP_HEADERS = {'content-length', 'transfer-encoding', 'connection', 'keep-alive'}
+
+
+def aiohttp_rule(rule):
+    """'/api/guilds/<guild_id>/x/<path:p>' -> '/api/guilds/{guild_id}/x/{p:.*}'"""
+    rule = re.sub(r'<path:([a-zA-Z_]\w*)>', r'{\1:.*}', rule)
+    return re.sub(r'<(?:[a-z]+:)?([a-zA-Z_]\w*)>', r'{\1}', rule)
+
+
+def json_response(payload, status=200):
+    return web.Response(
+        status=status,
+        body=dumps_bytes(payload),
+        content_type='application/json',
+        charset='utf-8'
+    )
+
+
+class AsyncApiServer:
+    """
+    aiohttp-приложение поверх реестра маршрутов.
+    routes: [(rule, methods, handler)], handler(data, **params) -> (payload, status)
+    """
+
+    def __init__(self, routes, is_authorized, wsgi_app=None, host='0.0.0.0', port=5000, wsgi_threads=4,
+                 event_bus=None, sse_path='/api/events/stream', sse_heartbeat=15, compress_min_size=1024,
+                 stream_tickets=None):
+        self.routes = routes
+        self.is_authorized = is_authorized
+        self.wsgi_app = wsgi_app
+        self.event_bus = event_bus
+        self.sse_path = sse_path
+        self.sse_heartbeat = sse_heartbeat
+        self.stream_tickets = stream_tickets
+        self.compress_min_size = compress_min_size
+        self.host = host
+        self.port = port
+        self._executor = ThreadPoolExecutor(max_workers=wsgi_threads, thread_name_prefix='wsgi') if wsgi_app else None
+        self._runner = None
+
+    # --- Приложение ---
+    def build(self):
+        app = web.Application()
+        preflight = set()
+        for rule, methods, handler in self.routes:
+            path = aiohttp_rule(rule)
+            for method in methods:
+                app.router.add_route(method, path, self._wrap(handler))
+            if path not in preflight:
+                preflight.add(path)
+                app.router.add_route('OPTIONS', path, self._preflight)
+        if self.event_bus is not None:
+            app.router.add_route('GET', self.sse_path, self._sse)
+        if self.wsgi_app is not None:
+            # Всё, что не перенесено в реестр (страницы, статика, чтение) - через Flask
+            app.router.add_route('*', '/{tail:.*}', self._wsgi)
+        app.middlewares.append(self._cors)
+        app.middlewares.append(self._compress)
+        return app
+
+    def _wrap(self, handler):
+        async def view(request):
+            if not self.is_authorized(request.headers.get('Authorization')):
+                return json_response({"error": "Unauthorized"}, 401)
+            data = dict(request.query)
+            if request.can_read_body:
+                try:
+                    body = await request.json()
+                except ValueError:
+                    body = None
+                if isinstance(body, dict):
+                    data.update(body)
+            try:
+                payload, status = await handler(data, **request.match_info)
+            except Exception as e:
+                print(f"❌ {handler.__name__}: {e}")
+                traceback.print_exc()
+                return json_response({"error": str(e)}, 500)
+            return json_response(payload, status)
+        view.__name__ = handler.__name__
+        return view
+
+    # --- Поток событий ---
+    async def _sse(self, request):
+        ticket = request.query.get('ticket')
+        if not (self.is_authorized(request.headers.get('Authorization'))
+                or (self.stream_tickets is not None and self.stream_tickets.valid(ticket))):
+            return json_response({"error": "Unauthorized"}, 401)
+
+        last_event_id = parse_last_event_id(request.headers.get('Last-Event-ID') or request.query.get('last_event_id'))
+        subscription = AsyncSubscription(asyncio.get_running_loop(), request.query.get('guild_id'))
+        self.event_bus.subscribe(subscription, last_event_id)
+
+        response = web.StreamResponse(headers={
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+            'Access-Control-Allow-Origin': '*'
+        })
+        try:
+            await response.prepare(request)
+            await response.write(b"retry: 3000\n\n")
+            while True:
+                if subscription.overflowed:
+                    await response.write(EventBus.format_sse(self.event_bus.resync_event()).encode('utf-8'))
+                    break
+                event = await subscription.get(self.sse_heartbeat)
+                chunk = EventBus.format_sse(event) if event else ": ping\n\n"
+                await response.write(chunk.encode('utf-8'))
+        except ConnectionResetError:
+            pass
+        finally:
+            self.event_bus.unsubscribe(subscription)
+        return response
+
+    async def _preflight(self, request):
+        return web.Response(status=200)
+
+    @web.middleware
+    async def _cors(self, request, handler):
+        response = await handler(request)
+        # Ответы Flask уже содержат CORS-заголовки от flask_cors
+        if 'Access-Control-Allow-Origin' not in response.headers:
+            response.headers['Access-Control-Allow-Origin'] = '*'
+            response.headers['Access-Control-Allow-Headers'] = 'Authorization, Content-Type'
+            response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
+        return response
+
+    @web.middleware
+    async def _compress(self, request, handler):
+        response = await handler(request)
+        # Ответы Flask через WSGI-мост уже сжаты в after_request; поток событий не трогаем
+        if (type(response) is web.Response and response.body is not None
+                and 'Content-Encoding' not in response.headers
+                and len(response.body) >= self.compress_min_size):
+            response.enable_compression()
+        return response
+
+    # --- WSGI-мост для остальных маршрутов ---
+    async def _wsgi(self, request):
+        body = await request.read()
+        builder = EnvironBuilder(
+            path=request.path,
+            method=request.method,
+            headers=list(request.headers.items()),
+            data=body,
+            query_string=request.query_string
+        )
+        try:
+            environ = builder.get_environ()
+        finally:
+            builder.close()
+        if request.remote:
+            environ['REMOTE_ADDR'] = request.remote
+
+        def call():
+            app_iter, status, headers = run_wsgi_app(self.wsgi_app, environ, buffered=True)
+            try:
+                return status, headers, b''.join(app_iter)
+            finally:
+                if hasattr(app_iter, 'close'):
+                    app_iter.close()
+
+        loop = asyncio.get_running_loop()
+        status, headers, content = await loop.run_in_executor(self._executor, call)
+        return web.Response(
+            status=int(status.split(' ', 1)[0]),
+            body=content,
+            headers=[(name, value) for name, value in headers.items() if name.lower() not in HOP_BY_HOP_HEADERS]
+        )
+
+    # --- Запуск / остановка ---
+    async def start(self):
+        self._runner = web.AppRunner(self.build())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        print(f"✅ Async API запущен на {self.host}:{self.port} ({len(self.routes)} async-маршрутов)")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
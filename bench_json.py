@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк сериализации и сжатия ответов API
+Синтетические данные в формате /full и /activity: время json / orjson и размер до/после сжатия.
+
+    python bench_json.py --members 5000 --activity 10000
+    python bench_json.py --url http://localhost:5000 --pin 123456 --guild 1234567890
+"""
+
+import argparse
+import gzip
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from http_encoding import brotli, dumps_bytes, json_backend, orjson
+
+STATUSES = ['online', 'idle', 'dnd', 'offline']
+ACTIVITY_TYPES = ['message', 'member_join', 'member_leave', 'role_add', 'role_remove', 'ai_response']
+
+
+def fake_full(members, roles=40, channels=60):
+    rnd = random.Random(1)
+    role_ids = [str(rnd.randrange(10 ** 17, 10 ** 18)) for _ in range(roles)]
+    return {
+        "guild": {"id": "1", "name": "Бенчмарк", "icon": None, "member_count": members},
+        "members": [{
+            "id": str(rnd.randrange(10 ** 17, 10 ** 18)),
+            "username": f"user_{i}",
+            "discriminator": "0",
+            "nick": f"Участник {i}" if i % 3 == 0 else None,
+            "avatar": f"https://cdn.discordapp.com/avatars/{i}/{rnd.getrandbits(64):x}.png",
+            "bot": i % 50 == 0,
+            "roles": rnd.sample(role_ids, rnd.randint(0, 4)),
+            "status": rnd.choice(STATUSES),
+            "joined_at": (datetime(2023, 1, 1) + timedelta(minutes=i)).isoformat()
+        } for i in range(members)],
+        "channels": [{"id": str(i), "name": f"канал-{i}", "type": 0, "position": i,
+                      "topic": None, "category_id": None} for i in range(channels)],
+        "roles": [{"id": r, "name": f"Роль {i}", "color": 0, "position": i, "members": 0}
+                  for i, r in enumerate(role_ids)]
+    }
+
+
+def fake_activity(count):
+    rnd = random.Random(2)
+    start = datetime(2024, 1, 1)
+    return [{
+        "type": rnd.choice(ACTIVITY_TYPES),
+        "user_id": str(rnd.randrange(10 ** 17, 10 ** 18)),
+        "username": f"user_{rnd.randrange(2000)}",
+        "details": "Отправил сообщение в #общий",
+        "timestamp": (start + timedelta(seconds=i * 37)).strftime('%Y-%m-%d %H:%M:%S'),
+        "icon": "💬",
+        "color": "#5865F2"
+    } for i in range(count)]
+
+
+def timed(func, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_payload(name, payload, repeat):
+    print(f"\n=== {name} ===")
+    # Flask по умолчанию: json.dumps(ensure_ascii=True, sort_keys=True)
+    t_std, body_std = timed(lambda: json.dumps(payload, sort_keys=True).encode('utf-8'), repeat)
+    print(f"  json (по умолчанию Flask): {t_std * 1000:8.1f} мс  {len(body_std) / 1024:9.1f} КБ")
+    t_fast, body = timed(lambda: dumps_bytes(payload), repeat)
+    print(f"  {json_backend():<25} {t_fast * 1000:8.1f} мс  {len(body) / 1024:9.1f} КБ  (x{t_std / t_fast:.1f})")
+
+    t_gz, gz = timed(lambda: gzip.compress(body, compresslevel=6, mtime=0), repeat)
+    print(f"  gzip -6:                   {t_gz * 1000:8.1f} мс  {len(gz) / 1024:9.1f} КБ  ({len(gz) / len(body):.0%})")
+    if brotli:
+        t_br, br = timed(lambda: brotli.compress(body, quality=5), repeat)
+        print(f"  brotli q5:                 {t_br * 1000:8.1f} мс  {len(br) / 1024:9.1f} КБ  ({len(br) / len(body):.0%})")
+
+
+def bench_url(args):
+    import requests
+
+    headers = {'Authorization': f'Bearer {args.pin}'}
+    paths = [f'/api/guilds/{args.guild}/full', '/api/activity?limit=10000']
+    if args.guild:
+        paths.append(f'/api/activity-stats?guild_id={args.guild}')
+    for path in paths:
+        print(f"\n=== {path} ===")
+        for encoding in ('identity', 'gzip', 'br'):
+            started = time.perf_counter()
+            response = requests.get(args.url.rstrip('/') + path, timeout=60, stream=True,
+                                    headers={**headers, 'Accept-Encoding': encoding})
+            raw = response.raw.read(decode_content=False)
+            elapsed = time.perf_counter() - started
+            print(f"  {encoding:<9} {response.status_code}  {elapsed * 1000:8.1f} мс  "
+                  f"{len(raw) / 1024:9.1f} КБ  Content-Encoding={response.headers.get('Content-Encoding', '-')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк JSON и сжатия ответов API")
+    parser.add_argument('--members', type=int, default=5000, help="участников в синтетическом /full")
+    parser.add_argument('--activity', type=int, default=10000, help="записей в синтетическом /activity")
+    parser.add_argument('--repeat', type=int, default=5, help="повторов (берётся лучшее время)")
+    parser.add_argument('--url', help="измерить живой сервер вместо синтетики")
+    parser.add_argument('--pin', default='')
+    parser.add_argument('--guild', default='')
+    args = parser.parse_args()
+
+    print(f"JSON: {json_backend()}  brotli: {'да' if brotli else 'нет'}  orjson: {'да' if orjson else 'нет'}")
+    if args.url:
+        bench_url(args)
+        return
+    bench_payload(f"/full ({args.members} участников)", fake_full(args.members), args.repeat)
+    bench_payload(f"/activity ({args.activity} записей)", fake_activity(args.activity), args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,20 @@
 
 from datetime import datetime, timedelta
 
+from messages_schema import parse_sent_by, parse_timestamp
+
+
+def _is_message_from(record, user_id=None, username=None):
+    """Сообщение (строка Messages) от пользователя: по User ID - равенство, по имени - точное совпадение"""
+    record_user_id = str(record.get('User ID', '')).strip() or parse_sent_by(record.get('Sent By'))
+    if user_id:
+        return record_user_id == str(user_id)
+    if username:
+        # "Username (ID)" -> Username
+        sent_by = str(record.get('Sent By', '')).rsplit(' (', 1)[0].strip()
+        return sent_by.lower() == username.lower()
+    return False
+
 
 def get_user_messages_count(sheets_client, guild_id, user_id=None, username=None):
     """Получить общее количество сообщений пользователя"""
@@ -20,13 +34,8 @@ def get_user_messages_count(sheets_client, guild_id, user_id=None, username=None
             if str(r.get('Guild ID')) != str(guild_id):
                 continue
             
-            sent_by = str(r.get('Sent By', ''))
-            
-            # Поиск по ID (приоритет)
-            if user_id and str(user_id) in sent_by:
-                count += 1
-            # Поиск по username (fallback)
-            elif username and username.lower() in sent_by.lower():
+            # Поиск по ID (приоритет), иначе по username
+            if _is_message_from(r, user_id, username):
                 count += 1
         
         return {'total_messages': count}
@@ -79,6 +88,7 @@ def get_weekly_activity(sheets_client, guild_id, user_id=None, username=None):
         
         # Дата 7 дней назад
         week_ago = datetime.now() - timedelta(days=7)
+        week_ago_epoch = week_ago.timestamp()
         
         messages_sheet = sheets_client.worksheet('Messages')
         records = messages_sheet.get_all_records(expected_headers=[])
@@ -90,26 +100,18 @@ def get_weekly_activity(sheets_client, guild_id, user_id=None, username=None):
             if str(r.get('Guild ID')) != str(guild_id):
                 continue
             
-            # Проверяем дату
-            timestamp = r.get('Timestamp', '')
-            try:
-                msg_date = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
-                if msg_date < week_ago:
-                    continue
-            except:
-                continue
-            
-            sent_by = str(r.get('Sent By', ''))
-            
             # Проверяем пользователя
-            is_user = False
-            if user_id and str(user_id) in sent_by:
-                is_user = True
-            elif username and username.lower() in sent_by.lower():
-                is_user = True
+            if not _is_message_from(r, user_id, username):
+                continue
             
-            if is_user:
-                weekly_messages += 1
+            # Проверяем дату (Epoch; у строк до миграции - Timestamp)
+            try:
+                epoch = int(float(r.get('Epoch')))
+            except (TypeError, ValueError, OverflowError):  # пусто, текст, 'nan' / 'inf' - разбор Timestamp
+                epoch = parse_timestamp(r.get('Timestamp', ''))
+            if epoch is None or epoch < week_ago_epoch:
+                continue
+            weekly_messages += 1
         
         # Реакции за неделю (из Activity)
         try:
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Массовая рассылка личных сообщений
+- Содержимое готовится один раз, отправка - ограниченным числом параллельных воркеров
+- 429: все воркеры ждут Retry-After (общая пауза), затем повтор
+- 5xx и сетевые ошибки - повтор с backoff; закрытые ЛС - сразу ошибка
+- Результат по каждому получателю отдаётся по мере готовности
+"""
+
+import asyncio
+import time
+
+import discord
+
+
+def dedupe(ids):
+    """Уникальные id в исходном порядке"""
+    seen = set()
+    unique = []
+    for value in ids:
+        key = str(value).strip()
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(key)
+    return unique
+
+
+def retry_after_of(error, default=1.0):
+    """Retry-After из ответа Discord (сек)"""
+    retry_after = getattr(error, 'retry_after', None)
+    if retry_after is None and getattr(error, 'response', None) is not None:
+        retry_after = error.response.headers.get('Retry-After')
+    try:
+        return max(float(retry_after), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+class DmBroadcaster:
+    def __init__(self, concurrency=5, max_retries=3, backoff=1.0):
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._resume_at = 0.0  # общая пауза после 429 (time.monotonic)
+
+    async def _wait_pause(self):
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _send_one(self, recipient, send):
+        attempts = 0
+        while True:
+            attempts += 1
+            await self._wait_pause()
+            try:
+                await send(recipient)
+                return {"status": "sent", "attempts": attempts}
+            except discord.Forbidden:
+                return {"status": "failed", "error": "закрыты ЛС", "attempts": attempts}
+            except discord.HTTPException as e:
+                if attempts > self.max_retries:
+                    return {"status": "failed", "error": str(e)[:100], "attempts": attempts}
+                if e.status == 429:
+                    delay = retry_after_of(e)
+                    self._resume_at = max(self._resume_at, time.monotonic() + delay)
+                elif e.status >= 500:
+                    await asyncio.sleep(self.backoff * 2 ** (attempts - 1))
+                else:
+                    return {"status": "failed", "error": str(e)[:100], "attempts": attempts}
+            except (OSError, asyncio.TimeoutError) as e:
+                if attempts > self.max_retries:
+                    return {"status": "failed", "error": str(e)[:100] or type(e).__name__, "attempts": attempts}
+                await asyncio.sleep(self.backoff * 2 ** (attempts - 1))
+
+    async def run(self, recipients, send, on_result):
+        """
+        recipients - [(user_id, получатель)], send(получатель) - корутина отправки,
+        on_result(user_id, outcome) - вызывается для каждого получателя по мере готовности.
+        """
+        queue = asyncio.Queue()
+        for item in recipients:
+            queue.put_nowait(item)
+
+        async def worker():
+            while True:
+                try:
+                    user_id, recipient = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                on_result(user_id, await self._send_one(recipient, send))
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(recipients)) or 1)))
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Индекс кастомных эмодзи сервера
+- :name: -> <:name:id> по словарю (имя в нижнем регистре), без перебора guild.emojis
+- Индекс пересобирается, только когда меняется версия эмодзи сервера
+"""
+
+import re
+import threading
+
+EMOJI_PATTERN = re.compile(r':([a-zA-Z0-9_]+):')
+
+
+class EmojiIndex:
+    def __init__(self, emojis):
+        self.by_name = {}  # {имя в нижнем регистре: '<:name:id>'} - первый эмодзи с таким именем
+        self.items = []  # для /api/guilds/<id>/emojis
+        for emoji in emojis:
+            formatted = str(emoji)
+            self.by_name.setdefault(emoji.name.lower(), formatted)
+            self.items.append({
+                'id': str(emoji.id),
+                'name': emoji.name,
+                'animated': emoji.animated,
+                'url': str(emoji.url),
+                'format': formatted
+            })
+
+    def __len__(self):
+        return len(self.items)
+
+    def replace(self, text):
+        """Заменить :name: на эмодзи сервера; неизвестные имена остаются как есть"""
+        if not self.by_name or ':' not in text:
+            return text
+        return EMOJI_PATTERN.sub(lambda m: self.by_name.get(m.group(1).lower(), m.group(0)), text)
+
+
+class EmojiIndexCache:
+    """Индексы по серверам; version(guild_id) определяет, актуален ли индекс"""
+
+    def __init__(self, version):
+        self._version = version
+        self._indexes = {}  # {guild_id: (version, EmojiIndex)}
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def get(self, guild):
+        version = self._version(guild.id)
+        with self._lock:
+            cached = self._indexes.get(guild.id)
+            if cached and cached[0] == version:
+                return cached[1]
+        index = EmojiIndex(guild.emojis)
+        with self._lock:
+            self._indexes[guild.id] = (version, index)
+            self.builds += 1
+        return index
+
+    def stats(self):
+        with self._lock:
+            return {
+                'guilds': len(self._indexes),
+                'emojis': sum(len(index) for _, index in self._indexes.values()),
+                'builds': self.builds
+            }
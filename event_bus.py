@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Шина событий для панели (Server-Sent Events)
+- События публикуются из обработчиков бота (любой поток)
+- Подписчики получают только события своего сервера
+- Кольцевой буфер: при переподключении клиент догоняет по Last-Event-ID
+- EventSource не передаёт заголовки: вместо PIN в URL - короткоживущий билет (StreamTickets)
+"""
+
+import asyncio
+import json
+import queue
+import secrets
+import threading
+import time
+from collections import deque
+
+
+class Subscription:
+    """Подписчик из потока WSGI (блокирующее ожидание)"""
+
+    def __init__(self, guild_id=None, maxsize=500):
+        self.guild_id = str(guild_id) if guild_id else None
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def matches(self, event):
+        return self.guild_id is None or event['guild_id'] is None or event['guild_id'] == self.guild_id
+
+    def push(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # Клиент не успевает - он получит resync и перезагрузит снимок
+            self.overflowed = True
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class AsyncSubscription(Subscription):
+    """Подписчик из event loop (aiohttp)"""
+
+    def __init__(self, loop, guild_id=None, maxsize=500):
+        super().__init__(guild_id, maxsize)
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def push(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventBus:
+    def __init__(self, history=1000):
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._history = deque(maxlen=history)
+        self._subscribers = set()
+        self.published = 0
+
+    def publish(self, event_type, guild_id=None, data=None):
+        """Опубликовать событие {id, type, guild_id, data, ts}"""
+        with self._lock:
+            event = {
+                'id': self._next_id,
+                'type': event_type,
+                'guild_id': str(guild_id) if guild_id else None,
+                'data': data,
+                'ts': time.time()
+            }
+            self._next_id += 1
+            self.published += 1
+            self._history.append(event)
+            subscribers = [s for s in self._subscribers if s.matches(event)]
+        for subscriber in subscribers:
+            subscriber.push(event)
+        return event
+
+    def subscribe(self, subscription, last_event_id=None):
+        """
+        Зарегистрировать подписчика. Если передан last_event_id - отдаём пропущенные
+        события из буфера, а если буфер их уже не содержит - событие resync.
+        """
+        with self._lock:
+            if last_event_id is not None:
+                missed = [e for e in self._history if e['id'] > last_event_id and subscription.matches(e)]
+                oldest = self._history[0]['id'] if self._history else self._next_id
+                if last_event_id + 1 < oldest:
+                    subscription.push(self._resync_event())
+                for event in missed:
+                    subscription.push(event)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def _resync_event(self):
+        return {'id': self._next_id - 1, 'type': 'resync', 'guild_id': None, 'data': None, 'ts': time.time()}
+
+    def resync_event(self):
+        with self._lock:
+            return self._resync_event()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'published': self.published,
+                'last_event_id': self._next_id - 1,
+                'buffered': len(self._history)
+            }
+
+    @staticmethod
+    def format_sse(event):
+        return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+class StreamTickets:
+    """
+    Билеты для подключения к потоку событий: выдаются по Authorization, живут ttl секунд.
+    В логи доступа попадает билет, а не PIN; в пределах ttl билет переиспользуется
+    автоматическими переподключениями EventSource.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._tickets = {}  # {ticket: expires_at (time.monotonic)}
+        self._lock = threading.Lock()
+
+    def issue(self):
+        now = time.monotonic()
+        ticket = secrets.token_urlsafe(24)
+        with self._lock:
+            for expired in [t for t, expires_at in self._tickets.items() if expires_at <= now]:
+                del self._tickets[expired]
+            self._tickets[ticket] = now + self.ttl
+        return ticket
+
+    def valid(self, ticket):
+        if not ticket:
+            return False
+        with self._lock:
+            expires_at = self._tickets.get(ticket)
+        return expires_at is not None and expires_at > time.monotonic()
+
+
+def parse_last_event_id(value):
+    try:
+        return int(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Версии данных серверов и кеш сериализованных ответов
+- У каждого сервера монотонные версии по разделам (guild, members, roles, channels)
+- События бота увеличивают версию нужных разделов
+- Ответ эндпоинта кешируется по набору версий; ETag строится из них же
+"""
+
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+
+class GuildSnapshotCache:
+    SECTIONS = ('guild', 'members', 'roles', 'channels')
+
+    def __init__(self, max_bodies=256):
+        # Эпоха процесса: после перезапуска версии начинаются заново, ETag не должен совпасть со старым
+        self.epoch = format(int(time.time()), 'x')
+        self._versions = {}  # {(guild_id, section): int}
+        self._generation = 0  # растёт при полной пересборке (bump_all)
+        self._bodies = OrderedDict()  # {(guild_id, name, query): (versions, etag, body)} - LRU
+        self.max_bodies = max_bodies
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def bump(self, guild_id, *sections):
+        """Данные изменились: увеличить версию разделов (по умолчанию - всех)"""
+        guild_id = str(guild_id)
+        with self._lock:
+            for section in sections or self.SECTIONS:
+                key = (guild_id, section)
+                self._versions[key] = self._versions.get(key, 0) + 1
+
+    def bump_all(self):
+        """Полная пересборка кеша гильдий (новая сессия Discord)"""
+        with self._lock:
+            self._generation += 1
+            self._bodies.clear()
+
+    def _versions_of(self, guild_id, sections):
+        return (self._generation,) + tuple(self._versions.get((guild_id, s), 0) for s in sections)
+
+    def versions(self, guild_id, sections):
+        with self._lock:
+            return self._versions_of(str(guild_id), sections)
+
+    def etag(self, guild_id, name, sections, query=''):
+        versions = self.versions(guild_id, sections)
+        return self._etag(guild_id, name, versions, query)
+
+    def _etag(self, guild_id, name, versions, query):
+        tag = f"{self.epoch}-{guild_id}-{name}-{'.'.join(map(str, versions))}"
+        if query:
+            tag += f"-{format(zlib.crc32(query.encode('utf-8')), 'x')}"
+        return tag
+
+    def get_or_build(self, guild_id, name, sections, build, query=''):
+        """
+        (etag, body) для текущих версий разделов. build() -> bytes вызывается,
+        только если данные изменились с прошлого запроса.
+        """
+        guild_id = str(guild_id)
+        key = (guild_id, name, query)
+        versions = self.versions(guild_id, sections)
+        with self._lock:
+            cached = self._bodies.get(key)
+            if cached and cached[0] == versions:
+                self._bodies.move_to_end(key)
+                self.hits += 1
+                return cached[1], cached[2]
+            self.misses += 1
+
+        body = build()
+        etag = self._etag(guild_id, name, versions, query)
+        with self._lock:
+            # Пока собирали, версия могла вырасти - тогда не кешируем устаревшее тело
+            if self._versions_of(guild_id, sections) == versions:
+                self._bodies[key] = (versions, etag, body)
+                self._bodies.move_to_end(key)
+                while len(self._bodies) > self.max_bodies:
+                    self._bodies.popitem(last=False)
+        return etag, body
+
+    def stats(self):
+        with self._lock:
+            return {
+                'guilds': len({g for g, _ in self._versions}),
+                'cached_bodies': len(self._bodies),
+                'hits': self.hits,
+                'misses': self.misses
+            }
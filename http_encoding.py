@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Сериализация и сжатие ответов API
+- JSON через orjson, если установлен (иначе стандартный json Flask)
+- gzip / brotli для текстовых ответов больше порога
+- Сжатые тела ответов с ETag кешируются: одинаковый снимок не сжимается повторно
+"""
+
+import gzip
+import json
+import threading
+from collections import OrderedDict
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'text/html', 'text/css', 'text/plain',
+    'application/javascript', 'text/javascript', 'image/svg+xml'
+}
+
+
+def json_backend():
+    return 'orjson' if orjson else 'json'
+
+
+def dumps_bytes(obj):
+    """JSON -> bytes (UTF-8) тем же кодировщиком, что и у Flask"""
+    if orjson:
+        # Даты - через default Flask, чтобы формат совпадал со стандартным провайдером
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        return orjson.dumps(obj, default=DefaultJSONProvider.default, option=options)
+    return json.dumps(obj, ensure_ascii=False, default=DefaultJSONProvider.default).encode('utf-8')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON-провайдер Flask на orjson (без сортировки ключей); без orjson - стандартный"""
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
+
+
+def choose_encoding(accept_encoding):
+    """Лучшая поддерживаемая кодировка из Accept-Encoding (br > gzip) или None"""
+    if brotli and accept_encoding['br']:
+        return 'br'
+    if accept_encoding['gzip']:
+        return 'gzip'
+    return None
+
+
+class ResponseCompressor:
+    """after_request: сжатие текстовых ответов от min_size байт"""
+
+    def __init__(self, min_size=1024, gzip_level=6, brotli_quality=5, cache_size=64):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # {(etag, encoding): bytes} - LRU
+        self._lock = threading.Lock()
+        self.compressed = 0
+        self.cache_hits = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def encodings(self):
+        return ['br', 'gzip'] if brotli else ['gzip']
+
+    def _compress(self, body, encoding):
+        if encoding == 'br':
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    def __call__(self, response, request):
+        response.vary.add('Accept-Encoding')
+        if (response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code in (204, 304)
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+        body = response.get_data()
+        if len(body) < self.min_size:
+            return response
+
+        etag, weak = response.get_etag()
+        key = (etag, encoding) if etag and not weak else None
+        with self._lock:
+            compressed = self._cache.get(key) if key else None
+            if compressed is not None:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+        if compressed is None:
+            compressed = self._compress(body, encoding)
+            if key:
+                with self._lock:
+                    self._cache[key] = compressed
+                    while len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+
+        with self._lock:
+            self.compressed += 1
+            self.bytes_in += len(body)
+            self.bytes_out += len(compressed)
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        if etag:
+            # Сжатое тело отличается побайтно: ETag становится слабым, If-None-Match по-прежнему совпадает
+            response.set_etag(etag, weak=True)
+        return response
+
+    def stats(self):
+        with self._lock:
+            return {
+                'json': json_backend(),
+                'encodings': self.encodings(),
+                'min_size': self.min_size,
+                'compressed': self.compressed,
+                'cache_hits': self.cache_hits,
+                'ratio': round(self.bytes_out / self.bytes_in, 3) if self.bytes_in else None
+            }
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Конвейер обработки входящих событий (on_message)
+- Обработчик события только ставит элемент в очередь этапа - O(1)
+- Каждый этап - свои ограниченные очереди и свои воркеры; этап может получать элементы пачками
+- Этап с key(item) раскладывает элементы по очередям воркеров (hash(key) % workers):
+  элементы с одним ключом (сообщения одного канала) обрабатываются по порядку
+- Переполнение: droppable-этапы (аналитика) теряют новые элементы, а при перегрузке
+  обязательных этапов перестают принимать их заранее; обязательные (модерация) не теряют
+  ничего - постановка ждёт места в очереди (backpressure). Ждущие постановки - задачи событий
+  в памяти: их число видно в waiting(), предел задаёт вызывающий код (см. on_message)
+- Метрики по этапам: глубина очереди, обработано, отброшено, ожидания, ошибки, задержка
+"""
+
+import asyncio
+import time
+import traceback
+
+
+class IngestStage:
+    def __init__(self, name, handler, maxsize, droppable, workers, batch_size, batch_delay, key=None):
+        self.name = name
+        self.handler = handler  # handler(item) или handler([item, ...]) при batch_size > 1
+        self.maxsize = maxsize
+        self.droppable = droppable
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay  # сек: сколько ждать добора пачки после первого элемента
+        self.key = key  # key(item) -> ключ порядка; None - одна общая очередь на всех воркеров
+        self.queues = []
+        self.submitted = 0
+        self.processed = 0
+        self.dropped = 0
+        self.blocked = 0  # постановок, ждавших места в очереди
+        self.waiting = 0  # ждут места прямо сейчас
+        self._waiting_on = {}  # {id(очереди): ждущих постановок} - новые встают за ними, а не вперёд
+        self._put_locks = {}  # {id(очереди): asyncio.Lock} - ждущие ставятся строго по очереди
+        self.max_waiting_seen = 0
+        self.rejected = 0  # не поставлены вызывающим кодом: аварийный предел (reject)
+        self.errors = 0
+        self.max_depth = 0
+        self._latency_total = 0.0
+
+    @property
+    def depth(self):
+        return sum(queue.qsize() for queue in self.queues)
+
+    def fill(self):
+        """Заполненность самой загруженной очереди (0..1)"""
+        return max((queue.qsize() / queue.maxsize for queue in self.queues), default=0)
+
+    def queue_for(self, item):
+        if len(self.queues) == 1:
+            return self.queues[0]
+        return self.queues[hash(self.key(item)) % len(self.queues)]
+
+    def to_dict(self):
+        return {
+            'depth': self.depth,
+            'maxsize': self.maxsize,
+            'max_depth': self.max_depth,
+            'droppable': self.droppable,
+            'workers': self.workers,
+            'submitted': self.submitted,
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'blocked': self.blocked,
+            'waiting': self.waiting,
+            'max_waiting_seen': self.max_waiting_seen,
+            'rejected': self.rejected,
+            'errors': self.errors,
+            'avg_latency_ms': round(self._latency_total * 1000 / self.processed, 1) if self.processed else None
+        }
+
+
+class IngestPipeline:
+    """
+    Реестр этапов. submit() вызывается из event loop бота; воркеры запускаются
+    при первой постановке (и заново, если сменился event loop).
+    """
+
+    def __init__(self, shed_ratio=0.5):
+        self.stages = {}
+        # droppable-этапы не принимают элементы, пока очередь обязательного этапа заполнена на shed_ratio
+        self.shed_ratio = shed_ratio
+        self._loop = None
+        self._tasks = []
+
+    def stage(self, name, maxsize=1000, droppable=False, workers=1, batch_size=1, batch_delay=0.0, key=None):
+        """
+        Декоратор: зарегистрировать этап конвейера.
+        key - порядок по ключу (у каждого воркера своя очередь, maxsize делится между ними).
+        """
+        def decorator(func):
+            self.stages[name] = IngestStage(name, func, maxsize, droppable, workers, batch_size, batch_delay, key)
+            return func
+        return decorator
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._tasks = []
+        for stage in self.stages.values():
+            if stage.key is None:
+                stage.queues = [asyncio.Queue(maxsize=stage.maxsize)]
+                queues = stage.queues * stage.workers
+            else:
+                per_worker = max(1, -(-stage.maxsize // stage.workers))
+                stage.queues = [asyncio.Queue(maxsize=per_worker) for _ in range(stage.workers)]
+                queues = stage.queues
+            stage._waiting_on = {id(queue): 0 for queue in stage.queues}
+            stage._put_locks = {id(queue): asyncio.Lock() for queue in stage.queues}
+            for queue in queues:
+                self._tasks.append(loop.create_task(self._worker(stage, queue)))
+
+    def overloaded(self):
+        """Обязательный этап не успевает - аналитику пора сбрасывать"""
+        return any(not s.droppable and (s.waiting or s.fill() >= self.shed_ratio) for s in self.stages.values())
+
+    def waiting(self, name):
+        """Сколько постановок этапа сейчас ждут места в очереди"""
+        return self.stages[name].waiting
+
+    def reject(self, name, reason):
+        """Элемент не поставлен в этап из-за аварийного предела вызывающего кода - это ошибка, не сброс"""
+        stage = self.stages[name]
+        stage.rejected += 1
+        if stage.rejected == 1 or stage.rejected % 1000 == 0:
+            print(f"❌ Конвейер: этап '{stage.name}' не принял элемент ({reason}), всего {stage.rejected}")
+
+    async def submit(self, name, item):
+        """Поставить элемент в очередь этапа; False - элемент отброшен (только droppable-этапы)"""
+        self._ensure_started()
+        stage = self.stages[name]
+        queue = stage.queue_for(item)
+        entry = (time.monotonic(), item)
+        if stage.droppable:
+            if queue.full() or self.overloaded():
+                stage.dropped += 1
+                return False
+            queue.put_nowait(entry)
+        elif queue.full() or stage._waiting_on.get(id(queue)):
+            stage.blocked += 1
+            stage.waiting += 1
+            stage._waiting_on[id(queue)] += 1
+            stage.max_waiting_seen = max(stage.max_waiting_seen, stage.waiting)
+            try:
+                # Освободившееся место достаётся первому ждущему, а не новому элементу того же ключа
+                async with stage._put_locks[id(queue)]:
+                    await queue.put(entry)
+            finally:
+                stage.waiting -= 1
+                stage._waiting_on[id(queue)] -= 1
+        else:
+            queue.put_nowait(entry)
+        stage.submitted += 1
+        stage.max_depth = max(stage.max_depth, stage.depth)
+        return True
+
+    async def _next_batch(self, stage, queue):
+        batch = [await queue.get()]
+        deadline = time.monotonic() + stage.batch_delay
+        while len(batch) < stage.batch_size:
+            try:
+                batch.append(queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _worker(self, stage, queue):
+        while True:
+            batch = await self._next_batch(stage, queue)
+            try:
+                if stage.batch_size > 1:
+                    await stage.handler([item for _, item in batch])
+                else:
+                    await stage.handler(batch[0][1])
+            except Exception as e:
+                stage.errors += 1
+                print(f"❌ Ошибка этапа '{stage.name}': {e}")
+                traceback.print_exc()
+            finally:
+                now = time.monotonic()
+                for queued_at, _ in batch:
+                    stage._latency_total += now - queued_at
+                    queue.task_done()
+                stage.processed += len(batch)
+
+    async def drain(self, timeout=10):
+        """
+        Дождаться обработки уже поставленных элементов (остановка бота).
+        Этапы - по порядку регистрации: то, что этап передал дальше, попадает в очередь следующего.
+        """
+        if self._loop is not asyncio.get_running_loop():
+            return
+
+        async def join_all():
+            for stage in self.stages.values():
+                for queue in stage.queues:
+                    await queue.join()
+
+        try:
+            await asyncio.wait_for(join_all(), timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ Конвейер: за {timeout}с обработано не всё ({', '.join(f'{s.name}={s.depth}' for s in self.stages.values())})")
+
+    def stats(self):
+        return {
+            'overloaded': self.overloaded(),
+            'stages': {name: stage.to_dict() for name, stage in self.stages.items()}
+        }
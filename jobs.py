@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Фоновые задачи панели (массовые операции)
+- POST сразу возвращает id задачи, работа идёт в event loop бота
+- Прогресс и частичные результаты доступны, пока задача выполняется
+- Отмена: задача прерывается на ближайшем await, уже сделанное сохраняется
+- Завершённые задачи хранятся ограниченное время
+"""
+
+import asyncio
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+
+FINISHED_STATES = ('done', 'failed', 'cancelled')
+
+
+class JobCancelled(Exception):
+    """Задача не может продолжаться после запроса отмены"""
+
+
+class Job:
+    def __init__(self, kind, guild_id=None, cancellable=True, params=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.guild_id = str(guild_id) if guild_id else None
+        self.cancellable = cancellable
+        self.params = params or {}
+        self.state = 'queued'
+        self.total = None
+        self.done = 0
+        self.results = []  # частичные результаты по элементам
+        self.result = None  # итог (то, что вернула функция задачи)
+        self.error = None
+        self.cancel_requested = False
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._task = None
+        self._on_progress = None
+        self._notified_at = 0.0
+
+    @property
+    def finished(self):
+        return self.state in FINISHED_STATES
+
+    def set_total(self, total):
+        self.total = total
+
+    def advance(self, item=None, count=1):
+        """Шаг выполнен: увеличить прогресс и (если есть) добавить частичный результат"""
+        self.done += count
+        if item is not None:
+            self.results.append(item)
+        if self._on_progress:
+            self._on_progress(self)
+
+    def check_cancelled(self):
+        """Для мест без await между шагами: прервать задачу, если запрошена отмена"""
+        if self.cancel_requested:
+            raise JobCancelled()
+
+    def to_dict(self, results_from=0):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'guild_id': self.guild_id,
+            'state': self.state,
+            'cancellable': self.cancellable,
+            'progress': {
+                'done': self.done,
+                'total': self.total,
+                'percent': round(self.done * 100 / self.total, 1) if self.total else None
+            },
+            'results': self.results[results_from:],
+            'results_total': len(self.results),
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+    def summary(self):
+        data = self.to_dict()
+        data.pop('results')
+        return data
+
+
+class JobManager:
+    """
+    Реестр фоновых задач. submit() вызывается из event loop бота;
+    get/cancel/list - из любого потока (обработчики Flask).
+    """
+
+    def __init__(self, max_concurrent=4, keep=200, ttl=3600, on_change=None, progress_interval=0.5):
+        self._jobs = OrderedDict()  # {id: Job}
+        self._lock = threading.Lock()
+        self._semaphore = None
+        self._loop = None
+        self.max_concurrent = max_concurrent
+        self.keep = keep
+        self.ttl = ttl
+        self.on_change = on_change  # on_change(job) - смена состояния / прогресса
+        self.progress_interval = progress_interval  # не чаще одного уведомления о прогрессе за интервал
+
+    def submit(self, kind, func, guild_id=None, cancellable=True, params=None):
+        """Запустить func(job) -> итог в текущем event loop; вернуть Job сразу"""
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        job = Job(kind, guild_id, cancellable, params)
+        job._on_progress = self._progress
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        job._task = loop.create_task(self._run(job, func))
+        self._notify(job)
+        return job
+
+    async def _run(self, job, func):
+        try:
+            async with self._semaphore:
+                if job.cancel_requested:
+                    raise asyncio.CancelledError()
+                job.state = 'running'
+                job.started_at = time.time()
+                self._notify(job)
+                job.result = await func(job)
+                job.state = 'done'
+        except (asyncio.CancelledError, JobCancelled):
+            job.state = 'cancelled'
+        except Exception as e:
+            job.state = 'failed'
+            job.error = str(e)
+            print(f"❌ Задача {job.kind} ({job.id}): {e}")
+            traceback.print_exc()
+        finally:
+            job.finished_at = time.time()
+            self._notify(job)
+
+    def _progress(self, job):
+        now = time.monotonic()
+        if now - job._notified_at >= self.progress_interval:
+            self._notify(job)
+
+    def _notify(self, job):
+        job._notified_at = time.monotonic()
+        if self.on_change:
+            try:
+                self.on_change(job)
+            except Exception as e:
+                print(f"⚠️ Ошибка уведомления о задаче {job.id}: {e}")
+
+    def _prune(self):
+        """Удалить старые завершённые задачи (по ttl и сверх лимита keep)"""
+        now = time.time()
+        for job_id in [j.id for j in self._jobs.values() if j.finished and now - j.finished_at > self.ttl]:
+            del self._jobs[job_id]
+        finished = [j.id for j in self._jobs.values() if j.finished]
+        for job_id in finished[:max(0, len(self._jobs) - self.keep)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self, guild_id=None):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [j for j in reversed(jobs) if guild_id is None or j.guild_id == str(guild_id)]
+
+    def cancel(self, job_id):
+        """Запросить отмену. None - задачи нет, False - задачу нельзя отменить"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        if not job.cancellable:
+            return False
+        if not job.finished:
+            job.cancel_requested = True
+            if job._task is not None:
+                job._task.get_loop().call_soon_threadsafe(job._task.cancel)
+        return True
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        states = {}
+        for job in jobs:
+            states[job.state] = states.get(job.state, 0) + 1
+        return {'jobs': len(jobs), 'states': states}
@@ -68,6 +68,11 @@ class API {
     async getGuilds() { return await this.request('/api/guilds'); }
     async getGuild(guildId) { return await this.request(`/api/guilds/${guildId}`); }
     async getMembers(guildId) { return await this.request(`/api/guilds/${guildId}/members`); }
+    async getMembersPage(guildId, params = {}) {
+        // params: cursor, limit, fields, role, status, q -> {members, next_cursor, total}
+        const query = new URLSearchParams(Object.entries(params).filter(([, v]) => v !== undefined && v !== null && v !== ''));
+        return await this.request(`/api/guilds/${guildId}/members?${query}`);
+    }
     async getChannels(guildId) { return await this.request(`/api/guilds/${guildId}/channels`); }
     async createChannel(guildId, data) { return await this.request(`/api/guilds/${guildId}/channels`, 'POST', data); }
     async deleteChannel(channelId) { return await this.request(`/api/channels/${channelId}`, 'DELETE'); }
@@ -75,12 +80,27 @@ class API {
     async deleteRole(roleId) { return await this.request(`/api/roles/${roleId}`, 'DELETE'); }
     async addRole(guildId, userId, roleId) { return await this.request(`/api/guilds/${guildId}/members/${userId}/roles/${roleId}`, 'PUT'); }
     async removeRole(guildId, userId, roleId) { return await this.request(`/api/guilds/${guildId}/members/${userId}/roles/${roleId}`, 'DELETE'); }
+    async bulkRoles(guildId, operations) {
+        // operations: [{user_id, role_id, action: 'add' | 'remove'}] -> {job_id}, прогресс - через waitForJob
+        return await this.request(`/api/guilds/${guildId}/roles/bulk`, 'POST', { operations });
+    }
     async sendMessage(channelId, data) { return await this.request(`/api/channels/${channelId}/messages`, 'POST', data); }
     async bulkDelete(channelId, limit) { return await this.request(`/api/channels/${channelId}/messages/bulk-delete`, 'POST', { limit }); }
     async muteUser(guildId, userId, duration, reason, logChannelId) { return await this.request(`/api/guilds/${guildId}/members/${userId}/timeout`, 'POST', { duration, reason, log_channel_id: logChannelId }); }
     async unmuteUser(guildId, userId) { return await this.request(`/api/guilds/${guildId}/members/${userId}/untimeout`, 'POST'); }
     async kickUser(guildId, userId, reason, logChannelId) { return await this.request(`/api/guilds/${guildId}/members/${userId}/kick`, 'POST', { reason, log_channel_id: logChannelId }); }
     async banUser(guildId, userId, reason, deleteMessageDays = 0, logChannelId) { return await this.request(`/api/guilds/${guildId}/members/${userId}/ban`, 'POST', { reason, delete_message_days: deleteMessageDays, log_channel_id: logChannelId }); }
+    async getSpamConfig(guildId) { return await this.request(`/api/guilds/${guildId}/spam-config`); }
+    async updateSpamConfig(guildId, config) {
+        // config: {threshold, window, activity_interval} (любое подмножество) или {reset: true}
+        return await this.request(`/api/guilds/${guildId}/spam-config`, 'POST', config);
+    }
+    async bulkModerate(guildId, action, userIds, { reason, duration, deleteMessageDays, logChannelId } = {}) {
+        // action: timeout | untimeout | kick | ban | unban -> {job_id}, итог - через waitForJob
+        return await this.request(`/api/guilds/${guildId}/moderation/bulk`, 'POST', {
+            action, user_ids: userIds, reason, duration, delete_message_days: deleteMessageDays, log_channel_id: logChannelId
+        });
+    }
     async unbanUser(guildId, userId) { return await this.request(`/api/guilds/${guildId}/bans/${userId}`, 'DELETE'); }
     async getPunishments(guildId) { return await this.request(`/api/guilds/${guildId}/punishments`); }
     async createReactionRole(guildId, data) { return await this.request(`/api/guilds/${guildId}/reaction-roles`, 'POST', data); }
@@ -92,6 +112,20 @@ class API {
     async getWelcomes(guildId) { return await this.request(`/api/guilds/${guildId}/welcomes`); }
     async deleteWelcome(messageId) { return await this.request(`/api/welcomes/${messageId}`, 'DELETE'); }
     async getActivity(type = 'all', limit = 100) { return await this.request(`/api/activity?type=${type}&limit=${limit}`); }
+    async getActivityPage(type = 'all', { cursor = '', since, until, limit = 100 } = {}) {
+        // -> {activity, next_cursor}; since/until - epoch (сек) или ISO
+        const query = new URLSearchParams({ type, limit, cursor });
+        if (since !== undefined) query.set('since', since);
+        if (until !== undefined) query.set('until', until);
+        return await this.request(`/api/activity?${query}`);
+    }
+    async getActivityCount(type = 'all', since, until) {
+        // -> {count, by_type}
+        const query = new URLSearchParams({ type });
+        if (since !== undefined) query.set('since', since);
+        if (until !== undefined) query.set('until', until);
+        return await this.request(`/api/activity/count?${query}`);
+    }
     async getModerationHistory(limit = 50) { return await this.request(`/api/moderation/history?limit=${limit}`); }
     async warnUser(guildId, userId, reason, logChannelId) { 
         return await this.request(`/api/guilds/${guildId}/members/${userId}/warn`, 'POST', { 
@@ -112,6 +146,28 @@ class API {
     async getUserInfo(guildId, userId) {
         return await this.request(`/api/guilds/${guildId}/members/${userId}/info`);
     }
+
+    // Фоновые задачи: POST массовой операции возвращает {job_id}, дальше - опрос /api/jobs/<id>
+    // Билет для EventSource: заголовок Authorization он передать не может, PIN в URL не кладём
+    async getStreamTicket() { return await this.request('/api/events/ticket', 'POST'); }
+    async getJob(jobId, resultsFrom = 0) { return await this.request(`/api/jobs/${jobId}?results_from=${resultsFrom}`); }
+    async cancelJob(jobId) { return await this.request(`/api/jobs/${jobId}/cancel`, 'POST'); }
+    async waitForJob(jobOrId, { onProgress = null, interval = 1000 } = {}) {
+        // Ждёт завершения задачи; onProgress(job) - на каждом опросе (job.results - все полученные результаты).
+        // Возвращает задачу (job.result - итог), при ошибке задачи - исключение
+        const jobId = typeof jobOrId === 'string' ? jobOrId : jobOrId.job_id;
+        const results = [];
+        while (true) {
+            const job = await this.getJob(jobId, results.length);
+            if (!job) return null;
+            results.push(...job.results);
+            job.results = results;
+            if (onProgress) onProgress(job);
+            if (job.state === 'failed') throw new Error(job.error || 'Задача завершилась ошибкой');
+            if (['done', 'cancelled'].includes(job.state)) return job;
+            await new Promise(resolve => setTimeout(resolve, interval));
+        }
+    }
 }
 
 window.api = new API();
@@ -323,6 +323,31 @@ function displayChannelsList() {
     `).join('');
 }
 
+function renderActivityItem(activity) {
+    let timeStr = activity.time || '';
+    try {
+        if (timeStr) {
+            const date = new Date(timeStr);
+            if (!isNaN(date.getTime())) {
+                timeStr = date.toLocaleString('ru-RU');
+            }
+        }
+    } catch (e) {}
+    
+    return `
+            <div class="activity-item ${activity.type || ''}">
+                <div class="activity-icon" style="background: ${activity.color || 'linear-gradient(135deg, #667eea 0%, #764ba2 100%)'}">
+                    <i class="${activity.icon || 'fas fa-circle'}"></i>
+                </div>
+                <div class="activity-content">
+                    <h4>${activity.title || 'Событие'}</h4>
+                    <p>${activity.description || ''}</p>
+                    <span class="activity-time">${timeStr}</span>
+                </div>
+            </div>
+        `;
+}
+
 async function displayActivityFeed() {
     const container = document.getElementById('activityFeed');
     if (!container) return;
@@ -341,30 +366,7 @@ async function displayActivityFeed() {
             container.innerHTML = '<p class="loading-text">Нет событий для выбранного фильтра</p>';
             return;
         }
-        container.innerHTML = activities.map(activity => {
-            let timeStr = activity.time || '';
-            try {
-                if (timeStr) {
-                    const date = new Date(timeStr);
-                    if (!isNaN(date.getTime())) {
-                        timeStr = date.toLocaleString('ru-RU');
-                    }
-                }
-            } catch (e) {}
-            
-            return `
-            <div class="activity-item ${activity.type || ''}">
-                <div class="activity-icon" style="background: ${activity.color || 'linear-gradient(135deg, #667eea 0%, #764ba2 100%)'}">
-                    <i class="${activity.icon || 'fas fa-circle'}"></i>
-                </div>
-                <div class="activity-content">
-                    <h4>${activity.title || 'Событие'}</h4>
-                    <p>${activity.description || ''}</p>
-                    <span class="activity-time">${timeStr}</span>
-                </div>
-            </div>
-        `;
-        }).join('');
+        container.innerHTML = activities.map(renderActivityItem).join('');
     } catch (error) {
         console.error('Ошибка загрузки активности:', error);
     }
@@ -379,30 +381,7 @@ async function displayRecentActivity() {
             container.innerHTML = '<p class="loading-text">Нет активности</p>';
             return;
         }
-        container.innerHTML = activities.map(activity => {
-            let timeStr = activity.time || '';
-            try {
-                if (timeStr) {
-                    const date = new Date(timeStr);
-                    if (!isNaN(date.getTime())) {
-                        timeStr = date.toLocaleString('ru-RU');
-                    }
-                }
-            } catch (e) {}
-            
-            return `
-            <div class="activity-item ${activity.type || ''}">
-                <div class="activity-icon" style="background: ${activity.color || 'linear-gradient(135deg, #667eea 0%, #764ba2 100%)'}">
-                    <i class="${activity.icon || 'fas fa-circle'}"></i>
-                </div>
-                <div class="activity-content">
-                    <h4>${activity.title || 'Событие'}</h4>
-                    <p>${activity.description || ''}</p>
-                    <span class="activity-time">${timeStr}</span>
-                </div>
-            </div>
-        `;
-        }).join('');
+        container.innerHTML = activities.map(renderActivityItem).join('');
     } catch (error) {
         console.error('Ошибка активности:', error);
     }
@@ -736,8 +715,9 @@ async function handleDeleteMessages(e) {
     const amount = parseInt(document.getElementById('deleteAmount').value);
     if (!confirm(`Удалить ${amount} сообщений?`)) return;
     try {
-        const result = await api.bulkDelete(channelId, amount);
-        showToast(`Удалено ${result.deleted} сообщений`, 'success');
+        const job = await api.waitForJob(await api.bulkDelete(channelId, amount));
+        const result = job.result || { deleted: job.progress.done };
+        showToast(`Удалено ${result.deleted} сообщений`, job.state === 'done' ? 'success' : 'warning');
         await displayActivityFeed();
     } catch (error) {
         showToast('Ошибка удаления', 'error');
@@ -1407,9 +1387,29 @@ function closeMobileMenu() {
     document.querySelector('.sidebar-overlay')?.remove();
 }
 
+// === ОБНОВЛЕНИЕ ДАННЫХ: поток событий (SSE), при недоступности - периодический опрос ===
+let eventSource = null;
+let eventStreamFailures = 0;
+let eventStreamGeneration = 0;
+let lastEventId = null;
+let renderTimer = null;
+let activityFeedTimer = null;
+let moderationTimer = null;
+const EVENT_STREAM_MAX_FAILURES = 3;
+
 function startAutoRefresh() {
+    stopAutoRefresh();
+    if (!settings.autoRefresh || !currentGuildId) return;
+    if (window.EventSource && eventStreamFailures < EVENT_STREAM_MAX_FAILURES) {
+        lastEventId = null;
+        startEventStream();
+    } else {
+        startPolling();
+    }
+}
+
+function startPolling() {
     if (autoRefreshInterval) clearInterval(autoRefreshInterval);
-    if (!settings.autoRefresh) return;
     autoRefreshInterval = setInterval(async () => {
         if (!currentGuildId) return;
         console.log('🔄 Автообновление...');
@@ -1436,7 +1436,159 @@ function startAutoRefresh() {
     console.log(`✅ Автообновление запущено (${settings.refreshInterval}с)`);
 }
 
+function eventStreamFailed() {
+    console.warn('⚠️ Поток событий недоступен, переключаемся на опрос');
+    eventStreamFailures = EVENT_STREAM_MAX_FAILURES;
+    startAutoRefresh();
+}
+
+async function startEventStream() {
+    // stopAutoRefresh / смена сервера меняют поколение - устаревшее подключение не открывается
+    const generation = ++eventStreamGeneration;
+    const guildId = currentGuildId;
+    let ticket;
+    try {
+        ticket = (await api.getStreamTicket()).ticket;
+    } catch (error) {
+        ticket = null;
+    }
+    if (generation !== eventStreamGeneration || guildId !== currentGuildId) return;
+    if (!ticket) {
+        eventStreamFailed();
+        return;
+    }
+    
+    let url = `${api.baseURL}/api/events/stream?guild_id=${guildId}&ticket=${encodeURIComponent(ticket)}`;
+    if (lastEventId) url += `&last_event_id=${encodeURIComponent(lastEventId)}`;
+    const source = eventSource = new EventSource(url);
+    
+    source.onopen = () => {
+        eventStreamFailures = 0;
+        console.log('📡 Поток событий подключён');
+    };
+    source.onerror = () => {
+        // EventSource переподключается сам (с Last-Event-ID), пока билет не истёк;
+        // закрытый поток (билет истёк, сервер занят) - новый билет, после нескольких неудач подряд - опрос
+        if (source !== eventSource) return;
+        eventStreamFailures++;
+        if (eventStreamFailures >= EVENT_STREAM_MAX_FAILURES) {
+            eventStreamFailed();
+        } else if (source.readyState === EventSource.CLOSED) {
+            eventSource = null;
+            startEventStream();
+        }
+    };
+    source.onmessage = (e) => { if (e.lastEventId) lastEventId = e.lastEventId; };
+    
+    const deltaHandlers = {
+        member_join: member => {
+            upsertById(cachedData.members, member);
+            if (cachedData.currentGuild) cachedData.currentGuild.member_count++;
+        },
+        member_update: member => upsertById(cachedData.members, member),
+        member_leave: member => {
+            if (removeById(cachedData.members, member.id) && cachedData.currentGuild) {
+                cachedData.currentGuild.member_count--;
+            }
+        },
+        role_create: role => upsertById(cachedData.roles, role, (a, b) => b.position - a.position),
+        role_update: role => upsertById(cachedData.roles, role, (a, b) => b.position - a.position),
+        role_delete: role => removeById(cachedData.roles, role.id),
+        channel_create: channel => upsertById(cachedData.channels, channel, (a, b) => a.position - b.position),
+        channel_update: channel => upsertById(cachedData.channels, channel, (a, b) => a.position - b.position),
+        channel_delete: channel => removeById(cachedData.channels, channel.id)
+    };
+    Object.entries(deltaHandlers).forEach(([type, apply]) => {
+        source.addEventListener(type, (e) => {
+            lastEventId = e.lastEventId || lastEventId;
+            apply(JSON.parse(e.data).data);
+            scheduleRender();
+        });
+    });
+    
+    source.addEventListener('activity', (e) => {
+        lastEventId = e.lastEventId || lastEventId;
+        prependActivity(JSON.parse(e.data).data);
+    });
+    source.addEventListener('moderation', (e) => {
+        lastEventId = e.lastEventId || lastEventId;
+        scheduleModerationRefresh();
+    });
+    // Клиент отстал от потока - перезагружаем снимок
+    source.addEventListener('resync', () => {
+        lastEventId = null;
+        selectGuild(currentGuildId);
+    });
+}
+
+function upsertById(list, item, compare = null) {
+    const index = list.findIndex(x => x.id === item.id);
+    if (index >= 0) list[index] = item;
+    else list.push(item);
+    if (compare) list.sort(compare);
+}
+
+function removeById(list, id) {
+    const index = list.findIndex(x => x.id === id);
+    if (index < 0) return false;
+    list.splice(index, 1);
+    return true;
+}
+
+// Несколько дельт подряд (массовые изменения) - одна перерисовка
+function scheduleRender() {
+    if (renderTimer) return;
+    renderTimer = setTimeout(() => {
+        renderTimer = null;
+        updateDashboardStats();
+        populateChannelSelects();
+        populateMemberSelects();
+        populateRoleSelects();
+        displayRolesList();
+        displayChannelsList();
+    }, 300);
+}
+
+function prependActivity(activity) {
+    const recent = document.getElementById('recentActivity');
+    if (recent) {
+        recent.querySelector('.loading-text')?.remove();
+        recent.insertAdjacentHTML('afterbegin', renderActivityItem(activity));
+        while (recent.children.length > 5) recent.lastElementChild.remove();
+    }
+    
+    const feed = document.getElementById('activityFeed');
+    if (!feed) return;
+    const filter = document.getElementById('activityFilter')?.value || 'all';
+    if (filter === 'all') {
+        feed.querySelector('.loading-text')?.remove();
+        feed.insertAdjacentHTML('afterbegin', renderActivityItem(activity));
+        while (feed.children.length > 100) feed.lastElementChild.remove();
+    } else if (!activityFeedTimer) {
+        // Для фильтров сопоставление типов на сервере - перезапрашиваем ленту (не чаще раза в 2с)
+        activityFeedTimer = setTimeout(() => {
+            activityFeedTimer = null;
+            displayActivityFeed();
+        }, 2000);
+    }
+}
+
+function scheduleModerationRefresh() {
+    if (moderationTimer || getCurrentPage() !== 'moderation') return;
+    moderationTimer = setTimeout(async () => {
+        moderationTimer = null;
+        await displayModerationHistory();
+        await displayActivePunishments();
+    }, 1000);
+}
+
 function stopAutoRefresh() {
+    eventStreamGeneration++;
+    if (eventSource) {
+        eventSource.close();
+        eventSource = null;
+        console.log('⏸️ Поток событий закрыт');
+    }
     if (autoRefreshInterval) {
         clearInterval(autoRefreshInterval);
         autoRefreshInterval = null;
@@ -2449,6 +2601,7 @@ async function createTempRoom(event) {
         const result = await response.json();
         
         if (response.ok) {
+            await api.waitForJob(result);
             showToast(`Комната "${roomName}" создана!`, 'success');
             
             // Очищаем форму
@@ -2667,7 +2820,13 @@ function openSendDMModal() {
                 throw new Error(error.error || 'Failed to send');
             }
             
-            const result = await response.json();
+            const job = await api.waitForJob(await response.json());
+            if (job.state === 'cancelled') {
+                const sent = job.results.filter(r => r.status === 'sent').length;
+                showToast(`Отправка отменена: ${sent}/${selectedIds.length}`, 'warning');
+                return;
+            }
+            const result = job.result;
             
             let message = `Отправлено: ${result.sent}/${selectedIds.length}`;
             if (result.failed > 0) {
@@ -2702,22 +2861,13 @@ async function loadAISettings() {
 
 async function loadAIStats() {
     try {
-        // Получаем Activity logs
-        const response = await fetch(`/api/activity?type=all&limit=10000`, {
-            headers: { 'Authorization': `Bearer ${api.token}` }
-        });
-        const data = await response.json();
-        
-        // Считаем AI ответы сегодня
-        const today = new Date().toISOString().split('T')[0];
-        const aiResponses = data.records.filter(r => {
-            const timestamp = r.Timestamp || '';
-            return timestamp.startsWith(today) && 
-                   (r.Details || '').includes('AI ответил');
-        });
+        // Считаем AI ответы с начала сегодняшнего дня (на сервере, без выгрузки записей)
+        const midnight = new Date();
+        midnight.setHours(0, 0, 0, 0);
+        const { count } = await api.getActivityCount('ai', Math.floor(midnight.getTime() / 1000));
         
         // Обновляем счётчик
-        document.getElementById('aiResponseCount').textContent = aiResponses.length;
+        document.getElementById('aiResponseCount').textContent = count;
         
         // Рассчитываем среднее время (заглушка - нужна доп. логика)
         document.getElementById('aiAvgTime').textContent = '~1.2s';
@@ -94,6 +94,7 @@ async function selectGuild(guildId) {
         
         // Загружаем активные комнаты
         await loadActiveRooms();
+        startRoomEvents();
         
         showToast('Сервер загружен', 'success');
     } catch (error) {
@@ -274,7 +275,7 @@ async function createRoom() {
     try {
         showToast('Создание комнаты...', 'info');
         
-        const response = await apiRequest(`/api/guilds/${currentGuildId}/temp-rooms`, 'POST', {
+        const accepted = await apiRequest(`/api/guilds/${currentGuildId}/temp-rooms`, 'POST', {
             room_name: roomName,
             duration_minutes: duration,
             user_limit: userLimit,
@@ -284,7 +285,8 @@ async function createRoom() {
             message_text: messageText
         });
         
-        console.log('✅ Комната создана:', response);
+        const job = await waitForJob(accepted.job_id);
+        console.log('✅ Комната создана:', job.result);
         showToast('Комната успешно создана!', 'success');
         
         // Сбрасываем форму
@@ -376,10 +378,48 @@ async function loadActiveRooms() {
 }
 
 let timerInterval = null;
+let roomEvents = null;
+let roomEventsGeneration = 0;
+let expiredReloadDone = false;
+
+// Изменения комнат приходят из потока событий (SSE) - список перезагружается только по событию
+async function startRoomEvents() {
+    if (roomEvents) roomEvents.close();
+    roomEvents = null;
+    if (!window.EventSource || !currentGuildId) return;
+    
+    // EventSource не передаёт заголовки - подключение по короткоживущему билету, а не по PIN в URL
+    const generation = ++roomEventsGeneration;
+    const guildId = currentGuildId;
+    let ticket;
+    try {
+        ticket = (await apiRequest('/api/events/ticket', 'POST')).ticket;
+    } catch (error) {
+        console.warn('⚠️ Поток событий недоступен');
+        return;
+    }
+    if (generation !== roomEventsGeneration || guildId !== currentGuildId) return;
+    
+    const source = roomEvents = new EventSource(`${baseURL}/api/events/stream?guild_id=${guildId}&ticket=${encodeURIComponent(ticket)}`);
+    source.addEventListener('temp_room', () => loadActiveRooms());
+    source.addEventListener('resync', () => loadActiveRooms());
+    source.onerror = () => {
+        if (roomEvents === source && source.readyState === EventSource.CLOSED) {
+            console.warn('⚠️ Поток событий недоступен');
+            roomEvents = null;
+        }
+    };
+}
+
+function roomEventsConnected() {
+    return roomEvents && roomEvents.readyState !== EventSource.CLOSED;
+}
 
 function startTimerUpdates(rooms) {
     if (timerInterval) clearInterval(timerInterval);
+    expiredReloadDone = false;
     
+    // Таймер только пересчитывает оставшееся время локально, без запросов к серверу
     timerInterval = setInterval(() => {
         const timerDisplays = document.querySelectorAll('.timer-display');
         let hasExpired = false;
@@ -402,8 +442,10 @@ function startTimerUpdates(rooms) {
             }
         });
         
-        if (hasExpired) {
-            loadActiveRooms();
+        // Без потока событий - одна перезагрузка списка после истечения, а не каждую секунду
+        if (hasExpired && !roomEventsConnected() && !expiredReloadDone) {
+            expiredReloadDone = true;
+            setTimeout(loadActiveRooms, 5000);
         }
     }, 1000);
 }
@@ -454,6 +496,16 @@ async function apiRequest(endpoint, method = 'GET', body = null) {
     return response.json();
 }
 
+// Ожидание фоновой задачи (POST вернул {job_id}); ошибка задачи -> исключение
+async function waitForJob(jobId, interval = 1000) {
+    while (true) {
+        const job = await apiRequest(`/api/jobs/${jobId}`);
+        if (job.state === 'failed') throw new Error(job.error || 'Ошибка выполнения');
+        if (['done', 'cancelled'].includes(job.state)) return job;
+        await new Promise(resolve => setTimeout(resolve, interval));
+    }
+}
+
 function escapeHtml(text) {
     if (!text) return '';
     const div = document.createElement('div');
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Нагрузочный тест API панели
+Сравнение режимов сервера (WEB_SERVER=flask / waitress / aiohttp):
+
+    python load_test.py --url http://localhost:5000 --pin 123456 --guild 1234567890 -c 20 -d 30
+"""
+
+import argparse
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def worker(session, url, headers, deadline, results, lock):
+    latencies = []
+    errors = 0
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        try:
+            response = session.get(url, headers=headers, timeout=30)
+            response.content  # дочитываем тело
+            if response.status_code != 200:
+                errors += 1
+        except requests.RequestException:
+            errors += 1
+        latencies.append(time.monotonic() - started)
+    with lock:
+        results['latencies'].extend(latencies)
+        results['errors'] += errors
+
+
+def run_endpoint(url, headers, concurrency, duration):
+    """concurrency клиентов с keep-alive (одна сессия на клиента) в течение duration секунд"""
+    results = {'latencies': [], 'errors': 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    sessions = [requests.Session() for _ in range(concurrency)]
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for session in sessions:
+            pool.submit(worker, session, url, headers, deadline, results, lock)
+    elapsed = time.monotonic() - started
+    for session in sessions:
+        session.close()
+
+    latencies = results['latencies']
+    return {
+        'requests': len(latencies),
+        'errors': results['errors'],
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'mean_ms': statistics.mean(latencies) * 1000 if latencies else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест API панели")
+    parser.add_argument('--url', default='http://localhost:5000', help="Адрес сервера")
+    parser.add_argument('--pin', required=True, help="PIN для заголовка Authorization")
+    parser.add_argument('--guild', required=True, help="ID сервера Discord")
+    parser.add_argument('-c', '--concurrency', type=int, default=10, help="Одновременных клиентов")
+    parser.add_argument('-d', '--duration', type=int, default=20, help="Длительность на эндпоинт, сек")
+    args = parser.parse_args()
+
+    headers = {'Authorization': f'Bearer {args.pin}'}
+    endpoints = [
+        f"/api/guilds/{args.guild}/full",
+        "/api/activity"
+    ]
+
+    print(f"🚀 {args.url}: {args.concurrency} клиентов, {args.duration}с на эндпоинт\n")
+    for path in endpoints:
+        stats = run_endpoint(args.url.rstrip('/') + path, headers, args.concurrency, args.duration)
+        print(f"📊 {path}")
+        print(f"   запросов: {stats['requests']} (ошибок: {stats['errors']})")
+        print(f"   {stats['rps']:.1f} req/s | mean {stats['mean_ms']:.0f}ms | "
+              f"p50 {stats['p50_ms']:.0f}ms | p95 {stats['p95_ms']:.0f}ms | p99 {stats['p99_ms']:.0f}ms\n")
+
+
+if __name__ == '__main__':
+    main()
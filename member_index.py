@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Индекс участников сервера для постраничной выдачи
+- Участники отсортированы по отображаемому имени (без учёта регистра), затем по id
+- Курсор - позиция в этом порядке, устойчивая к добавлению/удалению участников
+- Поиск по префиксу имени - бинарным поиском, фильтр по роли - по готовым множествам
+- Индекс пересобирается, только когда меняется версия состава сервера (раздел 'roster'):
+  вход/выход, ник и роли участника (on_member_update), а также имя пользователя
+  и глобальное имя (on_user_update - приходит один раз на все общие серверы)
+"""
+
+import base64
+import json
+import threading
+from bisect import bisect_left, bisect_right
+
+# Верхняя граница для диапазона префикса
+_PREFIX_END = '\U0010ffff'
+
+
+def encode_cursor(key):
+    raw = json.dumps(list(key), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Курсор -> (имя, id). ValueError, если курсор повреждён"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        name, member_id = json.loads(raw.decode('utf-8'))
+        return str(name), int(member_id)
+    except Exception:
+        raise ValueError("Некорректный cursor")
+
+
+def _prefix_range(keys, prefix):
+    return bisect_left(keys, (prefix,)), bisect_left(keys, (prefix + _PREFIX_END,))
+
+
+class MemberIndex:
+    """Неизменяемый снимок: порядок участников, имена для поиска, участники по ролям"""
+
+    def __init__(self, members):
+        entries = sorted((m.display_name.casefold(), m.id, m) for m in members)
+        self.keys = [(name, member_id) for name, member_id, _ in entries]
+        self.members = [m for _, _, m in entries]
+        # Логин отдельно: ищем и по display_name, и по username
+        self.usernames = sorted((m.name.casefold(), pos) for pos, m in enumerate(self.members))
+        self.by_role = {}  # {role_id: {pos}}
+        for pos, m in enumerate(self.members):
+            for role in m.roles:
+                self.by_role.setdefault(role.id, set()).add(pos)
+
+    def __len__(self):
+        return len(self.members)
+
+    def _prefix_positions(self, prefix):
+        start, end = _prefix_range(self.keys, prefix)
+        positions = set(range(start, end))
+        start = bisect_left(self.usernames, (prefix,))
+        end = bisect_left(self.usernames, (prefix + _PREFIX_END,))
+        positions.update(pos for _, pos in self.usernames[start:end])
+        return positions
+
+    def query(self, role_ids=None, statuses=None, prefix=None, cursor=None, limit=100):
+        """
+        Страница участников по фильтрам: (members, next_cursor, total).
+        role_ids - любая из ролей, statuses - любой из статусов (проверяется вживую),
+        prefix - начало display_name или username. total - число совпадений без учёта курсора.
+        """
+        start = bisect_right(self.keys, decode_cursor(cursor)) if cursor else 0
+
+        candidates = None
+        if prefix:
+            candidates = self._prefix_positions(prefix.casefold())
+        if role_ids:
+            by_roles = set().union(*(self.by_role.get(r, ()) for r in role_ids))
+            candidates = by_roles if candidates is None else candidates & by_roles
+
+        if candidates is None and not statuses:
+            # Без фильтров - обычный срез
+            page = self.members[start:start + limit]
+            end = start + len(page)
+            next_cursor = encode_cursor(self.keys[end - 1]) if page and end < len(self.members) else None
+            return page, next_cursor, len(self.members)
+
+        positions = sorted(candidates) if candidates is not None else range(len(self.members))
+        if statuses:
+            positions = [pos for pos in positions if str(self.members[pos].status) in statuses]
+        total = len(positions)
+        tail = positions[bisect_left(positions, start):]
+        page_positions = tail[:limit]
+        next_cursor = encode_cursor(self.keys[page_positions[-1]]) if len(tail) > limit else None
+        return [self.members[pos] for pos in page_positions], next_cursor, total
+
+
+class MemberIndexCache:
+    """Индексы по серверам; version(guild_id) определяет, актуален ли индекс"""
+
+    def __init__(self, version):
+        self._version = version
+        self._indexes = {}  # {guild_id: (version, MemberIndex)}
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def get(self, guild):
+        version = self._version(guild.id)
+        with self._lock:
+            cached = self._indexes.get(guild.id)
+            if cached and cached[0] == version:
+                return cached[1]
+        index = MemberIndex(list(guild.members))
+        with self._lock:
+            self._indexes[guild.id] = (version, index)
+            self.builds += 1
+        return index
+
+    def stats(self):
+        with self._lock:
+            return {
+                'guilds': len(self._indexes),
+                'members': sum(len(index) for _, index in self._indexes.values()),
+                'builds': self.builds
+            }
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Формат листа Messages
+- User ID и Epoch - отдельные колонки в конце: подсчёт сообщений - сравнение по равенству,
+  без разбора "Sent By" ("Username (ID)") и даты в каждой строке
+- Старые строки без этих колонок дополняет migrate_messages.py; до миграции значения
+  вычисляются из "Sent By" / "Timestamp" (parse_sent_by / parse_timestamp)
+"""
+
+import re
+from datetime import datetime
+
+MESSAGES_HEADERS = ['Timestamp', 'Guild ID', 'Guild Name', 'Channel', 'Sent By', 'Content', 'User ID', 'Epoch']
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+ADMIN_PANEL_SENDER = 'Admin Panel'
+
+_USER_ID_PATTERN = re.compile(r'\d{15,20}')
+
+
+def parse_sent_by(sent_by):
+    """User ID из "Sent By" старого формата ("Username (ID)" или просто ID) или ''"""
+    sent_by = str(sent_by or '').strip()
+    if '(' in sent_by and ')' in sent_by:
+        user_id = sent_by.split('(')[-1].split(')')[0].strip()
+    elif sent_by.isdigit():
+        user_id = sent_by
+    else:
+        match = _USER_ID_PATTERN.search(sent_by)
+        user_id = match.group() if match else ''
+    return user_id if user_id.isdigit() else ''
+
+
+def parse_timestamp(timestamp):
+    """'YYYY-MM-DD HH:MM:SS' -> epoch (int) или None"""
+    try:
+        return int(datetime.strptime(str(timestamp), TIMESTAMP_FORMAT).timestamp())
+    except ValueError:
+        return None
+
+
+def message_row(timestamp, guild_id, guild_name, channel, sent_by, content, user_id):
+    """Строка листа Messages; timestamp - epoch"""
+    return [
+        datetime.fromtimestamp(timestamp).strftime(TIMESTAMP_FORMAT),
+        str(guild_id),
+        guild_name,
+        channel,
+        sent_by,
+        content[:500],  # Ограничение длины
+        str(user_id) if user_id else '',
+        int(timestamp)
+    ]
+
+
+def read_messages(values):
+    """
+    Все значения листа (get_all_values) -> [(guild_id, user_id, epoch)].
+    Колонки ищутся по заголовку; для строк без User ID / Epoch - разбор старого формата.
+    """
+    if not values:
+        return []
+    header = values[0]
+    columns = {name: header.index(name) for name in MESSAGES_HEADERS if name in header}
+
+    def cell(row, name):
+        index = columns.get(name)
+        return row[index] if index is not None and index < len(row) else ''
+
+    messages = []
+    for row in values[1:]:
+        user_id = str(cell(row, 'User ID')).strip() or parse_sent_by(cell(row, 'Sent By'))
+        try:
+            epoch = int(float(cell(row, 'Epoch')))
+        except (ValueError, OverflowError):  # пусто, текст, 'nan' / 'inf' - разбор Timestamp
+            epoch = parse_timestamp(cell(row, 'Timestamp'))
+        messages.append((str(cell(row, 'Guild ID')), user_id, epoch))
+    return messages
+
+
+def count_by_user(messages, guild_id, since=None):
+    """{user_id: количество сообщений} на сервере guild_id; since - epoch начала периода"""
+    guild_id = str(guild_id)
+    counts = {}
+    for message_guild_id, user_id, epoch in messages:
+        if message_guild_id != guild_id or not user_id:
+            continue
+        if since is not None and (epoch is None or epoch < since):
+            continue
+        counts[user_id] = counts.get(user_id, 0) + 1
+    return counts
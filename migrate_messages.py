@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Миграция листа Messages на формат с колонками User ID и Epoch (одноразово)
+- Заголовок приводится к MESSAGES_HEADERS
+- User ID - из "Sent By" ("Username (ID)"), Epoch - из Timestamp; заполненные значения не трогаются
+- Строки панели старого формата (со сдвигом колонок: ..., 'Admin Panel', Guild ID, Guild Name)
+  переписываются в правильные колонки
+- Повторный запуск безопасен: уже мигрированные строки пропускаются
+
+    python migrate_messages.py --dry-run
+    python migrate_messages.py
+"""
+
+import argparse
+import os
+
+import gspread
+from dotenv import load_dotenv
+from google.oauth2.service_account import Credentials
+
+from messages_schema import ADMIN_PANEL_SENDER, MESSAGES_HEADERS, parse_sent_by, parse_timestamp
+
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
+CHUNK_ROWS = 5000  # строк в одном запросе записи
+WIDTH = len(MESSAGES_HEADERS)
+
+
+def open_spreadsheet():
+    """Таблица бота - те же переменные окружения, что и у server.py"""
+    load_dotenv()
+    private_key = os.getenv("GOOGLE_PRIVATE_KEY")
+    client_email = os.getenv("GOOGLE_CLIENT_EMAIL")
+    if private_key and client_email:
+        creds = Credentials.from_service_account_info({
+            "type": "service_account",
+            "project_id": os.getenv("GOOGLE_PROJECT_ID"),
+            "private_key": private_key.replace('\\n', '\n'),
+            "client_email": client_email,
+            "token_uri": "https://oauth2.googleapis.com/token",
+        }, scopes=SCOPES)
+    else:
+        creds = Credentials.from_service_account_file('service_account.json', scopes=SCOPES)
+    return gspread.authorize(creds).open(os.getenv("GOOGLE_SHEET_NAME", "DiscordBotLogs"))
+
+
+def is_legacy_panel_row(row):
+    """Строка старого log_to_messages_sheet: Timestamp, Channel ID, Channel, Type, Content, 'Admin Panel', Guild ID, Guild Name"""
+    return len(row) > 5 and row[5] == ADMIN_PANEL_SENDER and row[4] != ADMIN_PANEL_SENDER
+
+
+def fix_legacy_panel_row(row):
+    row = row + [''] * (8 - len(row))
+    timestamp, _channel_id, channel, message_type, content, _, guild_id, guild_name = row[:8]
+    if message_type and message_type != 'normal':
+        content = f"[{message_type}] {content}"
+    epoch = parse_timestamp(timestamp)
+    return [timestamp, guild_id, guild_name, channel, ADMIN_PANEL_SENDER, content, '', epoch if epoch is not None else '']
+
+
+def backfill(row):
+    """(User ID, Epoch) для строки нового формата; None - менять нечего"""
+    row = row + [''] * (WIDTH - len(row))
+    user_id, epoch = row[6], row[7]
+    if user_id and epoch:
+        return None
+    if not user_id and row[4] != ADMIN_PANEL_SENDER:
+        user_id = parse_sent_by(row[4])
+    if not epoch:
+        parsed = parse_timestamp(row[0])
+        epoch = parsed if parsed is not None else ''
+    if [user_id, epoch] == row[6:8]:
+        return None
+    return [user_id, epoch]
+
+
+def plan(values):
+    """(заголовок изменён, [(номер строки, значения G:H)], [(номер строки, вся строка)])"""
+    header_changed = not values or values[0][:WIDTH] != MESSAGES_HEADERS
+    columns = []
+    rows = []
+    for row_number, row in enumerate(values[1:], start=2):
+        if not any(row):
+            continue
+        if is_legacy_panel_row(row):
+            rows.append((row_number, fix_legacy_panel_row(row)))
+            continue
+        update = backfill(row)
+        if update is not None:
+            columns.append((row_number, update))
+    return header_changed, columns, rows
+
+
+def contiguous(updates):
+    """Соседние строки объединяются в один диапазон: [(первая строка, [значения, ...])]"""
+    ranges = []
+    for row_number, value in updates:
+        if ranges and ranges[-1][0] + len(ranges[-1][1]) == row_number and len(ranges[-1][1]) < CHUNK_ROWS:
+            ranges[-1][1].append(value)
+        else:
+            ranges.append((row_number, [value]))
+    return ranges
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Миграция листа Messages: колонки User ID и Epoch")
+    parser.add_argument('--dry-run', action='store_true', help="только показать, что будет изменено")
+    args = parser.parse_args()
+
+    worksheet = open_spreadsheet().worksheet('Messages')
+    values = worksheet.get_all_values()
+    header_changed, columns, rows = plan(values)
+    print(f"📊 Messages: {max(len(values) - 1, 0)} строк")
+    print(f"  заголовок: {'будет обновлён' if header_changed else 'в порядке'}")
+    print(f"  User ID / Epoch дополнить: {len(columns)} строк")
+    print(f"  строки панели со сдвигом колонок: {len(rows)}")
+    if args.dry_run or not (header_changed or columns or rows):
+        return
+
+    if worksheet.col_count < WIDTH:
+        worksheet.add_cols(WIDTH - worksheet.col_count)
+
+    data = []
+    if header_changed:
+        data.append({'range': 'A1', 'values': [MESSAGES_HEADERS]})
+    data.extend({'range': f'G{first}:H{first + len(chunk) - 1}', 'values': chunk}
+                for first, chunk in contiguous(columns))
+    data.extend({'range': f'A{first}:H{first + len(chunk) - 1}', 'values': chunk}
+                for first, chunk in contiguous(rows))
+    # Запись пачками диапазонов: RAW, как и при обычной записи бота
+    for start in range(0, len(data), 100):
+        worksheet.batch_update(data[start:start + 100], value_input_option='RAW')
+        print(f"  ✅ записано диапазонов: {min(start + 100, len(data))}/{len(data)}")
+    print("✅ Миграция завершена")
+
+
+if __name__ == '__main__':
+    main()
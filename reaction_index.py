@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Индекс реакций для on_raw_reaction_add / on_raw_reaction_remove
+- (message_id, эмодзи) -> role_id и message_id -> приветствие одним поиском в словаре
+- Пересобирается, только когда меняются reaction_roles.json / welcomes.json (версии хранилищ);
+  данные читаются под блокировкой хранилища вместе с версией
+"""
+
+import threading
+
+
+class ReactionIndex:
+    def __init__(self, rr_store, welcome_store):
+        self.rr_store = rr_store
+        self.welcome_store = welcome_store
+        self._version = None
+        self._roles = {}  # {(message_id, str(emoji)): role_id}
+        self._welcomes = {}  # {message_id: (target_channel_id, message)}
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def _current(self):
+        version = (self.rr_store.version, self.welcome_store.version)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._rebuild()
+        return self
+
+    def _rebuild(self):
+        rr_version, roles = self.rr_store.read(self._build_roles)
+        welcome_version, welcomes = self.welcome_store.read(self._build_welcomes)
+        self._roles = roles
+        self._welcomes = welcomes
+        self._version = (rr_version, welcome_version)
+        self.builds += 1
+
+    @staticmethod
+    def _build_roles(data):
+        roles = {}
+        for message_id, rr_data in data.items():
+            if not str(message_id).isdigit() or not isinstance(rr_data, dict):
+                continue
+            for reaction in rr_data.get("reactions", []):
+                try:
+                    key = (int(message_id), reaction["emoji"])
+                    # Как и раньше: срабатывает первая запись с этим эмодзи
+                    roles.setdefault(key, int(reaction["role_id"]))
+                except (KeyError, TypeError, ValueError):
+                    continue
+        return roles
+
+    @staticmethod
+    def _build_welcomes(data):
+        welcomes = {}
+        for message_id, config in data.items():
+            try:
+                welcomes[int(message_id)] = (int(config["target_channel_id"]), config["message"])
+            except (KeyError, TypeError, ValueError):
+                continue
+        return welcomes
+
+    def role_for(self, message_id, emoji):
+        """role_id для реакции emoji на сообщении или None"""
+        return self._current()._roles.get((message_id, str(emoji)))
+
+    def welcome_for(self, message_id):
+        """(target_channel_id, шаблон сообщения) или None"""
+        return self._current()._welcomes.get(message_id)
+
+    def stats(self):
+        self._current()
+        return {'reaction_roles': len(self._roles), 'welcomes': len(self._welcomes), 'builds': self.builds}
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Объединение изменений ролей участника для ленты активности
+- Разница ролей до/после - по множествам id, без перебора списков
+- Изменения одного участника за окно (window сек) сливаются в одну запись
+- Роль, выданная и снятая внутри окна, в запись не попадает
+- Окно отсчитывается от первого изменения: поток событий не откладывает запись бесконечно
+"""
+
+import asyncio
+import threading
+import time
+
+
+def diff_roles(before, after):
+    """(добавленные, снятые) роли по id; порядок - как в исходных списках"""
+    before_ids = {role.id for role in before}
+    after_ids = {role.id for role in after}
+    added = [role for role in after if role.id not in before_ids]
+    removed = [role for role in before if role.id not in after_ids]
+    return added, removed
+
+
+class _Pending:
+    __slots__ = ('deadline', 'user_id', 'username', 'guild_id', 'guild_name', 'added', 'removed')
+
+    def __init__(self, deadline, member):
+        self.deadline = deadline
+        self.user_id = member.id
+        self.username = member.name
+        self.guild_id = member.guild.id
+        self.guild_name = member.guild.name
+        self.added = {}  # {role_id: name}
+        self.removed = {}
+
+    def merge(self, added, removed):
+        for role in added:
+            # Сняли и снова выдали внутри окна - изменения нет
+            if self.removed.pop(role.id, None) is None:
+                self.added[role.id] = role.name
+        for role in removed:
+            if self.added.pop(role.id, None) is None:
+                self.removed[role.id] = role.name
+
+    def record(self):
+        """Запись Activity (event_type, user_id, username, details, guild_id, guild_name) или None"""
+        parts = []
+        if self.added:
+            parts.append(("Получил роль: " if len(self.added) == 1 else "Получил роли: ") + ", ".join(self.added.values()))
+        if self.removed:
+            parts.append(("Потерял роль: " if len(self.removed) == 1 else "Потерял роли: ") + ", ".join(self.removed.values()))
+        if not parts:
+            return None
+        if self.added and self.removed:
+            event_type = "role_update"
+        else:
+            event_type = "role_add" if self.added else "role_remove"
+        return (event_type, self.user_id, self.username, "; ".join(parts), self.guild_id, self.guild_name)
+
+
+class RoleChangeCoalescer:
+    """
+    add() вызывается из обработчика on_member_update (event loop бота);
+    on_flush(records) получает готовые записи пачкой по истечении окна.
+    """
+
+    def __init__(self, on_flush, window=2.0):
+        self.on_flush = on_flush
+        self.window = window
+        self._pending = {}  # {(guild_id, user_id): _Pending}
+        self._timer = None
+        self._lock = threading.Lock()
+        self.events = 0
+        self.records = 0
+
+    def add(self, member, added, removed):
+        if not added and not removed:
+            return
+        key = (member.guild.id, member.id)
+        with self._lock:
+            self.events += 1
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = _Pending(time.monotonic() + self.window, member)
+            pending.username = member.name
+            pending.merge(added, removed)
+            if self._timer is None:
+                self._timer = asyncio.get_running_loop().call_later(self.window, self._flush_due)
+
+    def _take(self, due=None):
+        """Забрать записи участников, у которых окно истекло (due=None - все)"""
+        records = []
+        for key in [k for k, p in self._pending.items() if due is None or p.deadline <= due]:
+            record = self._pending.pop(key).record()
+            if record:
+                records.append(record)
+        self.records += len(records)
+        return records
+
+    def _flush_due(self):
+        now = time.monotonic()
+        with self._lock:
+            self._timer = None
+            records = self._take(now)
+            if self._pending:
+                delay = max(min(p.deadline for p in self._pending.values()) - now, 0)
+                self._timer = asyncio.get_running_loop().call_later(delay, self._flush_due)
+        if records:
+            try:
+                self.on_flush(records)
+            except Exception as e:
+                print(f"⚠️ Ошибка записи изменений ролей: {e}")
+
+    def drain(self):
+        """Все накопленные записи сразу (остановка бота)"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            return self._take()
+
+    def stats(self):
+        with self._lock:
+            return {'pending': len(self._pending), 'events': self.events, 'records': self.records}
@@ -1,14 +1,17 @@
 import os
 import json
+import pickle
 import threading
 import asyncio
 import time
 import re
+import signal
 import traceback
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import datetime as dt
-from flask import Flask, jsonify, request, send_file
+from flask import Flask, Response, jsonify, request, send_file, stream_with_context
 from flask_cors import CORS
 import discord
 from discord.ext import commands as discord_commands
@@ -19,6 +22,26 @@ import gspread
 import database_ai as db_ai_module
 from db_functions import get_user_messages_count, get_user_punishments, get_weekly_activity
 import bot_commands
+from sheets_sync import SheetMirror
+from sheets_provision import SheetProvisioner
+from startup import StartupOrchestrator
+from async_web import AsyncApiServer
+from event_bus import EventBus, StreamTickets, Subscription, parse_last_event_id
+from guild_cache import GuildSnapshotCache
+from member_index import MemberIndexCache, decode_cursor
+from emoji_index import EmojiIndexCache
+from reaction_index import ReactionIndex
+from role_changes import RoleChangeCoalescer, diff_roles
+from ingest import IngestPipeline
+from messages_schema import ADMIN_PANEL_SENDER, MESSAGES_HEADERS, count_by_user, message_row, read_messages
+from spam_tracker import DEFAULT_SPAM_CONFIG, SpamTracker, validate_spam_config
+from activity_store import ActivityStore, parse_time
+from jobs import JobManager
+from dm_broadcast import DmBroadcaster, dedupe
+from http_encoding import FastJSONProvider, ResponseCompressor, dumps_bytes
+from state_store import JsonStateStore
+from sheets_limiter import (SheetsRateLimiter, LimitedSpreadsheet,
+                            PRIORITY_MODERATION, PRIORITY_ANALYTICS, PRIORITY_BULK)
 import importlib
 importlib.reload(bot_commands)  # Перезагружаем модуль при каждом запуске
 from google.oauth2.service_account import Credentials
@@ -47,6 +70,20 @@ if not TOKEN or not ADMIN_PIN:
 
 # --- GOOGLE SHEETS SETUP ---
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
+
+# Общий ограничитель запросов к Sheets API (квоты на чтение/запись в минуту)
+sheets_limiter = SheetsRateLimiter(
+    reads_per_minute=int(os.getenv("SHEETS_READS_PER_MINUTE", 60)),
+    writes_per_minute=int(os.getenv("SHEETS_WRITES_PER_MINUTE", 60))
+)
+# Приоритет по листам: модерация > аналитика (по умолчанию) > массовая синхронизация
+SHEET_PRIORITIES = {
+    'Moderation': PRIORITY_MODERATION,
+    'Punishments': PRIORITY_MODERATION,
+    'Warnings': PRIORITY_MODERATION,
+    'Channels': PRIORITY_BULK
+}
+
 try:
     # Создаём credentials из переменных окружения
     if GOOGLE_PRIVATE_KEY and GOOGLE_CLIENT_EMAIL:
@@ -76,76 +113,47 @@ try:
         spreadsheet.share('', perm_type='anyone', role='reader')  # Публичный доступ на чтение
         print(f"✅ Создана новая таблица: {GOOGLE_SHEET_NAME}")
     
-    # Список всех необходимых листов (НЕ УДАЛЯЕМ ничего)
-    REQUIRED_SHEETS = [
-        'Activity', 'Moderation', 'Punishments', 'Messages', 'ReactionRoles', 
-        'Warnings', 'Welcomes', 'Suspicious', 'Config', 'Channels'
-    ]
-    print(f"✅ Список обязательных листов: {REQUIRED_SHEETS}")
+    # Все вызовы листов дальше идут через ограничитель
+    spreadsheet = LimitedSpreadsheet(spreadsheet, sheets_limiter, PRIORITY_ANALYTICS, SHEET_PRIORITIES)
+    
+    # Все необходимые листы и их заголовки (НЕ УДАЛЯЕМ ничего)
+    SHEET_HEADERS = {
+        'Activity': ['Timestamp', 'Event Type', 'User ID', 'Username', 'Details', 'Guild ID', 'Guild Name'],
+        'Moderation': ['Timestamp', 'Action', 'Target User ID', 'Target Username', 'Moderator', 'Reason', 'Duration', 'Guild ID', 'Guild Name'],
+        'Punishments': ['User ID', 'Username', 'Punishment Type', 'Reason', 'Start Time', 'End Time', 'Guild ID', 'Guild Name', 'Status'],
+        'Messages': MESSAGES_HEADERS,
+        'ReactionRoles': ['Message ID', 'Channel ID', 'Channel Name', 'Emoji', 'Role ID', 'Role Name', 'Created At', 'Guild ID', 'Guild Name'],
+        'Warnings': ['Timestamp', 'User ID', 'Username', 'Moderator', 'Reason', 'Warning Count', 'Guild ID', 'Guild Name', 'Status', 'Log Channel ID'],
+        'Welcomes': ['Guild ID', 'Guild Name', 'Message ID', 'Channel ID', 'Target Channel ID', 'Target Channel Name', 'Welcome Message', 'Created At'],
+        'Suspicious': ['Timestamp', 'Guild ID', 'Guild Name', 'Channel', 'User ID', 'Username', 'Content', 'Type'],
+        'Config': ['Guild ID', 'Config Type', 'Value'],
+        # 📊 Лист для каналов (0=текстовый, 2=голосовой, 4=категория)
+        'Channels': ['Guild ID', 'Guild Name', 'Channel ID', 'Channel Name', 'Type', 'Position', 'Category ID', 'Last Updated'],
+        # 🚩 Лист для временных комнат
+        'TempRooms': ['Channel ID', 'Room Name', 'Owner ID', 'Owner Name', 'Role ID', 'Duration', 'User Limit', 'Created At', 'Expires At', 'Guild ID', 'Guild Name', 'Status']
+    }
+    # Листы, нужные сразу после запуска; остальные готовятся при первом обращении
+    CRITICAL_SHEETS = ['Activity', 'Moderation', 'Punishments', 'Messages', 'Warnings', 'Config']
+    print(f"✅ Список обязательных листов: {list(SHEET_HEADERS)}")
     
     # Автоудаление ОТКЛЮЧЕНО (по запросу пользователя)
     
-    # Создаём/пересоздаём нужные листы с правильными заголовками
-    def get_or_create_sheet(name, headers):
-        try:
-            ws = spreadsheet.worksheet(name)
-            # Проверяем первую строку - если заголовки неправильные, удаляем и пересоздаём
-            try:
-                first_row = ws.row_values(1)
-                if first_row != headers:
-                    # ОБНОВЛЯЕМ заголовки вместо пересоздания
-                    print(f"⚠️ Лист '{name}' имеет неправильные заголовки, обновляем...")
-                    # Удаляем только первую строку и добавляем новые заголовки
-                    ws.delete_rows(1)
-                    ws.insert_row(headers, 1)
-                    print(f"✅ Заголовки листа '{name}' обновлены (данные сохранены)")
-                else:
-                    print(f"✅ Лист '{name}' уже существует с правильными заголовками")
-            except:
-                # Пустой лист, добавляем заголовки
-                ws.clear()
-                ws.append_row(headers)
-                print(f"✅ Заголовки добавлены в лист '{name}'")
-        except gspread.WorksheetNotFound:
-            ws = spreadsheet.add_worksheet(title=name, rows=1000, cols=20)
-            ws.append_row(headers)
-            print(f"✅ Создан лист: {name}")
-        return ws
-    
-    activity_sheet = get_or_create_sheet('Activity', 
-        ['Timestamp', 'Event Type', 'User ID', 'Username', 'Details', 'Guild ID', 'Guild Name'])
-    
-    moderation_sheet = get_or_create_sheet('Moderation',
-        ['Timestamp', 'Action', 'Target User ID', 'Target Username', 'Moderator', 'Reason', 'Duration', 'Guild ID', 'Guild Name'])
-    
-    punishments_sheet = get_or_create_sheet('Punishments',
-        ['User ID', 'Username', 'Punishment Type', 'Reason', 'Start Time', 'End Time', 'Guild ID', 'Guild Name', 'Status'])
-    
-    messages_sheet = get_or_create_sheet('Messages',
-        ['Timestamp', 'Guild ID', 'Guild Name', 'Channel', 'Sent By', 'Content'])
-    
-    reaction_roles_sheet = get_or_create_sheet('ReactionRoles',
-        ['Message ID', 'Channel ID', 'Channel Name', 'Emoji', 'Role ID', 'Role Name', 'Created At', 'Guild ID', 'Guild Name'])
-    
-    warnings_sheet = get_or_create_sheet('Warnings',
-        ['Timestamp', 'User ID', 'Username', 'Moderator', 'Reason', 'Warning Count', 'Guild ID', 'Guild Name', 'Status', 'Log Channel ID'])
-    
-    welcomes_sheet = get_or_create_sheet('Welcomes',
-        ['Guild ID', 'Guild Name', 'Message ID', 'Channel ID', 'Target Channel ID', 'Target Channel Name', 'Welcome Message', 'Created At'])
-    
-    suspicious_sheet = get_or_create_sheet('Suspicious',
-        ['Timestamp', 'Guild ID', 'Guild Name', 'Channel', 'User ID', 'Username', 'Content', 'Type'])
-    
-    config_sheet = get_or_create_sheet('Config',
-        ['Guild ID', 'Config Type', 'Value'])
+    # Метаданные + заголовки критичных листов: 2 запроса вместо ~3 на каждый лист
+    sheet_provisioner = SheetProvisioner(spreadsheet, SHEET_HEADERS)
+    sheet_provisioner.provision(CRITICAL_SHEETS)
     
-    # 📊 Лист для каналов (0=текстовый, 2=голосовой, 4=категория)
-    channels_sheet = get_or_create_sheet('Channels',
-        ['Guild ID', 'Guild Name', 'Channel ID', 'Channel Name', 'Type', 'Position', 'Category ID', 'Last Updated'])
+    activity_sheet = sheet_provisioner.get('Activity')
+    moderation_sheet = sheet_provisioner.get('Moderation')
+    punishments_sheet = sheet_provisioner.get('Punishments')
+    messages_sheet = sheet_provisioner.get('Messages')
+    warnings_sheet = sheet_provisioner.get('Warnings')
+    config_sheet = sheet_provisioner.get('Config')
     
-    # 🚩 Лист для временных комнат
-    temp_rooms_sheet = get_or_create_sheet('TempRooms',
-        ['Channel ID', 'Room Name', 'Owner ID', 'Owner Name', 'Role ID', 'Duration', 'User Limit', 'Created At', 'Expires At', 'Guild ID', 'Guild Name', 'Status'])
+    reaction_roles_sheet = sheet_provisioner.lazy('ReactionRoles')
+    welcomes_sheet = sheet_provisioner.lazy('Welcomes')
+    suspicious_sheet = sheet_provisioner.lazy('Suspicious')
+    channels_sheet = sheet_provisioner.lazy('Channels')
+    temp_rooms_sheet = sheet_provisioner.lazy('TempRooms')
     
     SHEETS_ENABLED = True
     gc = spreadsheet  # Spreadsheet для использования в AI функциях
@@ -174,91 +182,330 @@ intents = discord.Intents.all()
 bot = discord_commands.Bot(command_prefix="!", intents=intents)
 
 # --- DATA STORAGE (Fallback) ---
-reaction_roles_db = {}
-activity_log = []
+# Локальные JSON-состояния: журнал изменений + периодический снимок
+rr_store = JsonStateStore("reaction_roles.json")
+punishments_store = JsonStateStore("active_punishments.json")
+reaction_roles_db = rr_store.data
+active_punishments = punishments_store.data
+active_punishments.setdefault("mutes", {})
+active_punishments.setdefault("bans", {})
+# Журнал активности в памяти (индекс по типам и времени); с Sheets - загружается из листа Activity
+activity_store = ActivityStore()
 moderation_log = []
-active_punishments = {"mutes": {}, "bans": {}}
 bot_start_time = None
 
-# Словари для защиты от спама
-user_last_message = {}  # {user_id: timestamp}
-user_message_count = {}  # {user_id: [(timestamp, count_in_window)]}
-SPAM_THRESHOLD = 5  # сообщений за
-SPAM_WINDOW = 10  # секунд
+# Поток событий для панели (SSE): дельты вместо периодической перезагрузки
+event_bus = EventBus()
+# Версии данных серверов (растут по событиям) + кеш сериализованных ответов / ETag
+guild_cache = GuildSnapshotCache()
+# Отсортированный индекс участников; пересобирается при изменении состава ('roster')
+member_index = MemberIndexCache(lambda guild_id: guild_cache.versions(guild_id, ('roster',)))
+# Кастомные эмодзи по имени; пересобирается при on_guild_emojis_update ('emojis')
+emoji_index = EmojiIndexCache(lambda guild_id: guild_cache.versions(guild_id, ('emojis',)))
+SSE_HEARTBEAT = 15  # сек, комментарий-пинг для прокси и обнаружения разрыва
+# Билеты для ?ticket= потока событий (PIN в URL не передаётся)
+stream_tickets = StreamTickets(ttl=int(os.getenv("SSE_TICKET_TTL", 60)))
+# Под Flask/waitress каждый поток событий занимает поток WSGI на всё соединение:
+# не больше половины пула, остальное - обычным запросам (aiohttp этого ограничения не имеет)
+SSE_MAX_WSGI_STREAMS = int(os.getenv("SSE_MAX_WSGI_STREAMS", max(1, int(os.getenv("WEB_THREADS", 8)) // 2)))
+wsgi_streams = threading.BoundedSemaphore(SSE_MAX_WSGI_STREAMS)
+# Фоновые задачи (массовые операции): прогресс уходит в поток событий
+job_manager = JobManager(on_change=lambda job: event_bus.publish("job", job.guild_id, job.summary()))
+BULK_DELETE_BATCH = 100  # сообщений за один purge
+DM_CONCURRENCY = int(os.getenv("DM_CONCURRENCY", 5))  # параллельных отправок при рассылке DM
+MODERATION_CONCURRENCY = int(os.getenv("MODERATION_CONCURRENCY", 5))  # параллельных запросов при массовой модерации
+BULK_LOG_MAX_LISTED = 40  # упоминаний в сводном логе (лимит описания embed)
+BULK_ROLES_CONCURRENCY = int(os.getenv("BULK_ROLES_CONCURRENCY", 5))  # участников одновременно
+BULK_ROLES_MAX_OPERATIONS = 10000
+# Конвейер on_message: размеры очередей, воркеры, пачки записи в Sheets
+INGEST_MODERATION_QUEUE = int(os.getenv("INGEST_MODERATION_QUEUE", 2000))
+INGEST_MODERATION_WORKERS = int(os.getenv("INGEST_MODERATION_WORKERS", 4))
+# Аварийный предел: сколько on_message может ждать места в очереди модерации. Модерация сама
+# ничего не сбрасывает; только сверх этого предела on_message не ставит сообщение и пишет ошибку
+# (ingest.stats: moderation.rejected) - иначе ждущие задачи событий растут в памяти без границы
+INGEST_MESSAGE_HARD_LIMIT = int(os.getenv("INGEST_MESSAGE_HARD_LIMIT", 10000))
+INGEST_AI_QUEUE = int(os.getenv("INGEST_AI_QUEUE", 100))
+INGEST_AI_WORKERS = int(os.getenv("INGEST_AI_WORKERS", 2))
+INGEST_ANALYTICS_QUEUE = int(os.getenv("INGEST_ANALYTICS_QUEUE", 5000))
+INGEST_ANALYTICS_BATCH = 100  # сообщений за одну запись в Sheets
+INGEST_ANALYTICS_DELAY = 2.0  # сек, ожидание добора пачки
+ROLE_CHANGE_WINDOW = float(os.getenv("ROLE_CHANGE_WINDOW", 2.0))  # сек, изменения ролей участника -> одна запись Activity
+
+# Поля участника в API (fields= выбирает подмножество, id есть всегда)
+MEMBER_FIELDS = {
+    "id": lambda m: str(m.id),
+    "username": lambda m: m.name,
+    "discriminator": lambda m: m.discriminator,
+    "nick": lambda m: m.nick,
+    "avatar": lambda m: str(m.avatar.url) if m.avatar else None,
+    "bot": lambda m: m.bot,
+    "roles": lambda m: [str(r.id) for r in m.roles if r.name != "@everyone"],
+    "status": lambda m: str(m.status),
+    "joined_at": lambda m: m.joined_at.isoformat() if m.joined_at else None
+}
+MEMBERS_PAGE_DEFAULT = 100
+MEMBERS_PAGE_MAX = 1000
+
+def member_to_dict(m, fields=None):
+    return {name: MEMBER_FIELDS[name](m) for name in (fields or MEMBER_FIELDS)}
+
+def role_to_dict(r):
+    return {
+        "id": str(r.id),
+        "name": r.name,
+        "color": r.color.value,
+        "position": r.position,
+        "members": len(r.members)
+    }
 
-# Загрузка локальных данных
-if os.path.exists("reaction_roles.json"):
-    try:
-        with open("reaction_roles.json", "r", encoding='utf-8') as f:
-            reaction_roles_db = json.load(f)
-    except: pass
+def channel_to_dict(c):
+    return {
+        "id": str(c.id),
+        "name": c.name,
+        "type": c.type.value,
+        "position": c.position,
+        "topic": getattr(c, 'topic', None),
+        "category_id": str(c.category_id) if c.category_id else None
+    }
 
-if os.path.exists("active_punishments.json"):
-    try:
-        with open("active_punishments.json", "r", encoding='utf-8') as f:
-            active_punishments = json.load(f)
-    except: pass
+# Защита от спама: частота сообщений по (сервер, пользователь), пороги сервера - в spam_config.json
+# {guild_id: {"threshold": ..., "window": ..., "activity_interval": ...}}
+spam_config_store = JsonStateStore("spam_config.json")
+spam_tracker = SpamTracker(get_config=spam_config_store.data.get)
+
+# Базовые триггеры (будут использоваться, если нет в Config)
+DEFAULT_TRIGGERS = [
+    'fuck', 'shit', 'bitch', 'ass', 'damn', 'crap', 'piss', 'dick', 'cock', 'pussy',
+    'whore', 'slut', 'bastard', 'asshole', 'motherfucker', 'nigga', 'nigger', 'faggot',
+    'cunt', 'twat', 'blyat', 'blyad', 'cyka', 'suka', 'pidaras', 'pidoras', 'pizda',
+    'хуй', 'бляд', 'блять', 'пизда', 'пиздец', 'ебать', 'ебаный', 'ебало',
+    'сука', 'суки', 'пидор', 'пидар', 'говно', 'говнюк', 'мудак', 'мудила',
+    'дебил', 'идиот', 'уебок', 'дурак', 'тупой', 'лох', 'чмо', 'урод'
+]
 
 # --- ЗАГРУЗКА БАЗЫ РУГАТЕЛЬСТВ ---
 BAD_WORDS_URL = "https://raw.githubusercontent.com/LDNOOBW/List-of-Dirty-Naughty-Obscene-and-Otherwise-Bad-Words/master/ru"
-BAD_WORDS_CACHE = set()
+BAD_WORDS_CACHE_FILE = "bad_words_cache.pkl"
+BAD_WORDS_REFRESH_INTERVAL = 24 * 3600  # Проверка обновлений раз в сутки
+BAD_WORDS_CACHE = frozenset(w.lower() for w in DEFAULT_TRIGGERS)
+bad_words_meta = {"etag": None, "last_modified": None, "source": "default"}
+
+def load_bad_words_from_disk():
+    """Мгновенная загрузка базы ругательств из локального кеша"""
+    global BAD_WORDS_CACHE
+    if not os.path.exists(BAD_WORDS_CACHE_FILE):
+        return False
+    try:
+        with open(BAD_WORDS_CACHE_FILE, "rb") as f:
+            cached = pickle.load(f)
+        BAD_WORDS_CACHE = cached["words"]
+        bad_words_meta.update(etag=cached.get("etag"), last_modified=cached.get("last_modified"), source="disk")
+        print(f"✅ Загружено {len(BAD_WORDS_CACHE)} ругательных слов из локального кеша")
+        return True
+    except Exception as e:
+        print(f"⚠️ Ошибка чтения кеша ругательств: {e}")
+        return False
 
-def load_bad_words():
-    """Загрузить базу ругательств из LDNOOBW (GitHub)"""
+def save_bad_words_to_disk():
+    """Сохранить базу + ETag/Last-Modified (временный файл + rename)"""
+    tmp_path = f"{BAD_WORDS_CACHE_FILE}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump({
+            "words": BAD_WORDS_CACHE,
+            "etag": bad_words_meta["etag"],
+            "last_modified": bad_words_meta["last_modified"]
+        }, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, BAD_WORDS_CACHE_FILE)
+
+def refresh_bad_words():
+    """Условный запрос к LDNOOBW (GitHub): скачиваем список только если он изменился"""
     global BAD_WORDS_CACHE
+    headers = {}
+    if bad_words_meta["etag"]:
+        headers["If-None-Match"] = bad_words_meta["etag"]
+    if bad_words_meta["last_modified"]:
+        headers["If-Modified-Since"] = bad_words_meta["last_modified"]
     try:
-        import requests
-        response = requests.get(BAD_WORDS_URL, timeout=10)
-        if response.status_code == 200:
+        response = requests.get(BAD_WORDS_URL, headers=headers, timeout=10)
+        if response.status_code == 304:
+            print("ℹ️ База ругательств не изменилась (304)")
+        elif response.status_code == 200:
             words = response.text.strip().split('\n')
-            BAD_WORDS_CACHE = set(w.strip().lower() for w in words if w.strip())
+            BAD_WORDS_CACHE = frozenset(w.strip().lower() for w in words if w.strip())
+            bad_words_meta.update(
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+                source="github"
+            )
+            save_bad_words_to_disk()
             print(f"✅ Загружено {len(BAD_WORDS_CACHE)} ругательных слов из LDNOOBW (GitHub)")
         else:
-            print(f"⚠️ Не удалось загрузить базу ругательств: HTTP {response.status_code}")
-            BAD_WORDS_CACHE = set(DEFAULT_TRIGGERS)  # Fallback
+            print(f"⚠️ Не удалось обновить базу ругательств: HTTP {response.status_code}")
     except Exception as e:
-        print(f"⚠️ Ошибка загрузки базы: {e}")
-        BAD_WORDS_CACHE = set(DEFAULT_TRIGGERS)  # Fallback
+        print(f"⚠️ Ошибка обновления базы: {e}")
+
+def run_bad_words_refresh():
+    """Фоновое обновление базы ругательств (не блокирует запуск)"""
+    while True:
+        refresh_bad_words()
+        time.sleep(BAD_WORDS_REFRESH_INTERVAL)
 
 print("🔄 Загрузка базы ругательств...")
-load_bad_words()
+if not load_bad_words_from_disk():
+    print(f"ℹ️ Локального кеша нет, используем {len(BAD_WORDS_CACHE)} базовых триггеров до загрузки")
+threading.Thread(target=run_bad_words_refresh, daemon=True).start()
 
 # --- LOGGING FUNCTIONS ---
+# Иконки и цвета ленты активности по типу события
+ACTIVITY_ICONS = {
+    "member_join": "fas fa-user-plus",
+    "member_leave": "fas fa-user-minus",
+    "role_add": "fas fa-user-tag",
+    "role_remove": "fas fa-user-minus",
+    "role_update": "fas fa-user-edit",
+    "channel_create": "fas fa-plus",
+    "channel_delete": "fas fa-trash",
+    "reaction_role_add": "fas fa-smile",
+    "reaction_role_remove": "fas fa-frown",
+    "message_sent": "fas fa-paper-plane",
+    "message_bulk_delete": "fas fa-trash",
+    "mute": "fas fa-volume-mute",
+    "unmute": "fas fa-volume-up",
+    "kick": "fas fa-user-slash",
+    "ban": "fas fa-ban",
+    "unban": "fas fa-user-check",
+    "system": "fas fa-power-off"
+}
+
+ACTIVITY_COLORS = {
+    "member_join": "linear-gradient(135deg, #667eea 0%, #764ba2 100%)",
+    "member_leave": "linear-gradient(135deg, #ed4245 0%, #f5576c 100%)",
+    "role_add": "linear-gradient(135deg, #43e97b 0%, #38f9d7 100%)",
+    "role_remove": "linear-gradient(135deg, #ed4245 0%, #f5576c 100%)",
+    "role_update": "linear-gradient(135deg, #4facfe 0%, #00f2fe 100%)",
+    "channel_create": "linear-gradient(135deg, #4facfe 0%, #00f2fe 100%)",
+    "channel_delete": "linear-gradient(135deg, #ed4245 0%, #f5576c 100%)",
+    "reaction_role_add": "linear-gradient(135deg, #43e97b 0%, #38f9d7 100%)",
+    "reaction_role_remove": "linear-gradient(135deg, #ed4245 0%, #f5576c 100%)",
+    "message_sent": "linear-gradient(135deg, #f093fb 0%, #f5576c 100%)",
+    "message_bulk_delete": "linear-gradient(135deg, #ed4245 0%, #f5576c 100%)",
+    "mute": "linear-gradient(135deg, #faa81a 0%, #f5576c 100%)",
+    "unmute": "linear-gradient(135deg, #43e97b 0%, #38f9d7 100%)",
+    "kick": "linear-gradient(135deg, #ed4245 0%, #f5576c 100%)",
+    "ban": "linear-gradient(135deg, #ed4245 0%, #f5576c 100%)",
+    "unban": "linear-gradient(135deg, #43e97b 0%, #38f9d7 100%)",
+    "system": "linear-gradient(135deg, #43e97b 0%, #38f9d7 100%)"
+}
+
+DEFAULT_ACTIVITY_ICON = "fas fa-circle"
+DEFAULT_ACTIVITY_COLOR = "linear-gradient(135deg, #667eea 0%, #764ba2 100%)"
+
+ACTIVITY_PAGE_MAX = 1000
+# Фильтры ленты активности -> типы событий
+ACTIVITY_FILTERS = {
+    'members': ['member_join', 'member_leave'],
+    'roles': ['role_add', 'role_remove', 'role_update', 'reaction_role_add', 'reaction_role_remove'],
+    'moderation': ['mute', 'unmute', 'kick', 'ban', 'unban'],
+    'channels': ['channel_create', 'channel_delete'],
+    'messages': ['message_sent', 'message_bulk_delete'],
+    'ai': ['ai_response'],
+    'system': ['system']
+}
+
+def format_activity(entry):
+    """Запись активности (формат activity_store) -> элемент ленты для фронтенда"""
+    event_type = entry.get("type") or ''
+    username = entry.get("username") or ''
+    details = entry.get("details") or ''
+    
+    # Создаём title и description
+    if username:
+        title = f"{username}"
+    else:
+        title = event_type.replace('_', ' ').title()
+    
+    return {
+        "type": event_type,
+        "title": title,
+        "description": details,
+        "icon": ACTIVITY_ICONS.get(event_type, DEFAULT_ACTIVITY_ICON),
+        "color": ACTIVITY_COLORS.get(event_type, DEFAULT_ACTIVITY_COLOR),
+        "user_id": entry.get("user_id") or '',
+        "username": username,
+        "guild_id": entry.get("guild_id") or '',
+        "guild_name": entry.get("guild_name") or '',
+        "time": entry.get("time") or '',
+        "id": str(entry["seq"]) if "seq" in entry else ''
+    }
+
+def read_activity_sheet():
+    """Все строки листа Activity в формате activity_store (от старых к новым)"""
+    return [{
+        "type": record.get('Event Type', ''),
+        "user_id": str(record.get('User ID', '')),
+        "username": record.get('Username', ''),
+        "details": record.get('Details', ''),
+        "guild_id": str(record.get('Guild ID', '')),
+        "guild_name": record.get('Guild Name', ''),
+        "time": record.get('Timestamp', '')
+    } for record in activity_sheet.get_all_records()]
+
+def ensure_activity_loaded():
+    """Загрузить журнал из листа Activity (один раз; без Sheets - только локальные записи)"""
+    if activity_store.loaded:
+        return
+    if not (SHEETS_ENABLED and activity_sheet):
+        activity_store.mark_loaded()
+        return
+    count = activity_store.load(read_activity_sheet)
+    print(f"📊 Activity: загружено {count} записей из Google Sheets")
+
 def log_to_activity_sheet(event_type, user_id, username, details, guild_id, guild_name):
     """Логирование в Google Sheets - Activity"""
+    log_activity_batch([(event_type, user_id, username, details, guild_id, guild_name)])
+
+def log_activity_batch(records):
+    """Несколько записей Activity одним запросом: records = [(event_type, user_id, username, details, guild_id, guild_name)]"""
+    now = datetime.now()
     if SHEETS_ENABLED and activity_sheet:
         try:
-            activity_sheet.append_row([
-                datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            activity_sheet.append_rows([[
+                now.strftime('%Y-%m-%d %H:%M:%S'),
                 event_type,
                 str(user_id) if user_id else '',
                 username if username else '',
                 details,
                 str(guild_id) if guild_id else '',
                 guild_name if guild_name else ''
-            ])
+            ] for event_type, user_id, username, details, guild_id, guild_name in records])
         except Exception as e:
             print(f"⚠️ Ошибка записи в Activity: {e}")
     
     # Fallback в локальный лог
-    activity_log.insert(0, {
-        "type": event_type,
-        "user_id": str(user_id) if user_id else None,
-        "username": username,
-        "details": details,
-        "guild_id": str(guild_id) if guild_id else None,
-        "guild_name": guild_name,
-        "time": datetime.now().isoformat()
-    })
-    if len(activity_log) > 1000:
-        activity_log.pop()
+    for event_type, user_id, username, details, guild_id, guild_name in records:
+        entry = {
+            "type": event_type,
+            "user_id": str(user_id) if user_id else None,
+            "username": username,
+            "details": details,
+            "guild_id": str(guild_id) if guild_id else None,
+            "guild_name": guild_name,
+            "time": now.isoformat()
+        }
+        activity_store.append(entry)
+        event_bus.publish("activity", guild_id, format_activity(entry))
 
 def log_to_moderation_sheet(action, target_user_id, target_username, moderator, reason, duration, guild_id, guild_name):
     """Логирование в Google Sheets - Moderation"""
+    log_moderation_batch([(action, target_user_id, target_username, moderator, reason, duration, guild_id, guild_name)])
+
+def log_moderation_batch(records):
+    """Несколько записей Moderation одним запросом: records = [(action, user_id, username, moderator, reason, duration, guild_id, guild_name)]"""
+    now = datetime.now()
     if SHEETS_ENABLED and moderation_sheet:
         try:
-            moderation_sheet.append_row([
-                datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            moderation_sheet.append_rows([[
+                now.strftime('%Y-%m-%d %H:%M:%S'),
                 action,
                 str(target_user_id),
                 target_username,
@@ -267,24 +514,27 @@ def log_to_moderation_sheet(action, target_user_id, target_username, moderator,
                 duration if duration else '',
                 str(guild_id) if guild_id else '',
                 guild_name if guild_name else ''
-            ])
+            ] for action, target_user_id, target_username, moderator, reason, duration, guild_id, guild_name in records])
         except Exception as e:
             print(f"⚠️ Ошибка записи в Moderation: {e}")
     
     # Fallback
-    moderation_log.insert(0, {
-        "action": action,
-        "user_id": str(target_user_id),
-        "username": target_username,
-        "moderator": moderator,
-        "reason": reason,
-        "duration": duration,
-        "guild_id": str(guild_id) if guild_id else None,
-        "guild_name": guild_name,
-        "time": datetime.now().isoformat()
-    })
-    if len(moderation_log) > 500:
-        moderation_log.pop()
+    for action, target_user_id, target_username, moderator, reason, duration, guild_id, guild_name in records:
+        entry = {
+            "action": action,
+            "user_id": str(target_user_id),
+            "username": target_username,
+            "moderator": moderator,
+            "reason": reason,
+            "duration": duration,
+            "guild_id": str(guild_id) if guild_id else None,
+            "guild_name": guild_name,
+            "time": now.isoformat()
+        }
+        moderation_log.insert(0, entry)
+        if len(moderation_log) > 500:
+            moderation_log.pop()
+        event_bus.publish("moderation", guild_id, entry)
 
 # === AI AUTORESPONDER CONFIG ===
 AI_ENABLED = {}
@@ -480,78 +730,87 @@ def remove_excluded_channel(guild_id, channel_id):
             return False
     return False
 
-# Базовые триггеры (будут использоваться, если нет в Config)
-DEFAULT_TRIGGERS = [
-    'fuck', 'shit', 'bitch', 'ass', 'damn', 'crap', 'piss', 'dick', 'cock', 'pussy',
-    'whore', 'slut', 'bastard', 'asshole', 'motherfucker', 'nigga', 'nigger', 'faggot',
-    'cunt', 'twat', 'blyat', 'blyad', 'cyka', 'suka', 'pidaras', 'pidoras', 'pizda',
-    'хуй', 'бляд', 'блять', 'пизда', 'пиздец', 'ебать', 'ебаный', 'ебало',
-    'сука', 'суки', 'пидор', 'пидар', 'говно', 'говнюк', 'мудак', 'мудила',
-    'дебил', 'идиот', 'уебок', 'дурак', 'тупой', 'лох', 'чмо', 'урод'
-]
-
 def log_to_messages_sheet(channel_id, channel_name, message_type, content, guild_id, guild_name):
-    """Логирование в Google Sheets - Messages"""
+    """Логирование в Google Sheets - Messages (сообщения, отправленные из панели)"""
     if SHEETS_ENABLED and messages_sheet:
         try:
-            messages_sheet.append_row([
-                datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                str(channel_id),
-                channel_name,
-                message_type,
-                content[:500],  # Ограничение длины
-                'Admin Panel',
-                str(guild_id) if guild_id else '',
-                guild_name if guild_name else ''
-            ])
+            if message_type != 'normal':
+                content = f"[{message_type}] {content}"
+            # User ID пустой: сообщения панели не попадают в статистику пользователей
+            messages_sheet.append_row(message_row(time.time(), guild_id or '', guild_name or '', channel_name,
+                                                  ADMIN_PANEL_SENDER, content, None))
         except Exception as e:
             print(f"⚠️ Ошибка записи в Messages: {e}")
 
-def sync_punishments_to_sheet():
-    """Синхронизация активных наказаний с Google Sheets"""
-    if SHEETS_ENABLED and punishments_sheet:
+# Зеркало листа Punishments: ключ строки = (Punishment Type, User ID)
+punishments_mirror = SheetMirror(
+    punishments_sheet,
+    key_func=lambda row: (row[2], row[0]) if len(row) > 2 and row[0] else None
+) if SHEETS_ENABLED and punishments_sheet else None
+
+def punishment_rows():
+    """Желаемое содержимое листа Punishments из active_punishments"""
+    rows = {}
+    # Муты
+    for user_id, data in active_punishments.get("mutes", {}).items():
+        rows[('mute', str(user_id))] = [
+            str(user_id),
+            data.get('member_name', ''),
+            'mute',
+            data.get('reason', ''),
+            data.get('start_time', ''),
+            data.get('until', ''),
+            data.get('guild_id', ''),
+            '',  # guild_name можно добавить
+            'active'
+        ]
+    
+    # Баны
+    for user_id, data in active_punishments.get("bans", {}).items():
+        rows[('ban', str(user_id))] = [
+            str(user_id),
+            data.get('user_name', ''),
+            'ban',
+            data.get('reason', ''),
+            data.get('start_time', ''),
+            '',  # Перманентный бан
+            data.get('guild_id', ''),
+            '',
+            'active'
+        ]
+    return rows
+
+def sync_punishments_to_sheet(rows=None):
+    """Синхронизация активных наказаний с Google Sheets (только изменённые строки)"""
+    if punishments_mirror:
         try:
-            # Очищаем лист (кроме заголовков)
-            punishments_sheet.clear()
-            punishments_sheet.append_row(['User ID', 'Username', 'Punishment Type', 'Reason', 'Start Time', 'End Time', 'Guild ID', 'Guild Name', 'Status'])
-            
-            # Муты
-            for user_id, data in active_punishments.get("mutes", {}).items():
-                punishments_sheet.append_row([
-                    str(user_id),
-                    data.get('member_name', ''),
-                    'mute',
-                    data.get('reason', ''),
-                    data.get('start_time', ''),
-                    data.get('until', ''),
-                    data.get('guild_id', ''),
-                    '',  # guild_name можно добавить
-                    'active'
-                ])
-            
-            # Баны
-            for user_id, data in active_punishments.get("bans", {}).items():
-                punishments_sheet.append_row([
-                    str(user_id),
-                    data.get('user_name', ''),
-                    'ban',
-                    data.get('reason', ''),
-                    data.get('start_time', ''),
-                    '',  # Перманентный бан
-                    data.get('guild_id', ''),
-                    '',
-                    'active'
-                ])
+            inserted, updated, deleted = punishments_mirror.sync(punishment_rows() if rows is None else rows)
+            if inserted or updated or deleted:
+                print(f"📊 Punishments: +{inserted} ~{updated} -{deleted}")
         except Exception as e:
             print(f"⚠️ Ошибка синхронизации Punishments: {e}")
-    
-    # Локальное сохранение
-    with open("active_punishments.json", "w", encoding='utf-8') as f:
-        json.dump(active_punishments, f, ensure_ascii=False, indent=2)
 
-def save_rr_db():
-    with open("reaction_roles.json", "w", encoding='utf-8') as f:
-        json.dump(reaction_roles_db, f, ensure_ascii=False, indent=2)
+def sync_punishments_later():
+    """Из event loop: снимок наказаний - сейчас (словарь меняется в loop), запись в лист - в фоновом потоке"""
+    sheets_later(sync_punishments_to_sheet, punishment_rows())
+
+MODERATION_LOG_COLORS = {
+    'mute': discord.Color.orange(),
+    'unmute': discord.Color.green(),
+    'kick': discord.Color.red(),
+    'ban': discord.Color.dark_red(),
+    'unban': discord.Color.green(),
+    'warning': discord.Color.gold()
+}
+
+MODERATION_LOG_TITLES = {
+    'mute': '🔇 Мут',
+    'unmute': '🔊 Снятие мута',
+    'kick': '🚪 Кик',
+    'ban': '🚫 Бан',
+    'unban': '✅ Разбан',
+    'warning': '⚠️ Предупреждение'
+}
 
 async def send_moderation_log(guild, channel_id, action_type, member, reason, duration=None, moderator="Admin Panel"):
     """Отправка лога модерации в канал"""
@@ -562,34 +821,42 @@ async def send_moderation_log(guild, channel_id, action_type, member, reason, du
     if not channel:
         return
     
-    colors = {
-        'mute': discord.Color.orange(),
-        'unmute': discord.Color.green(),
-        'kick': discord.Color.red(),
-        'ban': discord.Color.dark_red(),
-        'unban': discord.Color.green(),
-        'warning': discord.Color.gold()
-    }
-    
-    titles = {
-        'mute': '🔇 Мут',
-        'unmute': '🔊 Снятие мута',
-        'kick': '🚪 Кик',
-        'ban': '🚫 Бан',
-        'unban': '✅ Разбан',
-        'warning': '⚠️ Предупреждение'
-    }
-    
     try:
         embed = discord.Embed(
-            title=titles.get(action_type, '🛡️ Модерация'),
+            title=MODERATION_LOG_TITLES.get(action_type, '🛡️ Модерация'),
             description=f"Пользователь {member.mention if hasattr(member, 'mention') else member}",
-            color=colors.get(action_type, discord.Color.blue()),
+            color=MODERATION_LOG_COLORS.get(action_type, discord.Color.blue()),
+            timestamp=datetime.now()
+        )
+        embed.add_field(name="Причина", value=reason, inline=False)
+        if duration:
+            embed.add_field(name="Длительность", value=duration, inline=True)
+        embed.set_footer(text=f"Модератор: {moderator}")
+        await channel.send(embed=embed)
+    except Exception as e:
+        print(f"⚠️ Ошибка отправки лога: {e}")
+
+async def send_bulk_moderation_log(guild, channel_id, action_type, targets, failed, reason, duration=None, moderator="Admin Panel"):
+    """Один сводный лог массового действия: targets - упоминания/имена успешно обработанных"""
+    channel = guild.get_channel(int(channel_id)) if channel_id else None
+    if not channel:
+        return
+    
+    listed = ", ".join(targets[:BULK_LOG_MAX_LISTED])
+    if len(targets) > BULK_LOG_MAX_LISTED:
+        listed += f" и ещё {len(targets) - BULK_LOG_MAX_LISTED}"
+    try:
+        embed = discord.Embed(
+            title=f"{MODERATION_LOG_TITLES.get(action_type, '🛡️ Модерация')} (массово: {len(targets)})",
+            description=listed or "Никто",
+            color=MODERATION_LOG_COLORS.get(action_type, discord.Color.blue()),
             timestamp=datetime.now()
         )
         embed.add_field(name="Причина", value=reason, inline=False)
         if duration:
             embed.add_field(name="Длительность", value=duration, inline=True)
+        if failed:
+            embed.add_field(name="Ошибки", value=str(failed), inline=True)
         embed.set_footer(text=f"Модератор: {moderator}")
         await channel.send(embed=embed)
     except Exception as e:
@@ -598,87 +865,104 @@ async def send_moderation_log(guild, channel_id, action_type, member, reason, du
 
 # ==================== SYNC CHANNELS TO EXCEL ====================
 
-def sync_channels_to_excel(guild):
-    """Синхронизировать все каналы сервера в Excel"""
-    print(f"🔍 DEBUG: SHEETS_ENABLED = {SHEETS_ENABLED}")
-    print(f"🔍 DEBUG: channels_sheet = {channels_sheet}")
-    
-    if not SHEETS_ENABLED or not channels_sheet:
+# Зеркало листа Channels: ключ строки = (Guild ID, Channel ID), "Last Updated" не сравниваем
+channels_mirror = SheetMirror(
+    channels_sheet,
+    key_func=lambda row: (row[0], row[2]) if len(row) > 2 and row[2] else None,
+    ignore_columns=(7,)
+) if SHEETS_ENABLED and channels_sheet else None
+# Запись зеркала Channels - в одном фоновом потоке: изменения каналов ложатся в порядке событий,
+# а event loop не ждёт ни загрузки листа, ни блокировки зеркала
+channels_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='channels_sync')
+
+def channel_to_sheet_row(channel):
+    """Строка листа Channels для канала (None для неподдерживаемых типов)"""
+    # Определяем тип канала
+    channel_type = None
+    if hasattr(channel, 'type'):
+        if channel.type == discord.ChannelType.text:
+            channel_type = 0  # Текстовый
+        elif channel.type == discord.ChannelType.voice:
+            channel_type = 2  # Голосовой
+        elif channel.type == discord.ChannelType.category:
+            channel_type = 4  # Категория
+    
+    if channel_type is None:
+        return None  # Пропускаем неизвестные типы
+    
+    # Получаем category_id
+    category_id = ''
+    if hasattr(channel, 'category') and channel.category:
+        category_id = str(channel.category.id)
+    
+    return [
+        str(channel.guild.id),
+        channel.guild.name,
+        str(channel.id),
+        channel.name,
+        str(channel_type),
+        str(channel.position) if hasattr(channel, 'position') else '0',
+        category_id,
+        datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    ]
+
+def guild_channel_rows(guild):
+    """Строки листа Channels сервера {(Guild ID, Channel ID): строка} - собираются в event loop бота"""
+    desired = {}
+    for channel in guild.channels:
+        row = channel_to_sheet_row(channel)
+        if row:
+            desired[(row[0], row[2])] = row
+    return desired
+
+def sync_channels_to_excel(guild_id, guild_name, desired):
+    """Синхронизировать каналы сервера в Excel (только изменения; блокирующая, в потоке channels_sync)"""
+    if not channels_mirror:
         print(f"❌ Channels sheet не включен! SHEETS_ENABLED={SHEETS_ENABLED}, channels_sheet={channels_sheet}")
         return
     
     try:
-        print(f"📊 Синхронизация каналов для guild {guild.name} (ID: {guild.id})...")
-        
-        # Получаем все каналы
-        all_channels = guild.channels
-        
-        # Очищаем старые записи этого сервера
-        existing_records = channels_sheet.get_all_records()
-        rows_to_delete = []
-        for idx, record in enumerate(existing_records, start=2):
-            if str(record.get('Guild ID')) == str(guild.id):
-                rows_to_delete.append(idx)
-        
-        # Удаляем в обратном порядке (чтобы индексы не сбивались)
-        for row_idx in reversed(rows_to_delete):
-            channels_sheet.delete_rows(row_idx)
-        
-        print(f"🗑️ Удалено {len(rows_to_delete)} старых записей каналов")
-        
-        # Добавляем новые записи
-        new_rows = []
-        for channel in all_channels:
-            # Определяем тип канала
-            channel_type = None
-            if hasattr(channel, 'type'):
-                if channel.type == discord.ChannelType.text:
-                    channel_type = 0  # Текстовый
-                elif channel.type == discord.ChannelType.voice:
-                    channel_type = 2  # Голосовой
-                elif channel.type == discord.ChannelType.category:
-                    channel_type = 4  # Категория
-            
-            if channel_type is None:
-                continue  # Пропускаем неизвестные типы
-            
-            # Получаем category_id
-            category_id = ''
-            if hasattr(channel, 'category') and channel.category:
-                category_id = str(channel.category.id)
-            
-            # Добавляем строку
-            new_rows.append([
-                str(guild.id),
-                guild.name,
-                str(channel.id),
-                channel.name,
-                str(channel_type),
-                str(channel.position) if hasattr(channel, 'position') else '0',
-                category_id,
-                datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            ])
+        print(f"📊 Синхронизация каналов для guild {guild_name} (ID: {guild_id})...")
         
-        # Массово добавляем все строки
-        if new_rows:
-            channels_sheet.append_rows(new_rows)
-            print(f"✅ Синхронизировано {len(new_rows)} каналов:")
-            
-            # Подсчёт по типам
-            text_count = sum(1 for row in new_rows if row[4] == '0')
-            voice_count = sum(1 for row in new_rows if row[4] == '2')
-            category_count = sum(1 for row in new_rows if row[4] == '4')
-            
-            print(f"   📝 Текстовых: {text_count}")
-            print(f"   🔊 Голосовых: {voice_count}")
-            print(f"   📂 Категорий: {category_count}")
+        guild_key = str(guild_id)
+        inserted, updated, deleted = channels_mirror.sync(desired, scope=lambda key: key[0] == guild_key)
+        
+        if inserted or updated or deleted:
+            print(f"✅ Каналы синхронизированы: +{inserted} ~{updated} -{deleted} (всего {len(desired)})")
         else:
-            print("⚠️ Нет каналов для синхронизации")
+            print(f"✅ Каналы без изменений ({len(desired)})")
     
     except Exception as e:
         print(f"❌ Ошибка синхронизации каналов: {e}")
         traceback.print_exc()
 
+def sync_channel_to_excel(key, row=None):
+    """Инкрементальная синхронизация одного канала; row=None - удалить строку (блокирующая, в потоке)"""
+    if not channels_mirror:
+        return
+    
+    try:
+        if row:
+            channels_mirror.patch(upserts={key: row})
+        else:
+            channels_mirror.patch(removals=[key])
+    except Exception as e:
+        print(f"⚠️ Ошибка синхронизации канала {key[1]}: {e}")
+
+async def sync_guild_channels(guild):
+    """Полная синхронизация сервера: каналы читаются в event loop, лист пишется в потоке channels_sync"""
+    desired = guild_channel_rows(guild)
+    await asyncio.get_running_loop().run_in_executor(
+        channels_executor, sync_channels_to_excel, guild.id, guild.name, desired)
+
+def sync_channel_later(channel, deleted=False):
+    """События create/update/delete: строка собирается в event loop, запись - в потоке channels_sync"""
+    if not channels_mirror:
+        return
+    key = (str(channel.guild.id), str(channel.id))
+    row = None if deleted else channel_to_sheet_row(channel)
+    asyncio.get_running_loop().run_in_executor(channels_executor, sync_channel_to_excel, key, row)
+
 def get_text_channels_from_excel(guild_id):
     """Получить список текстовых каналов из Excel"""
     if not SHEETS_ENABLED or not channels_sheet:
@@ -765,64 +1049,114 @@ def add_warning(user_id, username, moderator, reason, guild_id, guild_name, log_
 
 def clear_user_warnings(user_id, guild_id):
     """Очистить все предупреждения пользователя (при бане)"""
+    clear_users_warnings([user_id], guild_id)
+
+def clear_users_warnings(user_ids, guild_id):
+    """Очистить предупреждения нескольких пользователей: одно чтение листа и одна пакетная запись"""
     if SHEETS_ENABLED and warnings_sheet:
         try:
+            user_ids = {str(u) for u in user_ids}
             all_records = warnings_sheet.get_all_records()
-            # Находим все строки с активными предупреждениями
-            for idx, record in enumerate(all_records, start=2):  # +2 потому что заголовки в строке 1
-                if (str(record.get('User ID')) == str(user_id) 
-                    and str(record.get('Guild ID')) == str(guild_id)
-                    and record.get('Status') == 'active'):
-                    # Меняем статус на 'cleared'
-                    warnings_sheet.update_cell(idx, 9, 'cleared')  # Колонка Status (№9)
-            print(f"✅ Предупреждения очищены для user_id={user_id}")
+            # Находим все строки с активными предупреждениями (+2: заголовки в строке 1)
+            rows = [
+                idx for idx, record in enumerate(all_records, start=2)
+                if str(record.get('User ID')) in user_ids
+                and str(record.get('Guild ID')) == str(guild_id)
+                and record.get('Status') == 'active'
+            ]
+            if rows:
+                # Меняем статус на 'cleared' (колонка Status - I)
+                warnings_sheet.batch_update([{'range': f'I{idx}', 'values': [['cleared']]} for idx in rows])
+            print(f"✅ Предупреждения очищены для {', '.join(sorted(user_ids))}")
         except Exception as e:
             print(f"⚠️ Ошибка очистки Warnings: {e}")
 
 # --- DISCORD BOT EVENTS ---
+SCAN_CONCURRENCY = int(os.getenv("SCAN_CONCURRENCY", 5))  # Каналов одновременно
+SCAN_HISTORY_LIMIT = 50  # Сообщений на канал за проход
+# Отметки последнего просмотренного сообщения: {channel_id: message_id}
+scan_state_store = JsonStateStore("scan_state.json")
+scan_task = None
+
+async def scan_channel_reactions(guild, channel, semaphore):
+    """Просмотреть новые сообщения канала (после отметки) и найти сообщения бота с реакциями"""
+    channel_key = str(channel.id)
+    high_water = scan_state_store.data.get(channel_key)
+    found = 0
+    newest_id = int(high_water) if high_water else 0
+    
+    async with semaphore:
+        if high_water:
+            history = channel.history(limit=SCAN_HISTORY_LIMIT, after=discord.Object(id=int(high_water)))
+        else:
+            history = channel.history(limit=SCAN_HISTORY_LIMIT)
+        
+        async for message in history:
+            newest_id = max(newest_id, message.id)
+            
+            # Только сообщения бота с реакциями
+            if message.author != bot.user or not message.reactions:
+                continue
+            
+            message_id = str(message.id)
+            # Пропускаем уже известные сообщения
+            if message_id in reaction_roles_db or message_id in welcome_configs:
+                continue
+            
+            # Добавляем как ненастроенное сообщение с реакциями
+            reactions_data = []
+            for reaction in message.reactions:
+                reactions_data.append({
+                    "emoji": str(reaction.emoji),
+                    "role_id": None  # Не настроена
+                })
+            
+            rr_store.set(message_id, {
+                "channel_id": str(channel.id),
+                "guild_id": str(guild.id),
+                "message": message.content or "[Без текста]",
+                "reactions": reactions_data,
+                "unconfigured": True  # Маркер ненастроенного сообщения
+            })
+            found += 1
+            print(f"  ✅ Найдено: #{channel.name} - {len(reactions_data)} реакций")
+    
+    if newest_id and str(newest_id) != high_water:
+        scan_state_store.set(channel_key, str(newest_id))
+    return found
+
 async def scan_reaction_messages():
-    """Сканирование сообщений бота с реакциями для автообнаружения"""
+    """
+    Сканирование сообщений бота с реакциями для автообнаружения.
+    Каналы обрабатываются параллельно (не больше SCAN_CONCURRENCY),
+    в каждом читаются только сообщения новее сохранённой отметки.
+    """
     print("🔍 Сканирование сообщений с реакциями...")
-    found_count = 0
+    semaphore = asyncio.Semaphore(SCAN_CONCURRENCY)
     
+    tasks = []
     for guild in bot.guilds:
         for channel in guild.text_channels:
-            try:
-                # Проверяем последние 50 сообщений в каждом канале
-                async for message in channel.history(limit=50):
-                    # Только сообщения бота с реакциями
-                    if message.author == bot.user and message.reactions:
-                        message_id = str(message.id)
-                        
-                        # Пропускаем уже известные сообщения
-                        if message_id in reaction_roles_db or message_id in welcome_configs:
-                            continue
-                        
-                        # Добавляем как ненастроенное сообщение с реакциями
-                        reactions_data = []
-                        for reaction in message.reactions:
-                            reactions_data.append({
-                                "emoji": str(reaction.emoji),
-                                "role_id": None  # Не настроена
-                            })
-                        
-                        reaction_roles_db[message_id] = {
-                            "channel_id": str(channel.id),
-                            "guild_id": str(guild.id),
-                            "message": message.content or "[Без текста]",
-                            "reactions": reactions_data,
-                            "unconfigured": True  # Маркер ненастроенного сообщения
-                        }
-                        found_count += 1
-                        print(f"  ✅ Найдено: #{channel.name} - {len(reactions_data)} реакций")
-            except Exception as e:
-                continue  # Пропускаем каналы без доступа
+            # Каналы без доступа к истории пропускаем без запроса к API
+            if not channel.permissions_for(guild.me).read_message_history:
+                continue
+            tasks.append(scan_channel_reactions(guild, channel, semaphore))
+    
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    found_count = sum(r for r in results if isinstance(r, int))
     
     if found_count > 0:
-        save_rr_db()
-        print(f"✅ Автообнаружение: найдено {found_count} сообщений с реакциями")
+        print(f"✅ Автообнаружение: найдено {found_count} сообщений с реакциями ({len(tasks)} каналов)")
     else:
-        print("ℹ️ Новых сообщений с реакциями не найдено")
+        print(f"ℹ️ Новых сообщений с реакциями не найдено ({len(tasks)} каналов)")
+
+def start_reaction_scan():
+    """Запустить сканирование в фоне (повторный запуск, пока идёт текущий, пропускается)"""
+    global scan_task
+    if scan_task and not scan_task.done():
+        return scan_task
+    scan_task = bot.loop.create_task(scan_reaction_messages())
+    return scan_task
 
 # ========== АВТОМАТИЧЕСКОЕ СНЯТИЕ МУТОВ ==========
 async def check_expired_mutes():
@@ -875,7 +1209,7 @@ async def check_expired_mutes():
                                         print(f"⚠️ Ошибка отправки лога автоснятия: {log_error}")
                                 
                                 # Логируем в Google Sheets
-                                log_to_moderation_sheet(
+                                sheets_later(log_to_moderation_sheet,
                                     "unmute", 
                                     user_id, 
                                     member.name, 
@@ -885,7 +1219,7 @@ async def check_expired_mutes():
                                     guild_id, 
                                     guild.name
                                 )
-                                log_to_activity_sheet(
+                                sheets_later(log_to_activity_sheet,
                                     "unmute", 
                                     member.id, 
                                     member.name, 
@@ -906,10 +1240,10 @@ async def check_expired_mutes():
             # Удаляем истекшие муты из словаря
             for user_id in expired_mutes:
                 if user_id in active_punishments["mutes"]:
-                    del active_punishments["mutes"][user_id]
+                    punishments_store.delete(("mutes", user_id))
             
             if expired_mutes:
-                sync_punishments_to_sheet()
+                sync_punishments_later()
                 print(f"✅ Автоснято мутов: {len(expired_mutes)}")
         
         except Exception as e:
@@ -918,153 +1252,141 @@ async def check_expired_mutes():
         # Проверяем каждые 30 секунд
         await asyncio.sleep(30)
 
+# ========== ЭТАПЫ ЗАПУСКА (фон после on_ready) ==========
+startup = StartupOrchestrator()
+mute_checker_task = None
+
+@startup.stage('mute_expiry', priority=0)
+async def start_mute_expiry():
+    """🔄 Автопроверка истечения мутов - запускается первой и один раз за процесс"""
+    global mute_checker_task
+    if mute_checker_task is None or mute_checker_task.done():
+        mute_checker_task = bot.loop.create_task(check_expired_mutes())
+
+@startup.stage('temp_rooms', priority=1)
+async def restore_temp_rooms():
+    """🚩 Загрузка активных временных комнат из Google Sheets"""
+    if not SHEETS_ENABLED or not temp_rooms_sheet:
+        return
+    print("🚩 Загружаю активные временные комнаты из Google Sheets...")
+    records = await asyncio.to_thread(temp_rooms_sheet.get_all_records)
+    load_active_rooms_from_sheet(records)
+
+@startup.stage('startup_log', priority=1, blocking=True)
+def log_startup():
+    log_to_activity_sheet("system", None, "System", f"Бот {bot.user.name} запущен", None, None)
+
+@startup.stage('activity_index', priority=2, blocking=True)
+def load_activity():
+    """📊 Журнал активности из Google Sheets в память (после записи о запуске)"""
+    ensure_activity_loaded()
+
+@startup.stage('reaction_scan', priority=2, once=False)
+async def run_reaction_scan():
+    """Автообнаружение сообщений с реакциями (только новые сообщения)"""
+    await start_reaction_scan()
+
+@startup.stage('channels_sync', priority=2, once=False)
+async def sync_all_channels():
+    """📊 Синхронизация каналов в Excel (только изменения)"""
+    print("\n📊 Синхронизирую все каналы в Excel...")
+    for guild in list(bot.guilds):
+        await sync_guild_channels(guild)
+    print("✅ Синхронизация каналов завершена!\n")
+
 @bot.event
 async def on_ready():
     global bot_start_time
-    bot_start_time = datetime.now()
+    if bot_start_time is None:
+        bot_start_time = datetime.now()
     print(f'✅ Bot запущен: {bot.user.name} ({bot.user.id})')
+    # Новая сессия: кеш гильдий discord.py пересобран - сбрасываем закешированные ответы
+    guild_cache.bump_all()
     print(f'🌐 Серверов: {len(bot.guilds)}')
     for guild in bot.guilds:
         print(f'  - {guild.name} (ID: {guild.id})')
     
-    # Автообнаружение сообщений с реакциями
-    await scan_reaction_messages()
-    
-    # 📊 АВТОМАТИЧЕСКАЯ СИНХРОНИЗАЦИЯ КАНАЛОВ В EXCEL!
-    print("\n📊 Синхронизирую все каналы в Excel...")
-    for guild in bot.guilds:
-        sync_channels_to_excel(guild)
-    print("✅ Синхронизация каналов завершена!\n")
-    
-    # 🚩 ЗАГРУЗКА АКТИВНЫХ ВРЕМЕННЫХ КОМНАТ
-    print("🚩 Загружаю активные временные комнаты из Google Sheets...")
-    load_active_rooms_from_sheet()
-    
-    log_to_activity_sheet("system", None, "System", f"Бот {bot.user.name} запущен", None, None)
-    
-    # 🔄 ЗАПУСК АВТОПРОВЕРКИ ИСТЕЧЕНИЯ МУТОВ
-    bot.loop.create_task(check_expired_mutes())
+    # Этапы запуска идут в фоне: once-этапы не повторяются при новой сессии
+    startup.start(bot.loop)
 
 @bot.event
-async def on_message(message):
-    """Логирование всех сообщений от пользователей (не ботов)"""
-    # Игнорируем сообщения от самого бота
-    if message.author.bot:
+async def on_resumed():
+    # RESUME: состояние сессии сохранено, повторный запуск этапов не нужен
+    print("🔄 Соединение с Discord восстановлено (RESUME)")
+
+# === КОНВЕЙЕР СООБЩЕНИЙ ===
+# on_message только раскладывает сообщение по очередям этапов:
+# moderation (спам, команды) - не теряет ничего, ai и analytics - отбрасываются при перегрузке
+ingest = IngestPipeline()
+
+def ai_prompt_for(message):
+    """Текст запроса к AI или None, если бот не должен отвечать (DM - всегда, на сервере - по упоминанию)"""
+    if message.guild is None:
+        return message.content.strip()
+    if not get_ai_enabled(str(message.guild.id)):
+        return None
+    # Убираем упоминание бота из текста
+    user_prompt = message.content
+    for mention in message.mentions:
+        user_prompt = user_prompt.replace(f'<@{mention.id}>', '').replace(f'<@!{mention.id}>', '')
+    return user_prompt.strip()
+
+@ingest.stage('ai', maxsize=INGEST_AI_QUEUE, droppable=True, workers=INGEST_AI_WORKERS)
+async def ingest_ai(message):
+    """AI автоответчик"""
+    user_prompt = await asyncio.to_thread(ai_prompt_for, message)
+    if not user_prompt:
         return
-    
-    # === AI АВТООТВЕТЧИК ===
-    # Проверяем упоминание бота (на сервере) или ЛЮБОЕ сообщение в DM
     is_dm = message.guild is None
-    should_respond = False
-    
-    if is_dm:
-        # В DM бот отвечает всегда
-        should_respond = True
-        guild_id = "DM"
-        user_prompt = message.content.strip()
-    elif bot.user in message.mentions:
-        # На сервере - только если упомянули
-        guild_id = str(message.guild.id)
-        if get_ai_enabled(guild_id):
-            should_respond = True
-            # Убираем упоминание бота из текста
-            user_prompt = message.content
-            for mention in message.mentions:
-                user_prompt = user_prompt.replace(f'<@{mention.id}>', '').replace(f'<@!{mention.id}>', '')
-            user_prompt = user_prompt.strip()
-    
-    if should_respond and user_prompt:
-        try:
-            async with message.channel.typing():
-                ai_response = await ai_generate_response(user_prompt, guild_id, str(message.author.id), message.guild, message)
-            
-            # Проверяем команду DM
-            if ai_response.startswith("DM_COMMAND:"):
-                dm_text = ai_response.replace("DM_COMMAND:", "").strip()
-                try:
-                    await message.author.send(dm_text)
-                    await message.reply("✅ Сообщение отправлено в личку!")
-                    print(f"📨 DM отправлен {message.author.name}: {dm_text[:30]}...")
-                except Exception as e:
-                    await message.reply(f"❌ Не удалось отправить DM: {e}")
-                    print(f"❌ Ошибка DM: {e}")
-            else:
-                # Обычный ответ
-                await message.reply(ai_response)
-                print(f"🤖 AI ответил {message.author.name} ({'DM' if is_dm else 'server'}): {ai_response[:50]}...")
-            
-            # Логируем AI ответ в Activity
-            log_to_activity_sheet(
-                "ai_response",
-                message.author.id,
-                message.author.name,
-                f"AI ответил: {user_prompt[:50]}...",
-                message.guild.id if message.guild else None,
-                message.guild.name if message.guild else "DM"
-            )
-        except Exception as e:
-            print(f"❌ Ошибка AI: {e}")
-            import traceback
-            traceback.print_exc()
-            await message.reply("Чё-то сломалось, пиши потом.")
-    
+    guild_id = "DM" if is_dm else str(message.guild.id)
+    try:
+        async with message.channel.typing():
+            ai_response = await ai_generate_response(user_prompt, guild_id, str(message.author.id), message.guild, message)
+        
+        # Проверяем команду DM
+        if ai_response.startswith("DM_COMMAND:"):
+            dm_text = ai_response.replace("DM_COMMAND:", "").strip()
+            try:
+                await message.author.send(dm_text)
+                await message.reply("✅ Сообщение отправлено в личку!")
+                print(f"📨 DM отправлен {message.author.name}: {dm_text[:30]}...")
+            except Exception as e:
+                await message.reply(f"❌ Не удалось отправить DM: {e}")
+                print(f"❌ Ошибка DM: {e}")
+        else:
+            # Обычный ответ
+            await message.reply(ai_response)
+            print(f"🤖 AI ответил {message.author.name} ({'DM' if is_dm else 'server'}): {ai_response[:50]}...")
+        
+        # Логируем AI ответ в Activity
+        log_activity_later((
+            "ai_response",
+            message.author.id,
+            message.author.name,
+            f"AI ответил: {user_prompt[:50]}...",
+            message.guild.id if message.guild else None,
+            message.guild.name if message.guild else "DM"
+        ))
+    except Exception as e:
+        print(f"❌ Ошибка AI: {e}")
+        traceback.print_exc()
+        await message.reply("Чё-то сломалось, пиши потом.")
+
+@ingest.stage('moderation', maxsize=INGEST_MODERATION_QUEUE, workers=INGEST_MODERATION_WORKERS,
+              key=lambda item: item[0].channel.id)
+async def ingest_moderation(item):
+    """
+    Защита от спама и команды; результат проверки уходит в аналитику.
+    Сообщения одного канала - у одного воркера: команды выполняются в порядке отправки.
+    """
+    message, received_at = item
     user_id = str(message.author.id)
     guild_id = str(message.guild.id) if message.guild else None
-    current_time = datetime.now()
-    
-    # === ЗАЩИТА ОТ СПАМА (для Activity Stats) ===
-    # Засчитываем только 1 сообщение в 5 секунд
-    should_log_activity = True
-    if user_id in user_last_message:
-        time_diff = (current_time - user_last_message[user_id]).total_seconds()
-        if time_diff < 5:
-            should_log_activity = False
-    
-    if should_log_activity:
-        user_last_message[user_id] = current_time
-    
-    # === ДЕТЕКЦИЯ СПАМА (быстрая отправка) ===
-    is_spam = False
-    if user_id not in user_message_count:
-        user_message_count[user_id] = []
-    
-    # Удаляем старые записи (старше SPAM_WINDOW секунд)
-    user_message_count[user_id] = [
-        (ts, c) for ts, c in user_message_count[user_id]
-        if (current_time - ts).total_seconds() < SPAM_WINDOW
-    ]
-    
-    # Добавляем текущее сообщение
-    user_message_count[user_id].append((current_time, 1))
-    
-    # Проверяем, превышен ли порог
-    if len(user_message_count[user_id]) > SPAM_THRESHOLD:
-        is_spam = True
     
-    # Логируем в Messages sheet для Activity Stats (только если не спам)
-    if should_log_activity and SHEETS_ENABLED and messages_sheet:
-        try:
-            sent_by = f"{message.author.name} ({message.author.id})"
-            messages_sheet.append_row([
-                datetime.now().strftime('%Y-%m-%d %H:%M:%S'),  # Timestamp
-                str(message.guild.id) if message.guild else 'DM',  # Guild ID
-                message.guild.name if message.guild else 'Direct Message',  # Guild Name
-                message.channel.name if hasattr(message.channel, 'name') else 'DM',  # Channel
-                sent_by,  # Sent By (Username (ID))
-                message.content[:500]  # Content (обрезаем до 500 символов)
-            ])
-        except Exception as e:
-            print(f"❌ Error logging message: {e}")
-    
-    # Логируем в Activity sheet
-    log_to_activity_sheet(
-        "message", 
-        message.author.id, 
-        message.author.name,
-        f"Отправил сообщение в #{message.channel.name if hasattr(message.channel, 'name') else 'DM'}",
-        message.guild.id if message.guild else None,
-        message.guild.name if message.guild else None
-    )
+    # Для Activity Stats засчитываем не больше 1 сообщения за activity_interval;
+    # спам - больше threshold сообщений за window секунд
+    should_log_activity, is_spam = spam_tracker.check(guild_id, user_id, now=received_at)
+    await ingest.submit('analytics', (message, received_at, should_log_activity and not is_spam))
     
     # === ПРОВЕРКА НА ПОДОЗРИТЕЛЬНОСТЬ (ОТКЛЮЧЕНА - ТОЛЬКО AI) ===
     # Триггеры отключены - используется только AI для общения
@@ -1074,68 +1396,181 @@ async def on_message(message):
     # Обрабатываем команды
     await bot.process_commands(message)
 
+def write_message_batch(rows, records):
+    """Пачка сообщений: Messages - одним append_rows, Activity - одним log_activity_batch"""
+    if rows and SHEETS_ENABLED and messages_sheet:
+        try:
+            messages_sheet.append_rows(rows)
+        except Exception as e:
+            print(f"❌ Error logging messages: {e}")
+    if records:
+        log_activity_batch(records)
+
+@ingest.stage('analytics', maxsize=INGEST_ANALYTICS_QUEUE, droppable=True,
+              batch_size=INGEST_ANALYTICS_BATCH, batch_delay=INGEST_ANALYTICS_DELAY)
+async def ingest_analytics(items):
+    """Статистика активности: лист Messages (без спама и не чаще activity_interval) и Activity"""
+    rows = []
+    records = []
+    for message, received_at, count_message in items:
+        channel_name = message.channel.name if hasattr(message.channel, 'name') else 'DM'
+        if count_message:
+            rows.append(message_row(
+                received_at,
+                message.guild.id if message.guild else 'DM',
+                message.guild.name if message.guild else 'Direct Message',
+                channel_name,
+                f"{message.author.name} ({message.author.id})",  # Sent By (Username (ID))
+                message.content,
+                message.author.id
+            ))
+        records.append((
+            "message",
+            message.author.id,
+            message.author.name,
+            f"Отправил сообщение в #{channel_name}",
+            message.guild.id if message.guild else None,
+            message.guild.name if message.guild else None
+        ))
+    await asyncio.to_thread(write_message_batch, rows, records)
+
+@bot.event
+async def on_message(message):
+    """Логирование всех сообщений от пользователей (не ботов)"""
+    # Игнорируем сообщения от самого бота
+    if message.author.bot:
+        return
+    
+    received_at = time.time()
+    if ingest.waiting('moderation') >= INGEST_MESSAGE_HARD_LIMIT:
+        ingest.reject('moderation', f"ждут места {INGEST_MESSAGE_HARD_LIMIT}+ сообщений")
+        return
+    # AI АВТООТВЕТЧИК: в DM - на любое сообщение, на сервере - при упоминании бота
+    # (при перегрузке модерации ai и analytics сбрасываются раньше, чем она начнёт ждать)
+    if message.guild is None or bot.user in message.mentions:
+        await ingest.submit('ai', message)
+    await ingest.submit('moderation', (message, received_at))
+
 @bot.event
 async def on_member_join(member):
-    log_to_activity_sheet("member_join", member.id, member.name, 
+    guild_cache.bump(member.guild.id, 'guild', 'members', 'roster')
+    event_bus.publish("member_join", member.guild.id, member_to_dict(member))
+    sheets_later(log_to_activity_sheet, "member_join", member.id, member.name, 
                           f"Присоединился к серверу", member.guild.id, member.guild.name)
 
 @bot.event
 async def on_member_remove(member):
-    log_to_activity_sheet("member_leave", member.id, member.name,
+    guild_cache.bump(member.guild.id, 'guild', 'members', 'roles', 'roster')
+    event_bus.publish("member_leave", member.guild.id, {"id": str(member.id)})
+    sheets_later(log_to_activity_sheet, "member_leave", member.id, member.name,
                           f"Покинул сервер", member.guild.id, member.guild.name)
 
+# Изменения ролей одного участника за окно -> одна запись Activity (пачкой, в фоновом потоке)
+role_changes = RoleChangeCoalescer(lambda records: log_activity_later(*records), window=ROLE_CHANGE_WINDOW)
+
 @bot.event
 async def on_member_update(before, after):
-    if before.roles != after.roles:
-        added = [r for r in after.roles if r not in before.roles]
-        removed = [r for r in before.roles if r not in after.roles]
-        for role in added:
-            log_to_activity_sheet("role_add", after.id, after.name,
-                                 f"Получил роль: {role.name}", after.guild.id, after.guild.name)
-        for role in removed:
-            log_to_activity_sheet("role_remove", after.id, after.name,
-                                 f"Потерял роль: {role.name}", after.guild.id, after.guild.name)
+    added, removed = diff_roles(before.roles, after.roles)
+    roles_changed = bool(added or removed)
+    # Счётчики участников у ролей меняются вместе со списком ролей участника;
+    # индекс участников (roster) зависит от ника и ролей
+    guild_cache.bump(after.guild.id, 'members', 'roster', *(('roles',) if roles_changed else ()))
+    event_bus.publish("member_update", after.guild.id, member_to_dict(after))
+    if roles_changed:
+        role_changes.add(after, added, removed)
+
+@bot.event
+async def on_user_update(before, after):
+    # Имя, глобальное имя и аватар - на уровне пользователя: on_member_update на серверах не приходит
+    for guild in after.mutual_guilds:
+        guild_cache.bump(guild.id, 'members', 'roster')
+        member = guild.get_member(after.id)
+        if member:
+            event_bus.publish("member_update", guild.id, member_to_dict(member))
+
+@bot.event
+async def on_presence_update(before, after):
+    # Статус входит в список участников; прочие изменения присутствия (активность) - нет
+    if before.status != after.status:
+        guild_cache.bump(after.guild.id, 'members')
+
+@bot.event
+async def on_guild_update(before, after):
+    guild_cache.bump(after.id, 'guild')
+
+@bot.event
+async def on_guild_emojis_update(guild, before, after):
+    guild_cache.bump(guild.id, 'emojis')
+
+@bot.event
+async def on_guild_role_create(role):
+    guild_cache.bump(role.guild.id, 'roles')
+    event_bus.publish("role_create", role.guild.id, role_to_dict(role))
+
+@bot.event
+async def on_guild_role_delete(role):
+    # Роль пропадает и из списков ролей участников
+    guild_cache.bump(role.guild.id, 'roles', 'members', 'roster')
+    event_bus.publish("role_delete", role.guild.id, {"id": str(role.id)})
+
+@bot.event
+async def on_guild_role_update(before, after):
+    guild_cache.bump(after.guild.id, 'roles')
+    event_bus.publish("role_update", after.guild.id, role_to_dict(after))
 
 @bot.event
 async def on_guild_channel_create(channel):
+    guild_cache.bump(channel.guild.id, 'channels')
+    event_bus.publish("channel_create", channel.guild.id, channel_to_dict(channel))
     channel_type = {0: "текстовый", 2: "голосовой", 4: "категория"}.get(channel.type.value, "неизвестный")
-    log_to_activity_sheet("channel_create", None, None,
+    sheets_later(log_to_activity_sheet, "channel_create", None, None,
                          f"Создан {channel_type} канал: {channel.name}", channel.guild.id, channel.guild.name)
+    sync_channel_later(channel)
 
 @bot.event
 async def on_guild_channel_delete(channel):
-    log_to_activity_sheet("channel_delete", None, None,
+    guild_cache.bump(channel.guild.id, 'channels')
+    event_bus.publish("channel_delete", channel.guild.id, {"id": str(channel.id)})
+    sheets_later(log_to_activity_sheet, "channel_delete", None, None,
                          f"Удалён канал: {channel.name}", channel.guild.id, channel.guild.name)
+    sync_channel_later(channel, deleted=True)
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    guild_cache.bump(after.guild.id, 'channels')
+    event_bus.publish("channel_update", after.guild.id, channel_to_dict(after))
+    # Пишем в Excel только если изменились отслеживаемые поля (имя, позиция, категория)
+    sync_channel_later(after)
 
 @bot.event
 async def on_raw_reaction_remove(payload):
-    key = f"{payload.message_id}"
-    if key in reaction_roles_db:
-        rr_data = reaction_roles_db[key]
-        for reaction in rr_data.get("reactions", []):
-            if str(payload.emoji) == reaction["emoji"]:
-                guild = bot.get_guild(payload.guild_id)
-                if guild:
-                    member = guild.get_member(payload.user_id)
-                    role = guild.get_role(int(reaction["role_id"]))
-                    if member and role:
-                        await member.remove_roles(role)
-                        log_to_activity_sheet("reaction_role_remove", member.id, member.name,
-                                             f"Потерял роль {role.name} при удалении реакции", guild.id, guild.name)
-                break
+    role_id = reaction_index.role_for(payload.message_id, payload.emoji)
+    if role_id is None:
+        return
+    guild = bot.get_guild(payload.guild_id)
+    if guild:
+        member = guild.get_member(payload.user_id)
+        role = guild.get_role(role_id)
+        if member and role:
+            await member.remove_roles(role)
+            log_activity_later(("reaction_role_remove", member.id, member.name,
+                                f"Потерял роль {role.name} при удалении реакции", guild.id, guild.name))
 
 # Система приветствий по реакциям
-welcome_configs = {}  # {message_id: {"guild_id": ..., "target_channel_id": ..., "message": ...}}
+# {message_id: {"guild_id": ..., "target_channel_id": ..., "message": ...}}
 
-def save_welcome_db():
-    with open("welcomes.json", "w", encoding='utf-8') as f:
-        json.dump(welcome_configs, f, ensure_ascii=False, indent=2)
+welcome_store = JsonStateStore("welcomes.json")
+welcome_configs = welcome_store.data
+# (message_id, эмодзи) -> роль и message_id -> приветствие; пересобирается при изменении конфигов
+reaction_index = ReactionIndex(rr_store, welcome_store)
 
-if os.path.exists("welcomes.json"):
-    try:
-        with open("welcomes.json", "r", encoding='utf-8') as f:
-            welcome_configs = json.load(f)
-    except: pass
+def sheets_later(func, *args):
+    """Блокирующая запись в Google Sheets в фоновом потоке - event loop (бот и API) не ждёт"""
+    asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+def log_activity_later(*records):
+    """Запись в Activity в фоновом потоке - не задерживает обработчик события"""
+    sheets_later(log_activity_batch, list(records))
 
 @bot.event
 async def on_raw_reaction_add(payload):
@@ -1151,49 +1586,120 @@ async def on_raw_reaction_add(payload):
     if not member:
         return
     
-    # ЛОГИРУЕМ ВСЕ РЕАКЦИИ ДЛЯ СТАТИСТИКИ
-    log_to_activity_sheet("add_reaction", member.id, member.name,
-                         f"Добавил реакцию {payload.emoji}", guild.id, guild.name)
-    
-    # Проверяем систему приветствий
-    if str(payload.message_id) in welcome_configs:
-        config = welcome_configs[str(payload.message_id)]
-        target_channel = bot.get_channel(int(config["target_channel_id"]))
-        if target_channel:
-            welcome_msg = config["message"].replace("{user}", member.mention).replace("{username}", member.name)
-            await target_channel.send(welcome_msg)
-            log_to_activity_sheet("welcome_sent", member.id, member.name,
-                                 f"Отправлено приветствие в #{target_channel.name}", guild.id, guild.name)
-    
-    # Роли за реакции
-    key = f"{payload.message_id}"
-    if key in reaction_roles_db:
-        rr_data = reaction_roles_db[key]
-        for reaction in rr_data.get("reactions", []):
-            if str(payload.emoji) == reaction["emoji"]:
-                role = guild.get_role(int(reaction["role_id"]))
-                if role:
-                    await member.add_roles(role)
-                    log_to_activity_sheet("reaction_role_add", member.id, member.name,
-                                         f"Получил роль {role.name} за реакцию", guild.id, guild.name)
-                break
+    # ЛОГИРУЕМ ВСЕ РЕАКЦИИ ДЛЯ СТАТИСТИКИ (одной записью после выдачи роли)
+    records = [("add_reaction", member.id, member.name,
+                f"Добавил реакцию {payload.emoji}", guild.id, guild.name)]
+    
+    try:
+        # Роли за реакции - в первую очередь
+        role_id = reaction_index.role_for(payload.message_id, payload.emoji)
+        if role_id is not None:
+            role = guild.get_role(role_id)
+            if role:
+                await member.add_roles(role)
+                records.append(("reaction_role_add", member.id, member.name,
+                                f"Получил роль {role.name} за реакцию", guild.id, guild.name))
+        
+        # Проверяем систему приветствий
+        welcome = reaction_index.welcome_for(payload.message_id)
+        if welcome:
+            target_channel_id, template = welcome
+            target_channel = bot.get_channel(target_channel_id)
+            if target_channel:
+                welcome_msg = template.replace("{user}", member.mention).replace("{username}", member.name)
+                await target_channel.send(welcome_msg)
+                records.append(("welcome_sent", member.id, member.name,
+                                f"Отправлено приветствие в #{target_channel.name}", guild.id, guild.name))
+    finally:
+        log_activity_later(*records)
 
 # --- FLASK APP ---
 app = Flask(__name__, static_folder='.', static_url_path='')
 CORS(app, resources={r"/*": {"origins": "*"}})
+# Быстрый JSON (orjson, если установлен) и сжатие ответов больше порога
+app.json = FastJSONProvider(app)
+compressor = ResponseCompressor(min_size=int(os.getenv("COMPRESS_MIN_SIZE", 1024)))
+
+@app.after_request
+def compress_response(response):
+    return compressor(response, request)
+
+def is_authorized(auth_header):
+    """Проверка заголовка Authorization (любой из трёх PIN)"""
+    return bool(auth_header) and auth_header in (
+        f"Bearer {ADMIN_PIN}", f"Bearer {ROOM_MANAGER_PIN}", f"Bearer {MODERATION_PIN}"
+    )
 
 def require_auth(f):
     def wrapper(*args, **kwargs):
-        auth_header = request.headers.get('Authorization')
-        # Проверяем оба пароля
-        if not auth_header or (auth_header != f"Bearer {ADMIN_PIN}" and auth_header != f"Bearer {ROOM_MANAGER_PIN}" and auth_header != f"Bearer {MODERATION_PIN}"):
+        if not is_authorized(request.headers.get('Authorization')):
             return jsonify({"error": "Unauthorized"}), 401
         return f(*args, **kwargs)
     wrapper.__name__ = f.__name__
     return wrapper
 
-# --- ROUTES ---
-@app.route('/')
+def cached_guild_response(guild_id, name, sections, build, query=''):
+    """
+    JSON-ответ по данным сервера: тело кешируется по версиям разделов,
+    ETag из версий, If-None-Match -> 304 без сборки и сериализации.
+    """
+    # ETag считается по одним версиям разделов: совпал - тело даже не достаём из кеша
+    etag = guild_cache.etag(guild_id, name, sections, query)
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        etag, body = guild_cache.get_or_build(
+            guild_id, name, sections, lambda: dumps_bytes(build()), query
+        )
+        response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    # Браузер хранит ответ, но каждый раз перепроверяет его по ETag
+    response.cache_control.no_cache = True
+    response.cache_control.private = True
+    return response.make_conditional(request)
+
+# Async-маршруты: выполняются в event loop бота.
+# WEB_SERVER=aiohttp (по умолчанию) - обслуживаются напрямую (await), остальные маршруты - через WSGI-мост;
+# flask | waitress - запасной режим: каждый async-маршрут занимает поток WSGI до ответа бота
+WEB_SERVER = os.getenv("WEB_SERVER", "aiohttp").lower()
+ASYNC_ROUTES = []  # [(rule, methods, handler)]
+
+def bot_route(rule, methods, timeout=10):
+    """
+    Декоратор async-обработчика API: handler(data, **url_params) -> (payload, status).
+    data - параметры запроса + JSON тела. Авторизация как у require_auth.
+    """
+    def decorator(handler):
+        def flask_view(**kwargs):
+            data = request.args.to_dict()
+            body = request.get_json(silent=True)
+            if isinstance(body, dict):
+                data.update(body)
+            try:
+                future = asyncio.run_coroutine_threadsafe(handler(data, **kwargs), bot.loop)
+                payload, status = future.result(timeout=timeout)
+            except Exception as e:
+                print(f"❌ {handler.__name__}: {e}")
+                traceback.print_exc()
+                return jsonify({"error": str(e)}), 500
+            return jsonify(payload), status
+        flask_view.__name__ = handler.__name__
+        app.add_url_rule(rule, handler.__name__, require_auth(flask_view), methods=methods)
+        ASYNC_ROUTES.append((rule, methods, handler))
+        return handler
+    return decorator
+
+def job_accepted(job):
+    """Ответ на запуск фоновой задачи: 202 + id и адрес для опроса"""
+    return {"job_id": job.id, "state": job.state, "status_url": f"/api/jobs/{job.id}"}, 202
+
+async_api = AsyncApiServer(ASYNC_ROUTES, is_authorized, wsgi_app=app, port=PORT,
+                           wsgi_threads=int(os.getenv("WEB_THREADS", 8)),
+                           event_bus=event_bus, sse_heartbeat=SSE_HEARTBEAT,
+                           compress_min_size=compressor.min_size, stream_tickets=stream_tickets)
+
+# --- ROUTES ---
+@app.route('/')
 def index():
     return send_file('login.html')
 
@@ -1260,9 +1766,89 @@ def bot_info():
         "discriminator": bot.user.discriminator if bot.user else "0000",
         "avatar": str(bot.user.avatar.url) if bot.user and bot.user.avatar else None,
         "guilds_count": len(bot.guilds),
-        "uptime": uptime
+        "uptime": uptime,
+        "startup": startup.status(),
+        "events": event_bus.stats(),
+        "guild_cache": guild_cache.stats(),
+        "member_index": member_index.stats(),
+        "emoji_index": emoji_index.stats(),
+        "reaction_index": reaction_index.stats(),
+        "role_changes": role_changes.stats(),
+        "spam_tracker": spam_tracker.stats(),
+        "ingest": ingest.stats(),
+        "compression": compressor.stats(),
+        "jobs": job_manager.stats()
     })
 
+def stream_authorized():
+    """EventSource не умеет передавать заголовки - принимается также ?ticket= (POST /api/events/ticket)"""
+    return is_authorized(request.headers.get('Authorization')) or stream_tickets.valid(request.args.get('ticket'))
+
+@app.route('/api/events/ticket', methods=['POST'])
+@require_auth
+def events_ticket():
+    """Короткоживущий билет для подключения к потоку событий"""
+    return jsonify({"ticket": stream_tickets.issue(), "expires_in": stream_tickets.ttl})
+
+@app.route('/api/events/stream', methods=['GET'])
+def events_stream():
+    """Поток событий панели (SSE): дельты участников, ролей, каналов, активности и модерации"""
+    if not stream_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    if not wsgi_streams.acquire(blocking=False):
+        # Пул потоков WSGI не должен уйти целиком на открытые вкладки; клиент перейдёт на опрос
+        response = jsonify({"error": "Слишком много подключений к потоку событий", "retry": True})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    
+    guild_id = request.args.get('guild_id')
+    last_event_id = parse_last_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    subscription = event_bus.subscribe(Subscription(guild_id), last_event_id)
+    closed = threading.Event()
+    
+    def close():
+        # Вызывается и при закрытии ответа до первого чтения генератора
+        if not closed.is_set():
+            closed.set()
+            event_bus.unsubscribe(subscription)
+            wsgi_streams.release()
+    
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                if subscription.overflowed:
+                    # Клиент отстал - пусть перезагрузит снимок
+                    yield EventBus.format_sse(event_bus.resync_event())
+                    return
+                event = subscription.get(SSE_HEARTBEAT)
+                yield EventBus.format_sse(event) if event else ": ping\n\n"
+        finally:
+            close()
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(close)
+    return response
+
+@app.route('/api/bot/readiness', methods=['GET'])
+@require_auth
+def bot_readiness():
+    """Флаги готовности: подключение к Discord и этапы фонового запуска"""
+    status = startup.status()
+    return jsonify({
+        "discord_ready": bot.is_ready(),
+        "sheets_enabled": SHEETS_ENABLED,
+        **status
+    }), 200 if status["ready"] else 503
+
+@app.route('/api/system/sheets-quota', methods=['GET'])
+@require_auth
+def sheets_quota():
+    """Состояние ограничителя Sheets API: глубина очереди, токены, повторы"""
+    return jsonify({"enabled": SHEETS_ENABLED, **sheets_limiter.stats()})
+
 @app.route('/api/guilds', methods=['GET'])
 @require_auth
 def get_guilds():
@@ -1291,50 +1877,103 @@ def get_guild_full(guild_id):
         print(f"⚠️ Сервер {guild_id} не найден. Доступные: {available_guilds}")
         return jsonify({"error": "Сервер не найден", "available": available_guilds}), 404
     
-    members = [{
-        "id": str(m.id),
-        "username": m.name,
-        "discriminator": m.discriminator,
-        "nick": m.nick,
-        "avatar": str(m.avatar.url) if m.avatar else None,
-        "bot": m.bot,
-        "roles": [str(r.id) for r in m.roles if r.name != "@everyone"],
-        "status": str(m.status),
-        "joined_at": m.joined_at.isoformat() if m.joined_at else None
-    } for m in guild.members]
-    
-    channels = [{
-        "id": str(c.id),
-        "name": c.name,
-        "type": c.type.value,
-        "position": c.position,
-        "topic": getattr(c, 'topic', None)
-    } for c in guild.channels]
+    try:
+        member_query = parse_member_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    def build():
+        extra = {}
+        if member_query:
+            members, next_cursor, total = query_members(guild, member_query)
+            extra = {"members_next_cursor": next_cursor, "members_total": total}
+        else:
+            members = [member_to_dict(m) for m in guild.members]
+        
+        channels = [channel_to_dict(c) for c in guild.channels]
+        
+        roles = [role_to_dict(r) for r in guild.roles if r.name != "@everyone"]
+        
+        return {
+            "guild": {
+                "id": str(guild.id),
+                "name": guild.name,
+                "icon": str(guild.icon.url) if guild.icon else None,
+                "member_count": guild.member_count
+            },
+            "members": members,
+            "channels": sorted(channels, key=lambda x: x['position']),
+            "roles": sorted(roles, key=lambda x: -x['position']),
+            **extra
+        }
     
-    roles = [{
-        "id": str(r.id),
-        "name": r.name,
-        "color": r.color.value,
-        "position": r.position,
-        "members": len(r.members)
-    } for r in guild.roles if r.name != "@everyone"]
+    return cached_guild_response(guild.id, 'full', GuildSnapshotCache.SECTIONS, build,
+                                 member_query_key(member_query))
+
+def parse_member_query(args):
+    """
+    Параметры выборки участников: cursor, limit, fields, role, status, q.
+    None - параметров нет (полный список, как раньше). ValueError - некорректные значения.
+    """
+    if not any(k in args for k in ('cursor', 'limit', 'fields', 'role', 'status', 'q')):
+        return None
     
-    return jsonify({
-        "guild": {
-            "id": str(guild.id),
-            "name": guild.name,
-            "icon": str(guild.icon.url) if guild.icon else None,
-            "member_count": guild.member_count
-        },
-        "members": members,
-        "channels": sorted(channels, key=lambda x: x['position']),
-        "roles": sorted(roles, key=lambda x: -x['position'])
-    })
+    def split(name):
+        return [v.strip() for v in args.get(name, '').split(',') if v.strip()]
+    
+    fields = split('fields')
+    unknown = [f for f in fields if f not in MEMBER_FIELDS]
+    if unknown:
+        raise ValueError(f"Неизвестные поля: {', '.join(unknown)}")
+    if fields and 'id' not in fields:
+        fields.insert(0, 'id')
+    
+    try:
+        limit = int(args.get('limit', MEMBERS_PAGE_DEFAULT))
+        role_ids = [int(r) for r in split('role')]
+    except ValueError:
+        raise ValueError("limit и role должны быть числами")
+    if limit < 1:
+        raise ValueError("limit должен быть больше 0")
+    
+    cursor = args.get('cursor') or None
+    if cursor:
+        decode_cursor(cursor)  # проверяем заранее, чтобы ответить 400
+    
+    return {
+        "fields": fields or None,
+        "role_ids": role_ids,
+        "statuses": split('status'),
+        "prefix": args.get('q', '').strip() or None,
+        "cursor": cursor,
+        "limit": min(limit, MEMBERS_PAGE_MAX)
+    }
+
+def member_query_key(member_query):
+    """Ключ кеша ответа для набора параметров выборки"""
+    if not member_query:
+        return ''
+    return json.dumps(member_query, sort_keys=True, ensure_ascii=False)
+
+def query_members(guild, member_query):
+    """(members, next_cursor, total) по индексу участников сервера"""
+    members, next_cursor, total = member_index.get(guild).query(
+        role_ids=member_query['role_ids'],
+        statuses=member_query['statuses'],
+        prefix=member_query['prefix'],
+        cursor=member_query['cursor'],
+        limit=member_query['limit']
+    )
+    return [member_to_dict(m, member_query['fields']) for m in members], next_cursor, total
 
 @app.route('/api/guilds/<guild_id>/members', methods=['GET'])
 @require_auth
 def get_guild_members(guild_id):
-    """Получить список участников сервера"""
+    """
+    Получить список участников сервера.
+    Без параметров - полный список. С cursor/limit/fields/role/status/q -
+    страница {members, next_cursor, total} по индексу участников.
+    """
     if not bot.is_ready():
         return jsonify({"error": "Бот ещё не готов", "retry": True}), 503
     
@@ -1342,19 +1981,20 @@ def get_guild_members(guild_id):
     if not guild:
         return jsonify({"error": "Сервер не найден"}), 404
     
-    members = [{
-        "id": str(m.id),
-        "username": m.name,
-        "discriminator": m.discriminator,
-        "nick": m.nick,
-        "avatar": str(m.avatar.url) if m.avatar else None,
-        "bot": m.bot,
-        "roles": [str(r.id) for r in m.roles if r.name != "@everyone"],
-        "status": str(m.status),
-        "joined_at": m.joined_at.isoformat() if m.joined_at else None
-    } for m in guild.members]
+    try:
+        member_query = parse_member_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    if not member_query:
+        return cached_guild_response(guild.id, 'members', ('members',),
+                                     lambda: [member_to_dict(m) for m in guild.members])
     
-    return jsonify(members), 200
+    def build():
+        members, next_cursor, total = query_members(guild, member_query)
+        return {"members": members, "next_cursor": next_cursor, "total": total}
+    
+    return cached_guild_response(guild.id, 'members', ('members',), build, member_query_key(member_query))
 
 @app.route('/api/guilds/<guild_id>/roles', methods=['GET'])
 @require_auth
@@ -1367,522 +2007,597 @@ def get_guild_roles(guild_id):
     if not guild:
         return jsonify({"error": "Сервер не найден"}), 404
     
-    roles = [{
-        "id": str(r.id),
-        "name": r.name,
-        "color": r.color.value,
-        "position": r.position,
-        "members": len(r.members)
-    } for r in guild.roles if r.name != "@everyone"]
+    def build():
+        roles = [role_to_dict(r) for r in guild.roles if r.name != "@everyone"]
+        return sorted(roles, key=lambda x: -x['position'])
     
-    return jsonify(sorted(roles, key=lambda x: -x['position'])), 200
+    return cached_guild_response(guild.id, 'roles', ('roles',), build)
 
-@app.route('/api/channels/<channel_id>/messages', methods=['GET'])
-@require_auth
-def get_messages(channel_id):
+@bot_route('/api/channels/<channel_id>/messages', methods=['GET'])
+async def get_messages(data, channel_id):
     """Получить сообщения из канала"""
     channel = bot.get_channel(int(channel_id))
     if not channel:
-        return jsonify({"error": "Канал не найден"}), 404
+        return {"error": "Канал не найден"}, 404
     
     # Получаем параметр limit (по умолчанию 20, макс 100)
-    limit = min(int(request.args.get('limit', 20)), 100)
-    
-    async def fetch_messages():
-        messages_list = []
-        async for message in channel.history(limit=limit):
-            # Пропускаем сообщения от ботов (опционально)
-            # if message.author.bot:
-            #     continue
-            
-            messages_list.append({
-                "id": str(message.id),
-                "content": message.content,
-                "author": message.author.name,
-                "author_id": str(message.author.id),
-                "timestamp": message.created_at.isoformat(),
-                "attachments": len(message.attachments),
-                "embeds": len(message.embeds),
-                "channel_id": str(message.channel.id)
-            })
-        return messages_list
+    limit = min(int(data.get('limit', 20)), 100)
     
-    try:
-        future = asyncio.run_coroutine_threadsafe(fetch_messages(), bot.loop)
-        messages = future.result(timeout=10)
-        return jsonify(messages), 200
-    except Exception as e:
-        print(f"❌ Ошибка загрузки сообщений: {e}")
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+    messages_list = []
+    async for message in channel.history(limit=limit):
+        # Пропускаем сообщения от ботов (опционально)
+        # if message.author.bot:
+        #     continue
+        
+        messages_list.append({
+            "id": str(message.id),
+            "content": message.content,
+            "author": message.author.name,
+            "author_id": str(message.author.id),
+            "timestamp": message.created_at.isoformat(),
+            "attachments": len(message.attachments),
+            "embeds": len(message.embeds),
+            "channel_id": str(message.channel.id)
+        })
+    return messages_list, 200
 
-@app.route('/api/channels/<channel_id>/messages', methods=['POST'])
-@require_auth
 def parse_emoji(text, guild):
     """
     Преобразует формат :emoji_name: в Discord эмодзи
-    Ищет кастомные эмодзи на сервере по имени
+    Ищет кастомные эмодзи на сервере по имени (индекс сервера, без учёта регистра)
     """
     if not text or not guild:
         return text
-    
-    import re
-    
-    # Паттерн для поиска :emoji_name:
-    pattern = r':([a-zA-Z0-9_]+):'
-    
-    def replace_emoji(match):
-        emoji_name = match.group(1)
-        # Ищем кастомный эмодзи на сервере
-        for emoji in guild.emojis:
-            if emoji.name.lower() == emoji_name.lower():
-                return str(emoji)  # <:name:id>
-        # Если не нашли, оставляем как есть
-        return match.group(0)
-    
-    return re.sub(pattern, replace_emoji, text)
+    return emoji_index.get(guild).replace(text)
 
-def send_message(channel_id):
+@bot_route('/api/channels/<channel_id>/messages', methods=['POST'])
+async def send_message(data, channel_id):
     channel = bot.get_channel(int(channel_id))
-    if not channel: return jsonify({"error": "Канал не найден"}), 404
-    data = request.json
+    if not channel: return {"error": "Канал не найден"}, 404
     content = data.get('content')
     embed_data = data.get('embed')
     guild = channel.guild
     
-    async def send():
-        if embed_data:
-            # Парсим эмодзи в embed
-            title = parse_emoji(embed_data.get('title', ''), guild)
-            description = parse_emoji(embed_data.get('description', ''), guild)
-            
-            embed = discord.Embed(
-                title=title,
-                description=description,
-                color=embed_data.get('color', 0x5865F2)
-            )
-            msg = await channel.send(embed=embed)
-            log_to_messages_sheet(channel.id, channel.name, 'embed',
-                                 f"{title}: {description[:100]}",
-                                 channel.guild.id, channel.guild.name)
-        else:
-            # Парсим эмодзи в обычном сообщении
-            parsed_content = parse_emoji(content, guild)
-            msg = await channel.send(parsed_content)
-            log_to_messages_sheet(channel.id, channel.name, 'normal', parsed_content,
-                                 channel.guild.id, channel.guild.name)
+    if embed_data:
+        # Парсим эмодзи в embed
+        title = parse_emoji(embed_data.get('title', ''), guild)
+        description = parse_emoji(embed_data.get('description', ''), guild)
         
-        log_to_activity_sheet("message_sent", None, "Admin Panel",
-                             f"Сообщение отправлено в #{channel.name}", channel.guild.id, channel.guild.name)
-        return msg
+        embed = discord.Embed(
+            title=title,
+            description=description,
+            color=embed_data.get('color', 0x5865F2)
+        )
+        msg = await channel.send(embed=embed)
+        sheets_later(log_to_messages_sheet, channel.id, channel.name, 'embed',
+                             f"{title}: {description[:100]}",
+                             channel.guild.id, channel.guild.name)
+    else:
+        # Парсим эмодзи в обычном сообщении
+        parsed_content = parse_emoji(content, guild)
+        msg = await channel.send(parsed_content)
+        sheets_later(log_to_messages_sheet, channel.id, channel.name, 'normal', parsed_content,
+                             channel.guild.id, channel.guild.name)
     
-    future = asyncio.run_coroutine_threadsafe(send(), bot.loop)
-    msg = future.result(timeout=10)
-    return jsonify({"id": str(msg.id), "success": True})
+    sheets_later(log_to_activity_sheet, "message_sent", None, "Admin Panel",
+                         f"Сообщение отправлено в #{channel.name}", channel.guild.id, channel.guild.name)
+    return {"id": str(msg.id), "success": True}, 200
 
-@app.route('/api/guilds/<guild_id>/members/send-dm', methods=['POST'])
-@require_auth
-def send_dm_to_members(guild_id):
-    """Отправить личные сообщения выбранным пользователям"""
-    try:
-        data = request.json
-        user_ids = data.get('user_ids', [])
-        content = data.get('content', '')
-        embed_data = data.get('embed')
-        
-        if not user_ids:
-            return jsonify({"error": "Выберите хотя бы одного пользователя"}), 400
-        
-        if not content and not embed_data:
-            return jsonify({"error": "Содержимое сообщения пусто"}), 400
-        
-        guild = bot.get_guild(int(guild_id))
-        if not guild:
-            return jsonify({"error": "Сервер не найден"}), 404
+@bot_route('/api/guilds/<guild_id>/members/send-dm', methods=['POST'])
+async def send_dm_to_members(data, guild_id):
+    """Отправить личные сообщения выбранным пользователям (фоновая задача)"""
+    user_ids = data.get('user_ids', [])
+    content = data.get('content', '')
+    embed_data = data.get('embed')
+    
+    if not user_ids:
+        return {"error": "Выберите хотя бы одного пользователя"}, 400
+    
+    if not content and not embed_data:
+        return {"error": "Содержимое сообщения пусто"}, 400
+    
+    guild = bot.get_guild(int(guild_id))
+    if not guild:
+        return {"error": "Сервер не найден"}, 404
+    
+    user_ids = dedupe(user_ids)
+    
+    # Содержимое одинаково для всех получателей - готовим один раз
+    if embed_data:
+        payload = {"embed": discord.Embed(
+            title=parse_emoji(embed_data.get('title', ''), guild),
+            description=parse_emoji(embed_data.get('description', ''), guild),
+            color=embed_data.get('color', 0x5865F2)
+        )}
+    else:
+        payload = {"content": parse_emoji(content, guild)}
+    
+    async def run(job):
+        job.set_total(len(user_ids))
+        failed_users = []
+        counts = {"sent": 0}
+        names = {}
         
-        async def send_dms():
-            success_count = 0
-            failed_users = []
-            
-            for user_id in user_ids:
-                try:
-                    member = guild.get_member(int(user_id))
-                    if not member:
-                        failed_users.append(f"ID:{user_id} (не найден)")
-                        continue
-                    
-                    if embed_data:
-                        # Парсим эмодзи в embed
-                        title = parse_emoji(embed_data.get('title', ''), guild)
-                        description = parse_emoji(embed_data.get('description', ''), guild)
-                        
-                        embed = discord.Embed(
-                            title=title,
-                            description=description,
-                            color=embed_data.get('color', 0x5865F2)
-                        )
-                        await member.send(embed=embed)
-                    else:
-                        # Парсим эмодзи в обычном сообщении
-                        parsed_content = parse_emoji(content, guild)
-                        await member.send(parsed_content)
-                    
-                    success_count += 1
-                    print(f"✅ DM отправлен {member.name} ({member.id})")
-                    
-                except discord.Forbidden:
-                    failed_users.append(f"{member.name} (закрыты ЛС)")
-                except Exception as e:
-                    failed_users.append(f"{user_id} ({str(e)[:30]})")
-            
-            return success_count, failed_users
+        def on_result(user_id, outcome):
+            if outcome["status"] == "sent":
+                counts["sent"] += 1
+            else:
+                failed_users.append(f"{names.get(user_id, 'ID:' + user_id)} ({outcome['error']})")
+            job.advance({"user_id": user_id, **outcome})
         
-        future = asyncio.run_coroutine_threadsafe(send_dms(), bot.loop)
-        success_count, failed_users = future.result(timeout=30)
+        recipients = []
+        for user_id in user_ids:
+            member = guild.get_member(int(user_id)) if user_id.isdigit() else None
+            if member:
+                names[user_id] = member.name
+                recipients.append((user_id, member))
+            else:
+                on_result(user_id, {"status": "failed", "error": "не найден", "attempts": 0})
         
-        log_to_activity_sheet("dm_sent", None, "Admin Panel",
-                             f"Отправлено DM: {success_count} успешно, {len(failed_users)} ошибок",
-                             guild.id, guild.name)
+        try:
+            await DmBroadcaster(concurrency=DM_CONCURRENCY).run(
+                recipients, lambda member: member.send(**payload), on_result
+            )
+        finally:
+            # И при отмене фиксируем, сколько успели отправить
+            sheets_later(log_to_activity_sheet, "dm_sent", None, "Admin Panel",
+                                 f"Отправлено DM: {counts['sent']} успешно, {len(failed_users)} ошибок"
+                                 + (" (отменено)" if job.cancel_requested else ""),
+                                 guild.id, guild.name)
+            print(f"📧 DM отправка завершена: {counts['sent']}/{len(user_ids)}")
         
-        result = {
+        return {
             "success": True,
-            "sent": success_count,
+            "sent": counts["sent"],
             "failed": len(failed_users),
             "failed_users": failed_users
         }
-        
-        print(f"📧 DM отправка завершена: {success_count}/{len(user_ids)}")
-        return jsonify(result), 200
-        
-    except Exception as e:
-        print(f"❌ Error sending DMs: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+    
+    return job_accepted(job_manager.submit("send_dm", run, guild.id, params={"recipients": len(user_ids)}))
 
-@app.route('/api/channels/<channel_id>/messages/bulk-delete', methods=['POST'])
-@require_auth
-def bulk_delete(channel_id):
+@bot_route('/api/channels/<channel_id>/messages/bulk-delete', methods=['POST'])
+async def bulk_delete(data, channel_id):
+    """Удалить последние limit сообщений канала (фоновая задача, порциями по 100)"""
     channel = bot.get_channel(int(channel_id))
-    if not channel: return jsonify({"error": "Канал не найден"}), 404
-    data = request.json
-    limit = data.get('limit', 10)
-    
-    async def delete():
-        deleted = await channel.purge(limit=limit)
-        log_to_activity_sheet("message_bulk_delete", None, "Admin Panel",
-                             f"Удалено {len(deleted)} сообщений в #{channel.name}",
-                             channel.guild.id, channel.guild.name)
-        return len(deleted)
+    if not channel: return {"error": "Канал не найден"}, 404
+    limit = int(data.get('limit', 10))
+    if limit < 1:
+        return {"error": "limit должен быть больше 0"}, 400
+    
+    async def run(job):
+        job.set_total(limit)
+        deleted = 0
+        try:
+            while deleted < limit:
+                batch = await channel.purge(limit=min(BULK_DELETE_BATCH, limit - deleted))
+                if not batch:
+                    break
+                deleted += len(batch)
+                job.advance(count=len(batch))
+        finally:
+            sheets_later(log_to_activity_sheet, "message_bulk_delete", None, "Admin Panel",
+                                 f"Удалено {deleted} сообщений в #{channel.name}",
+                                 channel.guild.id, channel.guild.name)
+        return {"deleted": deleted, "success": True}
     
-    future = asyncio.run_coroutine_threadsafe(delete(), bot.loop)
-    count = future.result(timeout=30)
-    return jsonify({"deleted": count, "success": True})
+    return job_accepted(job_manager.submit("bulk_delete", run, channel.guild.id, params={"limit": limit}))
 
-@app.route('/api/guilds/<guild_id>/members/<user_id>/timeout', methods=['POST'])
-@require_auth
-def timeout_member(guild_id, user_id):
+@bot_route('/api/guilds/<guild_id>/members/<user_id>/timeout', methods=['POST'])
+async def timeout_member(data, guild_id, user_id):
     guild = bot.get_guild(int(guild_id))
-    if not guild: return jsonify({"error": "Сервер не найден"}), 404
+    if not guild: return {"error": "Сервер не найден"}, 404
     member = guild.get_member(int(user_id))
-    if not member: return jsonify({"error": "Участник не найден"}), 404
-    data = request.json
+    if not member: return {"error": "Участник не найден"}, 404
     duration = data.get('duration', 60)
     reason = data.get('reason', 'Нарушение правил')
     log_channel_id = data.get('log_channel_id')
     
-    async def mute():
-        until = discord.utils.utcnow() + timedelta(seconds=duration)
-        await member.timeout(until, reason=reason)
-        
-        active_punishments["mutes"][str(user_id)] = {
-            "guild_id": str(guild_id),
-            "reason": reason,
-            "until": until.isoformat(),
-            "start_time": datetime.now().isoformat(),
-            "moderator": "Admin Panel",
-            "member_name": member.name,
-            "log_channel_id": log_channel_id  # Сохраняем канал для уведомления
-        }
-        print(f"✅ MUTE: Сохранён log_channel_id = {log_channel_id} для user_id = {user_id}")
-        sync_punishments_to_sheet()
-        log_to_moderation_sheet("mute", user_id, member.name, "Admin Panel", reason, f"{duration}s", guild_id, guild.name)
-        log_to_activity_sheet("mute", member.id, member.name, f"Замучен на {duration}с. Причина: {reason}", guild.id, guild.name)
-        
-        # Отправляем лог в канал
-        if log_channel_id:
-            await send_moderation_log(guild, log_channel_id, 'mute', member, reason, f"{duration}с")
+    until = discord.utils.utcnow() + timedelta(seconds=duration)
+    await member.timeout(until, reason=reason)
+    
+    punishments_store.set(("mutes", str(user_id)), {
+        "guild_id": str(guild_id),
+        "reason": reason,
+        "until": until.isoformat(),
+        "start_time": datetime.now().isoformat(),
+        "moderator": "Admin Panel",
+        "member_name": member.name,
+        "log_channel_id": log_channel_id  # Сохраняем канал для уведомления
+    })
+    print(f"✅ MUTE: Сохранён log_channel_id = {log_channel_id} для user_id = {user_id}")
+    sync_punishments_later()
+    sheets_later(log_to_moderation_sheet, "mute", user_id, member.name, "Admin Panel", reason, f"{duration}s", guild_id, guild.name)
+    sheets_later(log_to_activity_sheet, "mute", member.id, member.name, f"Замучен на {duration}с. Причина: {reason}", guild.id, guild.name)
+    
+    # Отправляем лог в канал
+    if log_channel_id:
+        await send_moderation_log(guild, log_channel_id, 'mute', member, reason, f"{duration}с")
     
-    future = asyncio.run_coroutine_threadsafe(mute(), bot.loop)
-    future.result(timeout=10)
-    return jsonify({"success": True})
+    return {"success": True}, 200
 
-@app.route('/api/guilds/<guild_id>/members/<user_id>/untimeout', methods=['POST'])
-@require_auth
-def untimeout_member(guild_id, user_id):
+@bot_route('/api/guilds/<guild_id>/members/<user_id>/untimeout', methods=['POST'])
+async def untimeout_member(data, guild_id, user_id):
     guild = bot.get_guild(int(guild_id))
-    if not guild: return jsonify({"error": "Сервер не найден"}), 404
+    if not guild: return {"error": "Сервер не найден"}, 404
     member = guild.get_member(int(user_id))
-    if not member: return jsonify({"error": "Участник не найден"}), 404
-    
-    async def unmute():
-        await member.timeout(None)
-        
-        # Получаем log_channel_id из сохранённых данных
-        log_channel_id = None
-        if str(user_id) in active_punishments["mutes"]:
-            log_channel_id = active_punishments["mutes"][str(user_id)].get("log_channel_id")
-            print(f"🔍 UNMUTE: log_channel_id = {log_channel_id}")
-            del active_punishments["mutes"][str(user_id)]
-            sync_punishments_to_sheet()
-        else:
-            print(f"⚠️ UNMUTE: user_id {user_id} не найден в active_punishments['mutes']")
-        
-        log_to_moderation_sheet("unmute", user_id, member.name, "Admin Panel", "Мут снят", None, guild_id, guild.name)
-        log_to_activity_sheet("unmute", member.id, member.name, "Мут снят", guild.id, guild.name)
-        
-        # Отправляем уведомление в тот же канал
-        if log_channel_id:
-            print(f"✅ UNMUTE: Отправляем уведомление в канал {log_channel_id}")
-            await send_moderation_log(guild, log_channel_id, 'unmute', member, 'Мут снят', None)
-        else:
-            print(f"❌ UNMUTE: log_channel_id пустой, уведомление не отправлено")
+    if not member: return {"error": "Участник не найден"}, 404
     
-    future = asyncio.run_coroutine_threadsafe(unmute(), bot.loop)
-    future.result(timeout=10)
-    return jsonify({"success": True})
+    await member.timeout(None)
+    
+    # Получаем log_channel_id из сохранённых данных
+    log_channel_id = None
+    if str(user_id) in active_punishments["mutes"]:
+        log_channel_id = active_punishments["mutes"][str(user_id)].get("log_channel_id")
+        print(f"🔍 UNMUTE: log_channel_id = {log_channel_id}")
+        punishments_store.delete(("mutes", str(user_id)))
+        sync_punishments_later()
+    else:
+        print(f"⚠️ UNMUTE: user_id {user_id} не найден в active_punishments['mutes']")
+    
+    sheets_later(log_to_moderation_sheet, "unmute", user_id, member.name, "Admin Panel", "Мут снят", None, guild_id, guild.name)
+    sheets_later(log_to_activity_sheet, "unmute", member.id, member.name, "Мут снят", guild.id, guild.name)
+    
+    # Отправляем уведомление в тот же канал
+    if log_channel_id:
+        print(f"✅ UNMUTE: Отправляем уведомление в канал {log_channel_id}")
+        await send_moderation_log(guild, log_channel_id, 'unmute', member, 'Мут снят', None)
+    else:
+        print(f"❌ UNMUTE: log_channel_id пустой, уведомление не отправлено")
+    
+    return {"success": True}, 200
 
-@app.route('/api/guilds/<guild_id>/members/<user_id>/kick', methods=['POST'])
-@require_auth
-def kick_member(guild_id, user_id):
+@bot_route('/api/guilds/<guild_id>/members/<user_id>/kick', methods=['POST'])
+async def kick_member(data, guild_id, user_id):
     guild = bot.get_guild(int(guild_id))
-    if not guild: return jsonify({"error": "Сервер не найден"}), 404
+    if not guild: return {"error": "Сервер не найден"}, 404
     member = guild.get_member(int(user_id))
-    if not member: return jsonify({"error": "Участник не найден"}), 404
-    data = request.json
+    if not member: return {"error": "Участник не найден"}, 404
     reason = data.get('reason', 'Нарушение правил')
     log_channel_id = data.get('log_channel_id')
     
-    async def kick():
-        member_name = member.name
-        member_obj = member  # Сохраняем до кика
-        await member.kick(reason=reason)
-        log_to_moderation_sheet("kick", user_id, member_name, "Admin Panel", reason, None, guild_id, guild.name)
-        log_to_activity_sheet("kick", user_id, member_name, f"Кикнут. Причина: {reason}", guild.id, guild.name)
-        
-        # Отправляем лог
-        if log_channel_id:
-            await send_moderation_log(guild, log_channel_id, 'kick', member_obj, reason)
+    member_name = member.name
+    member_obj = member  # Сохраняем до кика
+    await member.kick(reason=reason)
+    sheets_later(log_to_moderation_sheet, "kick", user_id, member_name, "Admin Panel", reason, None, guild_id, guild.name)
+    sheets_later(log_to_activity_sheet, "kick", user_id, member_name, f"Кикнут. Причина: {reason}", guild.id, guild.name)
+    
+    # Отправляем лог
+    if log_channel_id:
+        await send_moderation_log(guild, log_channel_id, 'kick', member_obj, reason)
     
-    future = asyncio.run_coroutine_threadsafe(kick(), bot.loop)
-    future.result(timeout=10)
-    return jsonify({"success": True})
+    return {"success": True}, 200
 
-@app.route('/api/guilds/<guild_id>/members/<user_id>/ban', methods=['POST'])
-@require_auth
-def ban_member(guild_id, user_id):
+@bot_route('/api/guilds/<guild_id>/members/<user_id>/ban', methods=['POST'])
+async def ban_member(data, guild_id, user_id):
     guild = bot.get_guild(int(guild_id))
-    if not guild: return jsonify({"error": "Сервер не найден"}), 404
-    data = request.json
+    if not guild: return {"error": "Сервер не найден"}, 404
     reason = data.get('reason', 'Нарушение правил')
     delete_days = data.get('delete_message_days', 0)
     log_channel_id = data.get('log_channel_id')
     
-    async def ban():
-        user = await bot.fetch_user(int(user_id))
-        await guild.ban(user, reason=reason, delete_message_days=delete_days)
-        
-        active_punishments["bans"][str(user_id)] = {
-            "guild_id": str(guild_id),
-            "reason": reason,
-            "start_time": datetime.now().isoformat(),
-            "moderator": "Admin Panel",
-            "user_name": user.name,
-            "log_channel_id": log_channel_id
-        }
-        print(f"✅ BAN: Сохранён log_channel_id = {log_channel_id} для user_id = {user_id}")
-        sync_punishments_to_sheet()
-        log_to_moderation_sheet("ban", user_id, user.name, "Admin Panel", reason, None, guild_id, guild.name)
-        log_to_activity_sheet("ban", user.id, user.name, f"Забанен. Причина: {reason}", guild.id, guild.name)
-        # Очищаем предупреждения при бане
-        clear_user_warnings(user_id, guild_id)
-        
-        # Отправляем лог
-        if log_channel_id:
-            await send_moderation_log(guild, log_channel_id, 'ban', user, reason)
+    user = await bot.fetch_user(int(user_id))
+    await guild.ban(user, reason=reason, delete_message_days=delete_days)
+    
+    punishments_store.set(("bans", str(user_id)), {
+        "guild_id": str(guild_id),
+        "reason": reason,
+        "start_time": datetime.now().isoformat(),
+        "moderator": "Admin Panel",
+        "user_name": user.name,
+        "log_channel_id": log_channel_id
+    })
+    print(f"✅ BAN: Сохранён log_channel_id = {log_channel_id} для user_id = {user_id}")
+    sync_punishments_later()
+    sheets_later(log_to_moderation_sheet, "ban", user_id, user.name, "Admin Panel", reason, None, guild_id, guild.name)
+    sheets_later(log_to_activity_sheet, "ban", user.id, user.name, f"Забанен. Причина: {reason}", guild.id, guild.name)
+    # Очищаем предупреждения при бане
+    await asyncio.to_thread(clear_user_warnings, user_id, guild_id)
     
-    future = asyncio.run_coroutine_threadsafe(ban(), bot.loop)
-    future.result(timeout=10)
-    return jsonify({"success": True})
+    # Отправляем лог
+    if log_channel_id:
+        await send_moderation_log(guild, log_channel_id, 'ban', user, reason)
+    
+    return {"success": True}, 200
 
-@app.route('/api/guilds/<guild_id>/bans/<user_id>', methods=['DELETE'])
-@require_auth
-def unban_member(guild_id, user_id):
+@bot_route('/api/guilds/<guild_id>/bans/<user_id>', methods=['DELETE'])
+async def unban_member(data, guild_id, user_id):
     guild = bot.get_guild(int(guild_id))
-    if not guild: return jsonify({"error": "Сервер не найден"}), 404
-    
-    async def unban():
-        user = await bot.fetch_user(int(user_id))
-        await guild.unban(user)
-        
-        # Получаем log_channel_id
-        log_channel_id = None
-        if str(user_id) in active_punishments["bans"]:
-            log_channel_id = active_punishments["bans"][str(user_id)].get("log_channel_id")
-            print(f"🔍 UNBAN: log_channel_id = {log_channel_id}")
-            del active_punishments["bans"][str(user_id)]
-            sync_punishments_to_sheet()
-        else:
-            print(f"⚠️ UNBAN: user_id {user_id} не найден в active_punishments['bans']")
+    if not guild: return {"error": "Сервер не найден"}, 404
+    
+    user = await bot.fetch_user(int(user_id))
+    await guild.unban(user)
+    
+    # Получаем log_channel_id
+    log_channel_id = None
+    if str(user_id) in active_punishments["bans"]:
+        log_channel_id = active_punishments["bans"][str(user_id)].get("log_channel_id")
+        print(f"🔍 UNBAN: log_channel_id = {log_channel_id}")
+        punishments_store.delete(("bans", str(user_id)))
+        sync_punishments_later()
+    else:
+        print(f"⚠️ UNBAN: user_id {user_id} не найден в active_punishments['bans']")
+    
+    sheets_later(log_to_moderation_sheet, "unban", user_id, user.name, "Admin Panel", "Бан снят", None, guild_id, guild.name)
+    sheets_later(log_to_activity_sheet, "unban", user.id, user.name, "Бан снят", guild.id, guild.name)
+    
+    # Отправляем уведомление
+    if log_channel_id:
+        print(f"✅ UNBAN: Отправляем уведомление в канал {log_channel_id}")
+        await send_moderation_log(guild, log_channel_id, 'unban', user, 'Бан снят', None)
+    else:
+        print(f"❌ UNBAN: log_channel_id пустой, уведомление не отправлено")
+    
+    return {"success": True}, 200
+
+# Массовая модерация: действие -> (тип записи в журнал, запись в active_punishments)
+BULK_MODERATION_ACTIONS = {
+    'timeout': 'mute',
+    'untimeout': 'unmute',
+    'kick': 'kick',
+    'ban': 'ban',
+    'unban': 'unban'
+}
+BULK_TIMEOUT_MAX = 28 * 24 * 3600  # сек: максимальный тайм-аут в Discord
+BULK_DELETE_DAYS_MAX = 7  # дней удаляемых сообщений при бане (ограничение Discord)
+
+def bounded_int(data, key, default, low, high):
+    """Целое из параметров запроса; ValueError - не число или вне [low, high]"""
+    try:
+        value = int(data.get(key, default))
+    except (TypeError, ValueError):
+        raise ValueError(f"{key}: ожидается целое число")
+    if not low <= value <= high:
+        raise ValueError(f"{key}: допустимо от {low} до {high}")
+    return value
+
+@bot_route('/api/guilds/<guild_id>/moderation/bulk', methods=['POST'])
+async def bulk_moderation(data, guild_id):
+    """
+    Одно действие над списком пользователей (фоновая задача).
+    Запросы к Discord - параллельно (MODERATION_CONCURRENCY), затем одна синхронизация
+    Punishments, по одной пакетной записи в Moderation/Activity и один сводный лог.
+    """
+    guild = bot.get_guild(int(guild_id))
+    if not guild: return {"error": "Сервер не найден"}, 404
+    action = data.get('action')
+    if action not in BULK_MODERATION_ACTIONS:
+        return {"error": f"action: одно из {', '.join(BULK_MODERATION_ACTIONS)}"}, 400
+    user_ids = [u for u in dedupe(data.get('user_ids', [])) if u.isdigit()]
+    if not user_ids:
+        return {"error": "Выберите хотя бы одного пользователя"}, 400
+    
+    reason = data.get('reason', 'Нарушение правил')
+    try:
+        duration = bounded_int(data, 'duration', 60, 1, BULK_TIMEOUT_MAX)
+        delete_days = bounded_int(data, 'delete_message_days', 0, 0, BULK_DELETE_DAYS_MAX)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    log_channel_id = data.get('log_channel_id')
+    log_action = BULK_MODERATION_ACTIONS[action]
+    duration_label = f"{duration}s" if action == 'timeout' else None
+    until = discord.utils.utcnow() + timedelta(seconds=duration)
+    
+    async def apply(user_id):
+        """Запрос к Discord для одного пользователя -> (имя, упоминание)"""
+        member = guild.get_member(int(user_id))
+        if action in ('timeout', 'untimeout', 'kick') and not member:
+            raise LookupError("не найден на сервере")
+        if action == 'timeout':
+            await member.timeout(until, reason=reason)
+        elif action == 'untimeout':
+            await member.timeout(None)
+        elif action == 'kick':
+            await member.kick(reason=reason)
+        elif action == 'ban':
+            # discord.Object: без fetch_user на каждого
+            await guild.ban(member or discord.Object(id=int(user_id)), reason=reason, delete_message_days=delete_days)
+        elif action == 'unban':
+            await guild.unban(discord.Object(id=int(user_id)), reason=reason)
+        user = member or bot.get_user(int(user_id))
+        return (user.name if user else user_id), (user.mention if user else f"<@{user_id}>")
+    
+    async def run(job):
+        job.set_total(len(user_ids))
+        semaphore = asyncio.Semaphore(MODERATION_CONCURRENCY)
+        done = {}  # {user_id: (имя, упоминание)}
+        failed = []
+        
+        async def process(user_id):
+            async with semaphore:
+                try:
+                    done[user_id] = await apply(user_id)
+                    job.advance({"user_id": user_id, "status": "done", "username": done[user_id][0]})
+                except Exception as e:
+                    # Любая ошибка по одному пользователю не должна обрывать задачу и учёт остальных
+                    if not isinstance(e, (LookupError, discord.HTTPException)):
+                        print(f"⚠️ Массовая модерация {action} {user_id}: {e}")
+                    failed.append(user_id)
+                    job.advance({"user_id": user_id, "status": "failed", "error": str(e)[:100]})
         
-        log_to_moderation_sheet("unban", user_id, user.name, "Admin Panel", "Бан снят", None, guild_id, guild.name)
-        log_to_activity_sheet("unban", user.id, user.name, "Бан снят", guild.id, guild.name)
+        try:
+            await asyncio.gather(*(process(u) for u in user_ids))
+        finally:
+            # Учёт - и для отменённой задачи: то, что уже применено в Discord, должно попасть в журнал
+            if done:
+                await record(done)
+                await send_bulk_moderation_log(guild, log_channel_id, log_action,
+                                               [mention for _, mention in done.values()], len(failed),
+                                               reason, f"{duration}с" if action == 'timeout' else None)
+        return {"success": True, "action": action, "done": len(done), "failed": len(failed), "failed_ids": failed}
+    
+    async def record(done):
+        now = datetime.now().isoformat()
+        for user_id, (name, _) in done.items():
+            if action == 'timeout':
+                punishments_store.set(("mutes", user_id), {
+                    "guild_id": str(guild_id), "reason": reason, "until": until.isoformat(),
+                    "start_time": now, "moderator": "Admin Panel", "member_name": name,
+                    "log_channel_id": log_channel_id
+                })
+            elif action == 'ban':
+                punishments_store.set(("bans", user_id), {
+                    "guild_id": str(guild_id), "reason": reason, "start_time": now,
+                    "moderator": "Admin Panel", "user_name": name, "log_channel_id": log_channel_id
+                })
+            elif action == 'untimeout' and user_id in active_punishments["mutes"]:
+                punishments_store.delete(("mutes", user_id))
+            elif action == 'unban' and user_id in active_punishments["bans"]:
+                punishments_store.delete(("bans", user_id))
         
-        # Отправляем уведомление
-        if log_channel_id:
-            print(f"✅ UNBAN: Отправляем уведомление в канал {log_channel_id}")
-            await send_moderation_log(guild, log_channel_id, 'unban', user, 'Бан снят', None)
-        else:
-            print(f"❌ UNBAN: log_channel_id пустой, уведомление не отправлено")
+        details = {
+            'timeout': f"Замучен на {duration}с. Причина: {reason}",
+            'untimeout': "Мут снят",
+            'kick': f"Кикнут. Причина: {reason}",
+            'ban': f"Забанен. Причина: {reason}",
+            'unban': "Бан снят"
+        }[action]
+        
+        rows = punishment_rows() if action in ('timeout', 'untimeout', 'ban', 'unban') else None
+        
+        def write_sheets():
+            if rows is not None:
+                sync_punishments_to_sheet(rows)
+            if action == 'ban':
+                clear_users_warnings(done.keys(), guild_id)
+            log_moderation_batch([(log_action, user_id, name, "Admin Panel", reason, duration_label, guild_id, guild.name)
+                                  for user_id, (name, _) in done.items()])
+            log_activity_batch([(log_action, user_id, name, f"{details} (массово)", guild.id, guild.name)
+                                for user_id, (name, _) in done.items()])
+        
+        await asyncio.to_thread(write_sheets)
+        print(f"🛡️ Массовое действие {action}: {len(done)} пользователей")
     
-    future = asyncio.run_coroutine_threadsafe(unban(), bot.loop)
-    future.result(timeout=10)
-    return jsonify({"success": True})
+    return job_accepted(job_manager.submit("bulk_moderation", run, guild.id,
+                                           params={"action": action, "users": len(user_ids)}))
 
-@app.route('/api/guilds/<guild_id>/members/<user_id>/warnings', methods=['DELETE'])
-@require_auth
-def clear_warnings(guild_id, user_id):
+def find_warnings_log_channel(user_id, guild_id):
+    """log_channel_id последнего активного предупреждения (из Excel)"""
+    try:
+        all_records = warnings_sheet.get_all_records()
+        user_warnings = [
+            r for r in all_records
+            if str(r.get('User ID')) == str(user_id)
+            and str(r.get('Guild ID')) == str(guild_id)
+            and r.get('Status') == 'active'
+        ]
+        if user_warnings:
+            log_channel_id = user_warnings[-1].get('Log Channel ID')
+            print(f"✅ CLEAR WARNINGS: Нашёл log_channel_id = {log_channel_id} из Excel")
+            return log_channel_id
+    except Exception as e:
+        print(f"❌ CLEAR WARNINGS: Ошибка чтения Excel: {e}")
+    return None
+
+@bot_route('/api/guilds/<guild_id>/members/<user_id>/warnings', methods=['DELETE'])
+async def clear_warnings(data, guild_id, user_id):
     """Очистить все предупреждения пользователя"""
     guild = bot.get_guild(int(guild_id))
-    if not guild: return jsonify({"error": "Сервер не найден"}), 404
+    if not guild: return {"error": "Сервер не найден"}, 404
     member = guild.get_member(int(user_id))
     
     # ✅ Берём log_channel_id из тела запроса (приоритет) или из Excel
-    data = request.json or {}
     log_channel_id = data.get('log_channel_id')
     print(f"🔍 CLEAR WARNINGS: log_channel_id из запроса = {log_channel_id}")
     
-    # Если не передан, берём из Excel
+    # Если не передан, берём из Excel (чтение листа - в потоке, не блокируем event loop)
     if not log_channel_id and SHEETS_ENABLED and warnings_sheet:
-        try:
-            all_records = warnings_sheet.get_all_records()
-            user_warnings = [
-                r for r in all_records
-                if str(r.get('User ID')) == str(user_id)
-                and str(r.get('Guild ID')) == str(guild_id)
-                and r.get('Status') == 'active'
-            ]
-            if user_warnings:
-                last_warn = user_warnings[-1]
-                log_channel_id = last_warn.get('Log Channel ID')
-                print(f"✅ CLEAR WARNINGS: Нашёл log_channel_id = {log_channel_id} из Excel")
-        except Exception as e:
-            print(f"❌ CLEAR WARNINGS: Ошибка чтения Excel: {e}")
+        log_channel_id = await asyncio.to_thread(find_warnings_log_channel, user_id, guild_id)
     
     print(f"🎯 CLEAR WARNINGS: Итоговый log_channel_id = {log_channel_id}")
     
-    clear_user_warnings(user_id, guild_id)
-    log_to_activity_sheet("warnings_cleared", user_id, "User", "Все предупреждения очищены (Admin Panel)", guild_id, None)
+    await asyncio.to_thread(clear_user_warnings, user_id, guild_id)
+    sheets_later(log_to_activity_sheet, "warnings_cleared", user_id, "User", "Все предупреждения очищены (Admin Panel)", guild_id, None)
     
     # ✅ Отправляем уведомление
     if log_channel_id and member:
-        async def send_clear_notification():
-            print(f"✅ CLEAR WARNINGS: Отправляем уведомление в канал {log_channel_id}")
-            channel = guild.get_channel(int(log_channel_id))
-            if channel:
-                embed = discord.Embed(
-                    title="✅ Предупреждения очищены",
-                    description=f"Пользователь {member.mention}",
-                    color=discord.Color.green(),
-                    timestamp=datetime.now()
-                )
-                embed.add_field(name="Причина", value="Все предупреждения сняты", inline=False)
-                embed.set_footer(text="Модератор: Admin Panel")
-                await channel.send(embed=embed)
-        
-        asyncio.run_coroutine_threadsafe(send_clear_notification(), bot.loop)
+        print(f"✅ CLEAR WARNINGS: Отправляем уведомление в канал {log_channel_id}")
+        channel = guild.get_channel(int(log_channel_id))
+        if channel:
+            embed = discord.Embed(
+                title="✅ Предупреждения очищены",
+                description=f"Пользователь {member.mention}",
+                color=discord.Color.green(),
+                timestamp=datetime.now()
+            )
+            embed.add_field(name="Причина", value="Все предупреждения сняты", inline=False)
+            embed.set_footer(text="Модератор: Admin Panel")
+            await channel.send(embed=embed)
     else:
         print(f"❌ CLEAR WARNINGS: log_channel_id пустой или member не найден")
     
-    return jsonify({"success": True})
+    return {"success": True}, 200
 
-@app.route('/api/guilds/<guild_id>/members/<user_id>/warn', methods=['POST'])
-@require_auth
-def warn_member(guild_id, user_id):
+@bot_route('/api/guilds/<guild_id>/members/<user_id>/warn', methods=['POST'])
+async def warn_member(data, guild_id, user_id):
     """Выдать предупреждение пользователю"""
     guild = bot.get_guild(int(guild_id))
-    if not guild: return jsonify({"error": "Сервер не найден"}), 404
+    if not guild: return {"error": "Сервер не найден"}, 404
     member = guild.get_member(int(user_id))
-    if not member: return jsonify({"error": "Участник не найден"}), 404
+    if not member: return {"error": "Участник не найден"}, 404
     
-    data = request.json
     reason = data.get('reason', 'Нарушение правил')
     log_channel_id = data.get('log_channel_id')  # ID канала для логирования
     
-    # Добавляем предупреждение
-    warnings_count = add_warning(user_id, member.name, "Admin Panel", reason, guild_id, guild.name, log_channel_id)
+    # Добавляем предупреждение (чтение + запись листа - в потоке)
+    warnings_count = await asyncio.to_thread(add_warning, user_id, member.name, "Admin Panel", reason,
+                                             guild_id, guild.name, log_channel_id)
     
     # Логирование
-    log_to_moderation_sheet("warning", user_id, member.name, "Admin Panel", reason, None, guild_id, guild.name)
-    log_to_activity_sheet("warning", member.id, member.name, f"Предупреждение ({warnings_count}/3). Причина: {reason}", guild.id, guild.name)
+    sheets_later(log_to_moderation_sheet, "warning", user_id, member.name, "Admin Panel", reason, None, guild_id, guild.name)
+    sheets_later(log_to_activity_sheet, "warning", member.id, member.name, f"Предупреждение ({warnings_count}/3). Причина: {reason}", guild.id, guild.name)
     
-    async def send_log_and_check():
-        # Отправляем сообщение в канал логов
+    # Отправляем сообщение в канал логов
+    if log_channel_id:
+        channel = guild.get_channel(int(log_channel_id))
+        if channel:
+            embed = discord.Embed(
+                title="⚠️ Предупреждение",
+                description=f"Пользователь {member.mention} получил предупреждение",
+                color=discord.Color.orange(),
+                timestamp=datetime.now()
+            )
+            embed.add_field(name="Причина", value=reason, inline=False)
+            embed.add_field(name="Количество предупреждений", value=f"{warnings_count}/3", inline=True)
+            embed.set_footer(text=f"Модератор: Admin Panel")
+            await channel.send(embed=embed)
+    
+    # Проверяем: если 3 предупреждения - бан на сутки
+    if warnings_count >= 3:
+        ban_duration = 86400  # 24 часа в секундах
+        ban_until = datetime.now() + timedelta(seconds=ban_duration)
+        
+        await member.ban(reason=f"Автобан: 3 предупреждения")
+        
+        punishments_store.set(("bans", str(user_id)), {
+            "guild_id": str(guild_id),
+            "reason": "Автобан: 3 предупреждения",
+            "start_time": datetime.now().isoformat(),
+            "until": ban_until.isoformat(),
+            "moderator": "Auto (Admin Panel)",
+            "user_name": member.name,
+            "log_channel_id": log_channel_id  # Сохраняем для уведомления
+        })
+        sync_punishments_later()
+        sheets_later(log_to_moderation_sheet, "ban", user_id, member.name, "Auto (Admin Panel)", "Автобан: 3 предупреждения", "24h", guild_id, guild.name)
+        sheets_later(log_to_activity_sheet, "ban", member.id, member.name, f"Автобан на 24ч: 3 предупреждения", guild.id, guild.name)
+        await asyncio.to_thread(clear_user_warnings, user_id, guild_id)
+        
         if log_channel_id:
             channel = guild.get_channel(int(log_channel_id))
             if channel:
                 embed = discord.Embed(
-                    title="⚠️ Предупреждение",
-                    description=f"Пользователь {member.mention} получил предупреждение",
-                    color=discord.Color.orange(),
+                    title="🚫 Автобан",
+                    description=f"{member.mention} забанен на 24 часа",
+                    color=discord.Color.red(),
                     timestamp=datetime.now()
                 )
-                embed.add_field(name="Причина", value=reason, inline=False)
-                embed.add_field(name="Количество предупреждений", value=f"{warnings_count}/3", inline=True)
-                embed.set_footer(text=f"Модератор: Admin Panel")
+                embed.add_field(name="Причина", value="3 предупреждения", inline=False)
+                embed.add_field(name="Длительность", value="24 часа", inline=True)
                 await channel.send(embed=embed)
         
-        # Проверяем: если 3 предупреждения - бан на сутки
-        if warnings_count >= 3:
-            ban_duration = 86400  # 24 часа в секундах
-            ban_until = datetime.now() + timedelta(seconds=ban_duration)
-            
-            await member.ban(reason=f"Автобан: 3 предупреждения")
-            
-            active_punishments["bans"][str(user_id)] = {
-                "guild_id": str(guild_id),
-                "reason": "Автобан: 3 предупреждения",
-                "start_time": datetime.now().isoformat(),
-                "until": ban_until.isoformat(),
-                "moderator": "Auto (Admin Panel)",
-                "user_name": member.name,
-                "log_channel_id": log_channel_id  # Сохраняем для уведомления
-            }
-            sync_punishments_to_sheet()
-            log_to_moderation_sheet("ban", user_id, member.name, "Auto (Admin Panel)", "Автобан: 3 предупреждения", "24h", guild_id, guild.name)
-            log_to_activity_sheet("ban", member.id, member.name, f"Автобан на 24ч: 3 предупреждения", guild.id, guild.name)
-            clear_user_warnings(user_id, guild_id)
-            
-            if log_channel_id:
-                channel = guild.get_channel(int(log_channel_id))
-                if channel:
-                    embed = discord.Embed(
-                        title="🚫 Автобан",
-                        description=f"{member.mention} забанен на 24 часа",
-                        color=discord.Color.red(),
-                        timestamp=datetime.now()
-                    )
-                    embed.add_field(name="Причина", value="3 предупреждения", inline=False)
-                    embed.add_field(name="Длительность", value="24 часа", inline=True)
-                    await channel.send(embed=embed)
-            
-            return {"auto_banned": True, "warnings": warnings_count}
-        
-        return {"auto_banned": False, "warnings": warnings_count}
+        return {"success": True, "auto_banned": True, "warnings": warnings_count}, 200
     
-    future = asyncio.run_coroutine_threadsafe(send_log_and_check(), bot.loop)
-    result = future.result(timeout=10)
-    return jsonify({"success": True, **result})
+    return {"success": True, "auto_banned": False, "warnings": warnings_count}, 200
 
 @app.route('/api/guilds/<guild_id>/members/<user_id>/warnings', methods=['GET'])
 @require_auth
@@ -1923,39 +2638,154 @@ def get_punishments(guild_id):
     
     return jsonify({"mutes": guild_mutes, "bans": guild_bans, "warnings": warnings})
 
-@app.route('/api/guilds/<guild_id>/members/<user_id>/roles/<role_id>', methods=['PUT'])
-@require_auth
-def add_role(guild_id, user_id, role_id):
+@bot_route('/api/guilds/<guild_id>/members/<user_id>/roles/<role_id>', methods=['PUT'])
+async def add_role(data, guild_id, user_id, role_id):
     guild = bot.get_guild(int(guild_id))
-    if not guild: return jsonify({"error": "Сервер не найден"}), 404
+    if not guild: return {"error": "Сервер не найден"}, 404
     member = guild.get_member(int(user_id))
     role = guild.get_role(int(role_id))
-    if not member or not role: return jsonify({"error": "Участник или роль не найдены"}), 404
+    if not member or not role: return {"error": "Участник или роль не найдены"}, 404
     
-    async def add():
-        await member.add_roles(role)
-        log_to_activity_sheet("role_add", member.id, member.name, f"Роль {role.name} выдана (Admin Panel)", guild.id, guild.name)
+    await member.add_roles(role)
+    sheets_later(log_to_activity_sheet, "role_add", member.id, member.name, f"Роль {role.name} выдана (Admin Panel)", guild.id, guild.name)
     
-    future = asyncio.run_coroutine_threadsafe(add(), bot.loop)
-    future.result(timeout=10)
-    return jsonify({"success": True})
+    return {"success": True}, 200
 
-@app.route('/api/guilds/<guild_id>/members/<user_id>/roles/<role_id>', methods=['DELETE'])
-@require_auth
-def remove_role(guild_id, user_id, role_id):
+@bot_route('/api/guilds/<guild_id>/members/<user_id>/roles/<role_id>', methods=['DELETE'])
+async def remove_role(data, guild_id, user_id, role_id):
     guild = bot.get_guild(int(guild_id))
-    if not guild: return jsonify({"error": "Сервер не найден"}), 404
+    if not guild: return {"error": "Сервер не найден"}, 404
     member = guild.get_member(int(user_id))
     role = guild.get_role(int(role_id))
-    if not member or not role: return jsonify({"error": "Участник или роль не найдены"}), 404
+    if not member or not role: return {"error": "Участник или роль не найдены"}, 404
+    
+    await member.remove_roles(role)
+    sheets_later(log_to_activity_sheet, "role_remove", member.id, member.name, f"Роль {role.name} забрана (Admin Panel)", guild.id, guild.name)
     
-    async def remove():
-        await member.remove_roles(role)
-        log_to_activity_sheet("role_remove", member.id, member.name, f"Роль {role.name} забрана (Admin Panel)", guild.id, guild.name)
+    return {"success": True}, 200
+
+def parse_role_operations(data):
+    """
+    Операции с ролями из запроса: {operations: [{user_id, role_id, action}]}
+    или {action, user_ids, role_ids} (каждому из user_ids - каждая из role_ids).
+    -> {user_id: {"add": {role_id}, "remove": {role_id}}}. ValueError - некорректный запрос
+    """
+    operations = data.get('operations')
+    if operations is None:
+        operations = [{"user_id": u, "role_id": r, "action": data.get('action')}
+                      for u in data.get('user_ids', []) for r in data.get('role_ids', [])]
+    if not operations:
+        raise ValueError("Нет операций")
+    if len(operations) > BULK_ROLES_MAX_OPERATIONS:
+        raise ValueError(f"Не больше {BULK_ROLES_MAX_OPERATIONS} операций за запрос")
+    
+    plan = {}
+    for op in operations:
+        action = op.get('action')
+        if action not in ('add', 'remove'):
+            raise ValueError("action: add или remove")
+        try:
+            user_id, role_id = int(op.get('user_id')), int(op.get('role_id'))
+        except (TypeError, ValueError):
+            raise ValueError("user_id и role_id должны быть числами")
+        changes = plan.setdefault(user_id, {"add": set(), "remove": set()})
+        changes[action].add(role_id)
+        # Последняя операция над парой побеждает
+        changes["remove" if action == "add" else "add"].discard(role_id)
+    return plan
+
+@bot_route('/api/guilds/<guild_id>/roles/bulk', methods=['POST'])
+async def bulk_roles(data, guild_id):
+    """
+    Массовая выдача/снятие ролей (фоновая задача).
+    Изменения группируются по участнику, уже выполненные пропускаются.
+    Роли выдаются и снимаются точечно (add_roles/remove_roles).
+    Журнал - одна пакетная запись со сводкой по ролям.
+    """
+    guild = bot.get_guild(int(guild_id))
+    if not guild: return {"error": "Сервер не найден"}, 404
+    try:
+        plan = parse_role_operations(data)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    
+    role_ids = set().union(*(c["add"] | c["remove"] for c in plan.values()))
+    roles = {role_id: guild.get_role(role_id) for role_id in role_ids}
+    missing = [str(role_id) for role_id, role in roles.items() if role is None]
+    if missing:
+        return {"error": f"Роли не найдены: {', '.join(missing)}"}, 404
+    
+    def pending(member, changes):
+        """(выдать, снять) - только то, чего у участника ещё нет / что ещё есть"""
+        current = {r.id for r in member.roles}
+        to_add = [roles[r] for r in changes["add"] if r not in current]
+        to_remove = [roles[r] for r in changes["remove"] if r in current]
+        return to_add, to_remove
+    
+    async def run(job):
+        job.set_total(len(plan))
+        semaphore = asyncio.Semaphore(BULK_ROLES_CONCURRENCY)
+        added, removed = {}, {}  # {role_id: число участников}
+        failed = []
+        
+        async def process(user_id, changes):
+            async with semaphore:
+                member = guild.get_member(user_id)
+                done_add, done_remove = [], []
+                error = None
+                try:
+                    if not member:
+                        raise LookupError("не найден на сервере")
+                    # member.edit(roles=...) перезаписал бы роли, выданные параллельно - только точечно
+                    to_add, to_remove = pending(member, changes)
+                    if to_add:
+                        await member.add_roles(*to_add, reason="Admin Panel (массово)")
+                        done_add = to_add
+                    if to_remove:
+                        await member.remove_roles(*to_remove, reason="Admin Panel (массово)")
+                        done_remove = to_remove
+                except Exception as e:
+                    # Ошибка одного участника не обрывает задачу; уже выданное всё равно учитывается
+                    error = e
+                for role in done_add:
+                    added[role.id] = added.get(role.id, 0) + 1
+                for role in done_remove:
+                    removed[role.id] = removed.get(role.id, 0) + 1
+                result = {
+                    "user_id": str(user_id),
+                    "added": [str(r.id) for r in done_add],
+                    "removed": [str(r.id) for r in done_remove]
+                }
+                if error is not None:
+                    if not isinstance(error, (LookupError, discord.HTTPException)):
+                        print(f"⚠️ Массовые роли {user_id}: {error}")
+                    failed.append(str(user_id))
+                    result.update(status="partial" if done_add or done_remove else "failed", error=str(error)[:100])
+                else:
+                    result["status"] = "done" if done_add or done_remove else "unchanged"
+                job.advance(result)
+        
+        try:
+            await asyncio.gather(*(process(u, c) for u, c in plan.items()))
+        finally:
+            # Сводка по ролям одной пакетной записью (и при отмене)
+            records = [("role_add", None, "Admin Panel", f"Роль {roles[r].name} выдана {n} участникам (массово)", guild.id, guild.name)
+                       for r, n in added.items()]
+            records += [("role_remove", None, "Admin Panel", f"Роль {roles[r].name} снята у {n} участников (массово)", guild.id, guild.name)
+                        for r, n in removed.items()]
+            if records:
+                await asyncio.to_thread(log_activity_batch, records)
+        
+        return {
+            "success": True,
+            "members": len(plan),
+            "failed": len(failed),
+            "failed_ids": failed,
+            "added": {str(r): n for r, n in added.items()},
+            "removed": {str(r): n for r, n in removed.items()}
+        }
     
-    future = asyncio.run_coroutine_threadsafe(remove(), bot.loop)
-    future.result(timeout=10)
-    return jsonify({"success": True})
+    return job_accepted(job_manager.submit("bulk_roles", run, guild.id, params={"members": len(plan)}))
 
 
 
@@ -1968,21 +2798,17 @@ def get_guild_channels(guild_id):
         if not guild:
             return jsonify({'error': 'Guild not found'}), 404
         
-        channels = []
-        for channel in guild.channels:
-            channels.append({
-                'id': str(channel.id),
-                'name': channel.name,
-                'type': channel.type.value,  # 0 - text, 2 - voice, 4 - category, etc.
-                'position': channel.position,
-                'category_id': str(channel.category_id) if channel.category_id else None
-            })
-        
-        # Сортируем по позиции как в дискорде
-        channels.sort(key=lambda c: c['position'])
+        def build():
+            # type: 0 - text, 2 - voice, 4 - category, etc.
+            channels = [channel_to_dict(channel) for channel in guild.channels]
+            
+            # Сортируем по позиции как в дискорде
+            channels.sort(key=lambda c: c['position'])
+            
+            print(f"📡 Собран список из {len(channels)} каналов для guild {guild_id}")
+            return channels
         
-        print(f"📡 Возвращено {len(channels)} каналов для guild {guild_id}")
-        return jsonify(channels), 200
+        return cached_guild_response(guild.id, 'channels', ('channels',), build)
     
     except Exception as e:
         print(f"❌ Get Channels Error: {e}")
@@ -2005,75 +2831,54 @@ def get_channels_from_excel(guild_id):
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/guilds/<guild_id>/channels/sync', methods=['POST'])
-@require_auth
-def sync_channels_api(guild_id):
+@bot_route('/api/guilds/<guild_id>/channels/sync', methods=['POST'], timeout=120)
+async def sync_channels_api(data, guild_id):
     """Синхронизировать каналы сервера в Excel (вручную)"""
-    try:
-        print(f"📊 POST /api/guilds/{guild_id}/channels/sync")
-        
-        guild = bot.get_guild(int(guild_id))
-        if not guild:
-            return jsonify({'error': 'Guild not found'}), 404
-        
-        # Синхронизируем каналы
-        sync_channels_to_excel(guild)
-        
-        return jsonify({'success': True, 'message': 'Каналы синхронизированы'}), 200
-    except Exception as e:
-        print(f"❌ Error syncing channels: {e}")
-        traceback.print_exc()
-        return jsonify({'error': str(e)}), 500
+    print(f"📊 POST /api/guilds/{guild_id}/channels/sync")
+    
+    guild = bot.get_guild(int(guild_id)) if guild_id.isdigit() else None
+    if not guild:
+        return {'error': 'Guild not found'}, 404
+    
+    # Каналы читаются в event loop бота, запись - в потоке channels_sync
+    await sync_guild_channels(guild)
+    
+    return {'success': True, 'message': 'Каналы синхронизированы'}, 200
 
-@app.route('/api/guilds/<guild_id>/channels', methods=['POST'])
-@require_auth
-def create_channel(guild_id):
+@bot_route('/api/guilds/<guild_id>/channels', methods=['POST'])
+async def create_channel(data, guild_id):
     guild = bot.get_guild(int(guild_id))
-    if not guild: return jsonify({"error": "Сервер не найден"}), 404
-    data = request.json
+    if not guild: return {"error": "Сервер не найден"}, 404
     name = data.get('name')
     channel_type = discord.ChannelType(data.get('type', 0))
     topic = data.get('topic')
     
-    async def create():
-        if channel_type == discord.ChannelType.text:
-            channel = await guild.create_text_channel(name, topic=topic)
-        elif channel_type == discord.ChannelType.voice:
-            channel = await guild.create_voice_channel(name)
-        elif channel_type == discord.ChannelType.category:
-            channel = await guild.create_category(name)
-        else:
-            return None
-        log_to_activity_sheet("channel_create", None, "Admin Panel", f"Создан канал {channel.name}", guild.id, guild.name)
-        return channel
-    
-    future = asyncio.run_coroutine_threadsafe(create(), bot.loop)
-    channel = future.result(timeout=10)
-    if channel:
-        return jsonify({"id": str(channel.id), "success": True})
+    if channel_type == discord.ChannelType.text:
+        channel = await guild.create_text_channel(name, topic=topic)
+    elif channel_type == discord.ChannelType.voice:
+        channel = await guild.create_voice_channel(name)
+    elif channel_type == discord.ChannelType.category:
+        channel = await guild.create_category(name)
     else:
-        return jsonify({"error": "Не удалось создать канал"}), 400
+        return {"error": "Не удалось создать канал"}, 400
+    sheets_later(log_to_activity_sheet, "channel_create", None, "Admin Panel", f"Создан канал {channel.name}", guild.id, guild.name)
+    return {"id": str(channel.id), "success": True}, 200
 
-@app.route('/api/channels/<channel_id>', methods=['DELETE'])
-@require_auth
-def delete_channel(channel_id):
+@bot_route('/api/channels/<channel_id>', methods=['DELETE'])
+async def delete_channel(data, channel_id):
     channel = bot.get_channel(int(channel_id))
-    if not channel: return jsonify({"error": "Канал не найден"}), 404
+    if not channel: return {"error": "Канал не найден"}, 404
     
-    async def delete():
-        channel_name = channel.name
-        guild_id = channel.guild.id
-        guild_name = channel.guild.name
-        await channel.delete()
-        log_to_activity_sheet("channel_delete", None, "Admin Panel", f"Канал {channel_name} удалён", guild_id, guild_name)
+    channel_name = channel.name
+    guild_id = channel.guild.id
+    guild_name = channel.guild.name
+    await channel.delete()
+    sheets_later(log_to_activity_sheet, "channel_delete", None, "Admin Panel", f"Канал {channel_name} удалён", guild_id, guild_name)
     
-    future = asyncio.run_coroutine_threadsafe(delete(), bot.loop)
-    future.result(timeout=10)
-    return jsonify({"success": True})
+    return {"success": True}, 200
 
-@app.route('/api/roles/<role_id>', methods=['DELETE'])
-@require_auth
-def delete_role(role_id):
+@bot_route('/api/roles/<role_id>', methods=['DELETE'])
+async def delete_role(data, role_id):
     """Delete a role from the guild"""
     try:
         # Находим роль во всех гильдиях
@@ -2087,81 +2892,73 @@ def delete_role(role_id):
                 break
         
         if not role:
-            return jsonify({"error": "Роль не найдена"}), 404
+            return {"error": "Роль не найдена"}, 404
         
         # Проверяем, что это не @everyone
         if role.is_default():
-            return jsonify({"error": "Нельзя удалить роль @everyone"}), 400
+            return {"error": "Нельзя удалить роль @everyone"}, 400
         
         # Проверяем, что роль бота не выше удаляемой
         if role >= guild.me.top_role:
-            return jsonify({"error": "Роль бота ниже удаляемой роли"}), 403
-        
-        async def delete():
-            role_name = role.name
-            guild_id = guild.id
-            guild_name = guild.name
-            await role.delete(reason="Удалено через Admin Panel")
-            log_to_activity_sheet("role_delete", None, "Admin Panel", f"Роль {role_name} удалена", guild_id, guild_name)
+            return {"error": "Роль бота ниже удаляемой роли"}, 403
         
-        future = asyncio.run_coroutine_threadsafe(delete(), bot.loop)
-        future.result(timeout=10)
-        return jsonify({"success": True})
+        role_name = role.name
+        await role.delete(reason="Удалено через Admin Panel")
+        sheets_later(log_to_activity_sheet, "role_delete", None, "Admin Panel", f"Роль {role_name} удалена", guild.id, guild.name)
+        return {"success": True}, 200
         
     except Exception as e:
         print(f"❌ Ошибка удаления роли: {e}")
-        return jsonify({"error": str(e)}), 500
+        return {"error": str(e)}, 500
 
-@app.route('/api/guilds/<guild_id>/reaction-roles', methods=['POST'])
-@require_auth
-def create_reaction_role(guild_id):
+def log_reaction_roles_rows(rows):
+    """Запись в Google Sheets - ReactionRoles (одним запросом)"""
+    if SHEETS_ENABLED and reaction_roles_sheet and rows:
+        try:
+            reaction_roles_sheet.append_rows(rows)
+        except Exception as e:
+            print(f"⚠️ Ошибка записи ReactionRole: {e}")
+
+@bot_route('/api/guilds/<guild_id>/reaction-roles', methods=['POST'])
+async def create_reaction_role(data, guild_id):
     guild = bot.get_guild(int(guild_id))
-    if not guild: return jsonify({"error": "Сервер не найден"}), 404
-    data = request.json
+    if not guild: return {"error": "Сервер не найден"}, 404
     channel_id = data.get('channel_id')
     message_text = data.get('message')
     reactions = data.get('reactions', [])
     channel = bot.get_channel(int(channel_id))
-    if not channel: return jsonify({"error": "Канал не найден"}), 404
-    
-    async def create():
-        message = await channel.send(message_text)
-        for reaction in reactions:
-            await message.add_reaction(reaction['emoji'])
-            
-            # Логируем в ReactionRoles sheet
-            if SHEETS_ENABLED and reaction_roles_sheet:
-                try:
-                    role = guild.get_role(int(reaction['role_id']))
-                    reaction_roles_sheet.append_row([
-                        str(message.id),
-                        str(channel.id),
-                        channel.name,
-                        reaction['emoji'],
-                        reaction['role_id'],
-                        role.name if role else '',
-                        datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                        str(guild.id),
-                        guild.name
-                    ])
-                except Exception as e:
-                    print(f"⚠️ Ошибка записи ReactionRole: {e}")
-        
-        reaction_roles_db[str(message.id)] = {
-            "channel_id": str(channel_id),
-            "guild_id": str(guild_id),
-            "message": message_text,
-            "reactions": reactions
-        }
-        save_rr_db()
-        log_to_activity_sheet("reaction_role_create", None, "Admin Panel",
-                             f"Создана система ролей за реакции ({len(reactions)} реакций) в #{channel.name}",
-                             guild.id, guild.name)
-        return message
-    
-    future = asyncio.run_coroutine_threadsafe(create(), bot.loop)
-    message = future.result(timeout=10)
-    return jsonify({"message_id": str(message.id), "success": True})
+    if not channel: return {"error": "Канал не найден"}, 404
+    
+    message = await channel.send(message_text)
+    sheet_rows = []
+    for reaction in reactions:
+        await message.add_reaction(reaction['emoji'])
+        role = guild.get_role(int(reaction['role_id'])) if str(reaction.get('role_id', '')).isdigit() else None
+        sheet_rows.append([
+            str(message.id),
+            str(channel.id),
+            channel.name,
+            reaction['emoji'],
+            reaction['role_id'],
+            role.name if role else '',
+            datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            str(guild.id),
+            guild.name
+        ])
+    
+    # Логируем в ReactionRoles sheet
+    sheets_later(log_reaction_roles_rows, sheet_rows)
+    
+    rr_store.set(str(message.id), {
+        "channel_id": str(channel_id),
+        "guild_id": str(guild_id),
+        "message": message_text,
+        "reactions": reactions
+    })
+    sheets_later(log_to_activity_sheet, "reaction_role_create", None, "Admin Panel",
+                         f"Создана система ролей за реакции ({len(reactions)} реакций) в #{channel.name}",
+                         guild.id, guild.name)
+    return {"message_id": str(message.id), "success": True}, 200
 
 @app.route('/api/guilds/<guild_id>/reaction-roles', methods=['GET'])
 @require_auth
@@ -2169,124 +2966,130 @@ def get_reaction_roles(guild_id):
     guild_rr = {k: v for k, v in reaction_roles_db.items() if v.get("guild_id") == str(guild_id)}
     return jsonify(guild_rr)
 
-@app.route('/api/reaction-roles/<message_id>', methods=['PUT'])
-@require_auth
-def update_reaction_role(message_id):
+def reaction_role_sheet_rows(message_id, reactions):
+    """Строки листа ReactionRoles для настроенных реакций сообщения (собираются в event loop бота)"""
+    config = reaction_roles_db[message_id]
+    guild_id = config['guild_id']
+    channel_id = config['channel_id']
+    guild = bot.get_guild(int(guild_id))
+    channel = bot.get_channel(int(channel_id))
+    rows = []
+    for reaction in reactions:
+        if reaction.get('role_id'):
+            role = guild.get_role(int(reaction['role_id'])) if guild and str(reaction['role_id']).isdigit() else None
+            rows.append([
+                message_id,
+                channel_id,
+                channel.name if channel else '',
+                reaction['emoji'],
+                reaction['role_id'],
+                role.name if role else '',
+                datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                guild_id,
+                guild.name if guild else ''
+            ])
+    return rows
+
+def delete_reaction_role_rows(message_id):
+    """Удалить строку сообщения из ReactionRoles (блокирующая, в потоке)"""
+    if not (SHEETS_ENABLED and reaction_roles_sheet):
+        return
+    try:
+        records = reaction_roles_sheet.get_all_records()
+        for i, record in enumerate(records, start=2):  # start=2 (строка 1 = заголовки)
+            if str(record.get('Message ID')) == str(message_id):
+                reaction_roles_sheet.delete_rows(i)
+                print(f"✅ Удалена строка {i} из ReactionRoles (Message ID: {message_id})")
+                break
+    except Exception as e:
+        print(f"❌ Ошибка удаления из ReactionRoles: {e}")
+
+@bot_route('/api/reaction-roles/<message_id>', methods=['PUT'])
+async def update_reaction_role(data, message_id):
     """Обновить роли для реакций"""
     if message_id not in reaction_roles_db:
-        return jsonify({"error": "Сообщение не найдено"}), 404
+        return {"error": "Сообщение не найдено"}, 404
     
-    data = request.json
     new_reactions = data.get('reactions', [])
     
     # Обновляем реакции
-    reaction_roles_db[message_id]['reactions'] = new_reactions
-    reaction_roles_db[message_id]['unconfigured'] = False  # Теперь настроено
-    save_rr_db()
+    rr_store.set((message_id, 'reactions'), new_reactions)
+    rr_store.set((message_id, 'unconfigured'), False)  # Теперь настроено
     
     # Логирование в Google Sheets
-    if SHEETS_ENABLED and reaction_roles_sheet:
-        try:
-            guild_id = reaction_roles_db[message_id]['guild_id']
-            channel_id = reaction_roles_db[message_id]['channel_id']
-            guild = bot.get_guild(int(guild_id))
-            channel = bot.get_channel(int(channel_id))
-            
-            for reaction in new_reactions:
-                if reaction['role_id']:
-                    role = guild.get_role(int(reaction['role_id'])) if guild else None
-                    reaction_roles_sheet.append_row([
-                        message_id,
-                        channel_id,
-                        channel.name if channel else '',
-                        reaction['emoji'],
-                        reaction['role_id'],
-                        role.name if role else '',
-                        datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                        guild_id,
-                        guild.name if guild else ''
-                    ])
-        except Exception as e:
-            print(f"⚠️ Ошибка записи ReactionRole: {e}")
+    try:
+        sheets_later(log_reaction_roles_rows, reaction_role_sheet_rows(message_id, new_reactions))
+    except Exception as e:
+        print(f"⚠️ Ошибка записи ReactionRole: {e}")
     
-    return jsonify({"success": True})
+    return {"success": True}, 200
 
-@app.route('/api/reaction-roles/<message_id>', methods=['DELETE'])
-@require_auth
-def delete_reaction_role(message_id):
+@bot_route('/api/reaction-roles/<message_id>', methods=['DELETE'])
+async def delete_reaction_role(data, message_id):
     if message_id in reaction_roles_db:
         # Удаляем из памяти
-        del reaction_roles_db[message_id]
-        save_rr_db()
+        rr_store.delete(message_id)
         
         # Удаляем из Google Sheets
-        if SHEETS_ENABLED and reaction_roles_sheet:
-            try:
-                records = reaction_roles_sheet.get_all_records()
-                for i, record in enumerate(records, start=2):  # start=2 (строка 1 = заголовки)
-                    if str(record.get('Message ID')) == str(message_id):
-                        reaction_roles_sheet.delete_rows(i)
-                        print(f"✅ Удалена строка {i} из ReactionRoles (Message ID: {message_id})")
-                        break
-            except Exception as e:
-                print(f"❌ Ошибка удаления из ReactionRoles: {e}")
+        sheets_later(delete_reaction_role_rows, message_id)
         
-        return jsonify({"success": True})
-    return jsonify({"error": "Не найдено"}), 404
+        return {"success": True}, 200
+    return {"error": "Не найдено"}, 404
 
 # === WELCOME SYSTEM ===
-@app.route('/api/guilds/<guild_id>/welcomes', methods=['POST'])
-@require_auth
-def create_welcome(guild_id):
+def log_welcome_row(row):
+    """Запись в Google Sheets - Welcomes"""
+    if SHEETS_ENABLED and welcomes_sheet:
+        try:
+            welcomes_sheet.append_row(row)
+        except Exception as e:
+            print(f"⚠️ Ошибка записи Welcome: {e}")
+
+@bot_route('/api/guilds/<guild_id>/welcomes', methods=['POST'])
+async def create_welcome(data, guild_id):
     """Настроить действие по реакции на существующее сообщение"""
     guild = bot.get_guild(int(guild_id))
-    if not guild: return jsonify({"error": "Сервер не найден"}), 404
-    data = request.json
-    message_id = data.get('message_id')  # ID существующего сообщения
-    target_channel_id = data.get('target_channel_id')  # Канал для отправки
+    if not guild: return {"error": "Сервер не найден"}, 404
+    message_id = str(data.get('message_id') or '')  # ID существующего сообщения
+    target_channel_id = str(data.get('target_channel_id') or '')  # Канал для отправки
     welcome_message = data.get('welcome_message', '🎉 Добро пожаловать, {user}!')
     
     if not message_id or message_id not in reaction_roles_db:
-        return jsonify({"error": "Сообщение не найдено"}), 404
+        return {"error": "Сообщение не найдено"}, 404
     
-    target_channel = bot.get_channel(int(target_channel_id))
+    target_channel = bot.get_channel(int(target_channel_id)) if target_channel_id.isdigit() else None
     if not target_channel:
-        return jsonify({"error": "Канал не найден"}), 404
+        return {"error": "Канал не найден"}, 404
     
     # Получаем инфо о сообщении
     rr_data = reaction_roles_db[message_id]
     source_channel = bot.get_channel(int(rr_data["channel_id"]))
     
     # Сохраняем конфигурацию действия
-    welcome_configs[message_id] = {
+    welcome_store.set(message_id, {
         "guild_id": str(guild_id),
         "source_channel_id": rr_data["channel_id"],
-        "target_channel_id": str(target_channel_id),
+        "target_channel_id": target_channel_id,
         "message": welcome_message
-    }
-    save_welcome_db()
+    })
     
     # Запись в Google Sheets
-    if SHEETS_ENABLED and welcomes_sheet:
-        try:
-            welcomes_sheet.append_row([
-                str(guild.id),
-                guild.name,
-                message_id,
-                rr_data["channel_id"],
-                str(target_channel_id),
-                target_channel.name,
-                welcome_message,
-                datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            ])
-        except Exception as e:
-            print(f"⚠️ Ошибка записи Welcome: {e}")
-    
-    log_to_activity_sheet("welcome_action_create", None, "Admin Panel",
-                         f"Настроено действие: #{source_channel.name if source_channel else 'удалён'} → #{target_channel.name}",
-                         guild.id, guild.name)
-    
-    return jsonify({"message_id": message_id, "success": True})
+    sheets_later(log_welcome_row, [
+        str(guild.id),
+        guild.name,
+        message_id,
+        rr_data["channel_id"],
+        target_channel_id,
+        target_channel.name,
+        welcome_message,
+        datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    ])
+    
+    sheets_later(log_to_activity_sheet, "welcome_action_create", None, "Admin Panel",
+                 f"Настроено действие: #{source_channel.name if source_channel else 'удалён'} → #{target_channel.name}",
+                 guild.id, guild.name)
+    
+    return {"message_id": message_id, "success": True}, 200
 
 @app.route('/api/guilds/<guild_id>/welcomes', methods=['GET'])
 @require_auth
@@ -2295,15 +3098,13 @@ def get_welcomes(guild_id):
     guild_welcomes = {k: v for k, v in welcome_configs.items() if v.get("guild_id") == str(guild_id)}
     return jsonify(guild_welcomes)
 
-@app.route('/api/welcomes/<message_id>', methods=['DELETE'])
-@require_auth
-def delete_welcome(message_id):
+@bot_route('/api/welcomes/<message_id>', methods=['DELETE'])
+async def delete_welcome(data, message_id):
     """Удалить систему приветствий"""
     if message_id in welcome_configs:
-        del welcome_configs[message_id]
-        save_welcome_db()
-        return jsonify({"success": True})
-    return jsonify({"error": "Не найдено"}), 404
+        welcome_store.delete(message_id)
+        return {"success": True}, 200
+    return {"error": "Не найдено"}, 404
 
 # === TEMPORARY ROOMS API ===
 # (Эндпоинт /api/channels/<channel_id>/messages уже определён выше в строке 1079)
@@ -2311,108 +3112,104 @@ def delete_welcome(message_id):
 @app.route('/api/activity', methods=['GET'])
 @require_auth
 def get_activity():
-    """Получение активности из Google Sheets или локального лога"""
-    filter_type = request.args.get('type', 'all')  # Получаем фильтр
-    limit = request.args.get('limit', 100, type=int)
-    
-    if SHEETS_ENABLED and activity_sheet:
-        try:
-            all_records = activity_sheet.get_all_records()
-            print(f"📊 Activity: загружено {len(all_records)} записей из Google Sheets")
-            if len(all_records) > 0:
-                print(f"🔍 Первая запись: {all_records[-1]}")
-            
-            # Фильтруем по типу
-            if filter_type != 'all':
-                # Маппинг фильтров на типы событий
-                filter_mapping = {
-                    'members': ['member_join', 'member_leave'],
-                    'roles': ['role_add', 'role_remove', 'reaction_role_add', 'reaction_role_remove'],
-                    'moderation': ['mute', 'unmute', 'kick', 'ban', 'unban'],
-                    'channels': ['channel_create', 'channel_delete'],
-                    'messages': ['message_sent', 'message_bulk_delete'],
-                    'system': ['system']
-                }
-                allowed_types = filter_mapping.get(filter_type, [])
-                filtered_records = [r for r in all_records if r.get('Event Type') in allowed_types]
-                print(f"🔍 Фильтр '{filter_type}': найдено {len(filtered_records)} записей")
-            else:
-                filtered_records = all_records
-                print(f"🔍 Фильтр 'all': показано {len(filtered_records)} записей")
-            
-            # Преобразуем в формат фронтенда
-            formatted = []
-            for record in filtered_records[-limit:][::-1]:  # Последние N в обратном порядке
-                event_type = record.get('Event Type', '')
-                username = record.get('Username', '')
-                details = record.get('Details', '')
-                
-                # Создаём title и description
-                if username:
-                    title = f"{username}"
-                    description = details
-                else:
-                    title = event_type.replace('_', ' ').title()
-                    description = details
-                
-                # Иконки и цвета по типу
-                icon_map = {
-                    "member_join": "fas fa-user-plus",
-                    "member_leave": "fas fa-user-minus",
-                    "role_add": "fas fa-user-tag",
-                    "role_remove": "fas fa-user-minus",
-                    "channel_create": "fas fa-plus",
-                    "channel_delete": "fas fa-trash",
-                    "reaction_role_add": "fas fa-smile",
-                    "reaction_role_remove": "fas fa-frown",
-                    "message_sent": "fas fa-paper-plane",
-                    "message_bulk_delete": "fas fa-trash",
-                    "mute": "fas fa-volume-mute",
-                    "unmute": "fas fa-volume-up",
-                    "kick": "fas fa-user-slash",
-                    "ban": "fas fa-ban",
-                    "unban": "fas fa-user-check",
-                    "system": "fas fa-power-off"
-                }
-                
-                color_map = {
-                    "member_join": "linear-gradient(135deg, #667eea 0%, #764ba2 100%)",
-                    "member_leave": "linear-gradient(135deg, #ed4245 0%, #f5576c 100%)",
-                    "role_add": "linear-gradient(135deg, #43e97b 0%, #38f9d7 100%)",
-                    "role_remove": "linear-gradient(135deg, #ed4245 0%, #f5576c 100%)",
-                    "channel_create": "linear-gradient(135deg, #4facfe 0%, #00f2fe 100%)",
-                    "channel_delete": "linear-gradient(135deg, #ed4245 0%, #f5576c 100%)",
-                    "reaction_role_add": "linear-gradient(135deg, #43e97b 0%, #38f9d7 100%)",
-                    "reaction_role_remove": "linear-gradient(135deg, #ed4245 0%, #f5576c 100%)",
-                    "message_sent": "linear-gradient(135deg, #f093fb 0%, #f5576c 100%)",
-                    "message_bulk_delete": "linear-gradient(135deg, #ed4245 0%, #f5576c 100%)",
-                    "mute": "linear-gradient(135deg, #faa81a 0%, #f5576c 100%)",
-                    "unmute": "linear-gradient(135deg, #43e97b 0%, #38f9d7 100%)",
-                    "kick": "linear-gradient(135deg, #ed4245 0%, #f5576c 100%)",
-                    "ban": "linear-gradient(135deg, #ed4245 0%, #f5576c 100%)",
-                    "unban": "linear-gradient(135deg, #43e97b 0%, #38f9d7 100%)",
-                    "system": "linear-gradient(135deg, #43e97b 0%, #38f9d7 100%)"
-                }
-                
-                formatted.append({
-                    "type": event_type,
-                    "title": title,
-                    "description": description,
-                    "icon": icon_map.get(event_type, "fas fa-circle"),
-                    "color": color_map.get(event_type, "linear-gradient(135deg, #667eea 0%, #764ba2 100%)"),
-                    "user_id": record.get('User ID', ''),
-                    "username": username,
-                    "guild_id": record.get('Guild ID', ''),
-                    "guild_name": record.get('Guild Name', ''),
-                    "time": record.get('Timestamp', '')
-                })
-            return jsonify(formatted)
-        except Exception as e:
-            print(f"⚠️ Ошибка чтения Activity: {e}")
+    """
+    Лента активности от новых к старым.
+    type - фильтр (members, roles, ...), список типов через запятую или all.
+    Без cursor/since/until - список последних limit записей, как раньше.
+    С ними - {activity, next_cursor}: следующая страница по cursor=next_cursor.
+    """
+    try:
+        query = parse_activity_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
-    # Fallback на локальный лог
-    limit = request.args.get('limit', 100, type=int)
-    return jsonify(activity_log[:limit])
+    try:
+        ensure_activity_loaded()
+    except Exception as e:
+        # Лист недоступен - отдаём то, что записано за эту сессию
+        print(f"⚠️ Ошибка чтения Activity: {e}")
+    
+    entries, next_cursor = activity_store.query(
+        query['types'], query['since'], query['until'], query['cursor'], query['limit']
+    )
+    activity = [format_activity(e) for e in entries]
+    if not query['paged']:
+        return jsonify(activity)
+    return jsonify({"activity": activity, "next_cursor": next_cursor})
+
+@app.route('/api/activity/count', methods=['GET'])
+@require_auth
+def get_activity_count():
+    """Количество записей активности по типам (type, since, until как у /api/activity)"""
+    try:
+        query = parse_activity_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        ensure_activity_loaded()
+    except Exception as e:
+        print(f"⚠️ Ошибка чтения Activity: {e}")
+    
+    total, by_type = activity_store.count(query['types'], query['since'], query['until'])
+    return jsonify({"count": total, "by_type": by_type})
+
+def parse_activity_query(args):
+    """Параметры выборки активности. ValueError - некорректные значения"""
+    filter_type = args.get('type', 'all')
+    if filter_type in ('', 'all'):
+        types = None
+    elif filter_type in ACTIVITY_FILTERS:
+        types = ACTIVITY_FILTERS[filter_type]
+    else:
+        types = [t.strip() for t in filter_type.split(',') if t.strip()]
+    
+    since, until = args.get('since'), args.get('until')
+    since_ts, until_ts = parse_time(since), parse_time(until)
+    if (since and since_ts is None) or (until and until_ts is None):
+        raise ValueError("since/until: ожидается ISO-время или epoch")
+    
+    cursor = args.get('cursor') or None
+    try:
+        limit = int(args.get('limit', 100))
+        if cursor is not None:
+            int(cursor)
+    except ValueError:
+        raise ValueError("limit и cursor должны быть числами")
+    
+    return {
+        "types": types,
+        "since": since_ts,
+        "until": until_ts,
+        "cursor": cursor,
+        "limit": max(1, min(limit, ACTIVITY_PAGE_MAX)),
+        "paged": any(k in args for k in ('cursor', 'since', 'until'))
+    }
+
+@app.route('/api/jobs', methods=['GET'])
+@require_auth
+def list_jobs():
+    """Фоновые задачи (последние сверху), guild_id - фильтр по серверу"""
+    return jsonify([job.summary() for job in job_manager.list(request.args.get('guild_id'))])
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@require_auth
+def get_job(job_id):
+    """Состояние задачи; results_from=N - только частичные результаты начиная с N"""
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({"error": "Задача не найдена"}), 404
+    return jsonify(job.to_dict(results_from=request.args.get('results_from', 0, type=int)))
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+@require_auth
+def cancel_job(job_id):
+    cancelled = job_manager.cancel(job_id)
+    if cancelled is None:
+        return jsonify({"error": "Задача не найдена"}), 404
+    if cancelled is False:
+        return jsonify({"error": "Эту задачу нельзя отменить"}), 409
+    return jsonify(job_manager.get(job_id).summary()), 202
 
 @app.route('/api/moderation/history', methods=['GET'])
 @require_auth
@@ -2525,6 +3322,11 @@ def get_user_info(guild_id, user_id):
         traceback.print_exc()
         return jsonify({"punishments_count": 0, "warnings_count": 0})
 
+def guild_message_counts(guild_id, start_date=None):
+    """{user_id: сообщений} из листа Messages: сравнение Guild ID / User ID по равенству, период - по Epoch"""
+    messages = read_messages(messages_sheet.get_all_values())
+    return count_by_user(messages, guild_id, start_date.timestamp() if start_date else None)
+
 @app.route('/api/guilds/<guild_id>/activity-stats', methods=['GET'])
 @require_auth
 def get_activity_stats(guild_id):
@@ -2546,78 +3348,9 @@ def get_activity_stats(guild_id):
         # 1. Считаем сообщения из Messages sheet
         if SHEETS_ENABLED and messages_sheet:
             try:
-                print("✅ Loading messages from Google Sheets...")
-                
-                # ИСПРАВЛЕНИЕ: Указываем expected_headers вручную
-                try:
-                    records = messages_sheet.get_all_records(expected_headers=[
-                        'Timestamp', 'Guild ID', 'Guild Name', 'Channel', 'Sent By', 'Content'
-                    ])
-                except Exception as e:
-                    print(f"⚠️ Ошибка get_all_records с expected_headers: {e}")
-                    # Fallback: читаем все значения и парсим вручную
-                    all_values = messages_sheet.get_all_values()
-                    if len(all_values) < 2:
-                        print("⚠️ Messages sheet пустой")
-                        records = []
-                    else:
-                        header = all_values[0]
-                        records = []
-                        for row in all_values[1:]:
-                            if len(row) >= 6:
-                                records.append({
-                                    'Timestamp': row[0],
-                                    'Guild ID': row[1],
-                                    'Guild Name': row[2],
-                                    'Channel': row[3],
-                                    'Sent By': row[4],
-                                    'Content': row[5] if len(row) > 5 else ''
-                                })
-                
-                print(f"📊 Загружено {len(records)} записей из Messages")
-                
-                for record in records:
-                    # Проверяем Guild ID
-                    if str(record.get('Guild ID')) != str(guild_id):
-                        continue
-                    
-                    # Проверяем дату
-                    if start_date:
-                        try:
-                            msg_date = dt.datetime.strptime(record.get('Timestamp', ''), '%Y-%m-%d %H:%M:%S')
-                            if msg_date < start_date:
-                                continue
-                        except:
-                            continue
-                    
-                    # Получаем User ID из "Sent By" (формат: "Username (ID)" или просто "ID")
-                    sent_by = record.get('Sent By', '').strip()
-                    user_id = None
-                    
-                    # Пробуем несколько форматов парсинга
-                    if '(' in sent_by and ')' in sent_by:
-                        # Формат: "Username (123456)"
-                        user_id = sent_by.split('(')[-1].split(')')[0].strip()
-                    elif sent_by.isdigit():
-                        # Просто ID
-                        user_id = sent_by
-                    else:
-                        # Попытка извлечь число из строки
-                        import re
-                        match = re.search(r'\d{15,20}', sent_by)
-                        if match:
-                            user_id = match.group()
-                    
-                    if user_id and user_id.isdigit():
-                        if user_id not in user_stats:
-                            user_stats[user_id] = {'messages': 0, 'reactions': 0}
-                        user_stats[user_id]['messages'] += 1
-                        
-                    if not user_id:
-                        print(f"⚠️ Не удалось распарсить Sent By: '{sent_by}'")
-                
-                print(f"✅ Processed {len(records)} message records, extracted {len(user_stats)} unique users")
-                print(f"🔍 Sample user_stats: {list(user_stats.items())[:3]}")
+                for user_id, count in guild_message_counts(guild_id, start_date).items():
+                    user_stats[user_id] = {'messages': count, 'reactions': 0}
+                print(f"✅ Messages: {len(user_stats)} unique users")
             except Exception as e:
                 print(f"❌ Error loading messages: {e}")
         
@@ -2669,182 +3402,122 @@ def get_activity_stats(guild_id):
         traceback.print_exc()
         return jsonify({"users": {}, "period": period}), 500
 
-@app.route('/api/guilds/<guild_id>/send-top10', methods=['POST'])
-@require_auth
-def send_top10_to_channel(guild_id):
-    """Отправить Топ-10 активных пользователей в чат"""
-    try:
-        data = request.json
-        channel_id = data.get('channel_id')
-        period = data.get('period', '30')
-        
-        if not channel_id:
-            return jsonify({"error": "Channel ID is required"}), 400
-        
-        guild = bot.get_guild(int(guild_id))
-        if not guild:
-            return jsonify({"error": "Guild not found"}), 404
-        
-        channel = guild.get_channel(int(channel_id))
-        if not channel:
-            return jsonify({"error": "Channel not found"}), 404
-        
-        # Получаем статистику
-        if period != 'all':
-            start_date = datetime.now() - timedelta(days=int(period))
-        else:
-            start_date = None
-        
-        user_stats = {}
-        
-        print(f"📊 Загрузка статистики для топ-10: period={period}, guild={guild_id}")
-        
-        # Загружаем сообщения
-        if SHEETS_ENABLED and messages_sheet:
-            try:
-                # Используем expected_headers для избежания ошибок с дубликатами
-                expected_headers = ['Timestamp', 'Guild ID', 'Guild Name', 'Channel', 'Sent By', 'Content']
-                try:
-                    records = messages_sheet.get_all_records(expected_headers=expected_headers)
-                except Exception as e:
-                    print(f"⚠️ Ошибка get_all_records: {e}")
-                    # Fallback: читаем все значения и парсим вручную
-                    all_values = messages_sheet.get_all_values()
-                    if len(all_values) < 2:
-                        print("⚠️ Messages sheet пустой")
-                        records = []
-                    else:
-                        records = []
-                        for row in all_values[1:]:
-                            if len(row) >= 6:
-                                records.append({
-                                    'Timestamp': row[0],
-                                    'Guild ID': row[1],
-                                    'Guild Name': row[2],
-                                    'Channel': row[3],
-                                    'Sent By': row[4],
-                                    'Content': row[5] if len(row) > 5 else ''
-                                })
-                
-                print(f"📊 Всего записей в Messages: {len(records)}")
-                for record in records:
-                    if str(record.get('Guild ID')) != str(guild_id):
-                        continue
-                    if start_date:
-                        try:
-                            msg_date = dt.datetime.strptime(record.get('Timestamp', ''), '%Y-%m-%d %H:%M:%S')
-                            if msg_date < start_date:
-                                continue
-                        except:
+def top10_user_stats(guild_id, start_date):
+    """{user_id: {'messages', 'reactions'}} за период из Messages и Activity (блокирующая, в потоке)"""
+    user_stats = {}
+    
+    # Загружаем сообщения
+    if SHEETS_ENABLED and messages_sheet:
+        try:
+            for user_id, count in guild_message_counts(guild_id, start_date).items():
+                user_stats[user_id] = {'messages': count, 'reactions': 0}
+            print(f"✅ Загружено сообщений: {len(user_stats)} пользователей")
+        except Exception as e:
+            print(f"Error loading messages for top10: {e}")
+    
+    # Загружаем реакции
+    if SHEETS_ENABLED and activity_sheet:
+        try:
+            records = activity_sheet.get_all_records()
+            for record in records:
+                if str(record.get('Guild ID')) != str(guild_id):
+                    continue
+                if record.get('Event Type') != 'add_reaction':
+                    continue
+                if start_date:
+                    try:
+                        event_date = dt.datetime.strptime(record.get('Timestamp', ''), '%Y-%m-%d %H:%M:%S')
+                        if event_date < start_date:
                             continue
-                    
-                    sent_by = str(record.get('Sent By', ''))
-                    user_id = None
-                    
-                    if '(' in sent_by and ')' in sent_by:
-                        user_id = sent_by.split('(')[-1].split(')')[0].strip()
-                    elif sent_by.isdigit():
-                        user_id = sent_by
-                    else:
-                        import re
-                        match = re.search(r'\d{15,20}', sent_by)
-                        if match:
-                            user_id = match.group()
-                    
-                    if user_id and user_id.isdigit():
-                        if user_id not in user_stats:
-                            user_stats[user_id] = {'messages': 0, 'reactions': 0}
-                        user_stats[user_id]['messages'] += 1
-                print(f"✅ Загружено сообщений: {len([u for u in user_stats.values() if u['messages'] > 0])} пользователей")
-            except Exception as e:
-                print(f"Error loading messages for top10: {e}")
-        
-        # Загружаем реакции
-        if SHEETS_ENABLED and activity_sheet:
-            try:
-                records = activity_sheet.get_all_records()
-                for record in records:
-                    if str(record.get('Guild ID')) != str(guild_id):
-                        continue
-                    if record.get('Event Type') != 'add_reaction':
+                    except:
                         continue
-                    if start_date:
-                        try:
-                            event_date = dt.datetime.strptime(record.get('Timestamp', ''), '%Y-%m-%d %H:%M:%S')
-                            if event_date < start_date:
-                                continue
-                        except:
-                            continue
-                    
-                    user_id = str(record.get('User ID', ''))
-                    if user_id:
-                        if user_id not in user_stats:
-                            user_stats[user_id] = {'messages': 0, 'reactions': 0}
-                        user_stats[user_id]['reactions'] += 1
-                print(f"✅ Загружено реакций: {len([u for u in user_stats.values() if u['reactions'] > 0])} пользователей")
-            except Exception as e:
-                print(f"Error loading reactions for top10: {e}")
-        
-        # Формируем топ-10
-        top_users = []
-        for user_id, stats in user_stats.items():
-            points = stats['messages'] + (stats['reactions'] * 0.5)
-            member = guild.get_member(int(user_id))
-            if member and not member.bot:
-                top_users.append({
-                    'member': member,
-                    'points': points,
-                    'messages': stats['messages'],
-                    'reactions': stats['reactions']
-                })
-        
-        top_users.sort(key=lambda x: x['points'], reverse=True)
-        top_users = top_users[:10]
-        
-        print(f"📊 Всего пользователей с активностью: {len(user_stats)}")
-        print(f"🏆 Топ-10: {[(u['member'].name, u['points']) for u in top_users]}")
-        
-        if len(top_users) == 0:
-            # Отправляем сообщение об отсутствии данных
-            async def send_message():
-                await channel.send(f"📊 **Нет данных за выбранный период** ({period_text})\n\nПопробуйте изменить период или проверьте логи бота.")
-            asyncio.run_coroutine_threadsafe(send_message(), bot.loop).result(timeout=10)
-            return jsonify({"success": True, "message": "No data available"}), 200
-        
-        # Формируем сообщение
-        period_text = f"за {period} дней" if period != 'all' else "за всё время"
-        message_lines = [
-            f"🏆 **Топ-10 самых активных пользователей {period_text}** 🏆\n"
-        ]
-        
-        for i, user_data in enumerate(top_users, 1):
-            medal = ['🥇', '🥈', '🥉'][i-1] if i <= 3 else f"**{i}.**"
-            member = user_data['member']
-            display_name = member.nick if member.nick else member.name
-            points = user_data['points']
-            messages = user_data['messages']
-            reactions = user_data['reactions']
-            
-            message_lines.append(
-                f"{medal} **{display_name}** — {points:.1f} очков (💬{messages} сообщ. + ❤️{reactions} реак.)"
-            )
-        
-        message_text = "\n".join(message_lines)
-        
-        # Отправляем
-        async def send_message():
-            await channel.send(message_text)
-        
-        asyncio.run_coroutine_threadsafe(send_message(), bot.loop).result(timeout=10)
-        
-        print(f"✅ Топ-10 отправлен в канал {channel.name}")
-        return jsonify({"success": True}), 200
+                
+                user_id = str(record.get('User ID', ''))
+                if user_id:
+                    if user_id not in user_stats:
+                        user_stats[user_id] = {'messages': 0, 'reactions': 0}
+                    user_stats[user_id]['reactions'] += 1
+            print(f"✅ Загружено реакций: {len([u for u in user_stats.values() if u['reactions'] > 0])} пользователей")
+        except Exception as e:
+            print(f"Error loading reactions for top10: {e}")
+    return user_stats
+
+@bot_route('/api/guilds/<guild_id>/send-top10', methods=['POST'], timeout=120)
+async def send_top10_to_channel(data, guild_id):
+    """Отправить Топ-10 активных пользователей в чат"""
+    channel_id = str(data.get('channel_id') or '')
+    period = str(data.get('period', '30'))
+    
+    if not channel_id:
+        return {"error": "Channel ID is required"}, 400
+    if not channel_id.isdigit() or not (period == 'all' or period.isdigit()):
+        return {"error": "channel_id и period (число дней или all) должны быть числами"}, 400
+    
+    guild = bot.get_guild(int(guild_id))
+    if not guild:
+        return {"error": "Guild not found"}, 404
+    
+    channel = guild.get_channel(int(channel_id))
+    if not channel:
+        return {"error": "Channel not found"}, 404
+    
+    # Получаем статистику
+    if period != 'all':
+        start_date = datetime.now() - timedelta(days=int(period))
+    else:
+        start_date = None
+    period_text = f"за {period} дней" if period != 'all' else "за всё время"
+    
+    print(f"📊 Загрузка статистики для топ-10: period={period}, guild={guild_id}")
+    # Чтение листов - в потоке: event loop бота не ждёт Google Sheets
+    user_stats = await asyncio.to_thread(top10_user_stats, guild_id, start_date)
+    
+    # Формируем топ-10
+    top_users = []
+    for user_id, stats in user_stats.items():
+        points = stats['messages'] + (stats['reactions'] * 0.5)
+        member = guild.get_member(int(user_id)) if str(user_id).isdigit() else None
+        if member and not member.bot:
+            top_users.append({
+                'member': member,
+                'points': points,
+                'messages': stats['messages'],
+                'reactions': stats['reactions']
+            })
+    
+    top_users.sort(key=lambda x: x['points'], reverse=True)
+    top_users = top_users[:10]
+    
+    print(f"📊 Всего пользователей с активностью: {len(user_stats)}")
+    print(f"🏆 Топ-10: {[(u['member'].name, u['points']) for u in top_users]}")
+    
+    if len(top_users) == 0:
+        # Отправляем сообщение об отсутствии данных
+        await channel.send(f"📊 **Нет данных за выбранный период** ({period_text})\n\nПопробуйте изменить период или проверьте логи бота.")
+        return {"success": True, "message": "No data available"}, 200
+    
+    # Формируем сообщение
+    message_lines = [
+        f"🏆 **Топ-10 самых активных пользователей {period_text}** 🏆\n"
+    ]
+    
+    for i, user_data in enumerate(top_users, 1):
+        medal = ['🥇', '🥈', '🥉'][i-1] if i <= 3 else f"**{i}.**"
+        member = user_data['member']
+        display_name = member.nick if member.nick else member.name
+        points = user_data['points']
+        messages = user_data['messages']
+        reactions = user_data['reactions']
         
-    except Exception as e:
-        print(f"❌ Error sending top10: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        message_lines.append(
+            f"{medal} **{display_name}** — {points:.1f} очков (💬{messages} сообщ. + ❤️{reactions} реак.)"
+        )
+    
+    # Отправляем
+    await channel.send("\n".join(message_lines))
+    
+    print(f"✅ Топ-10 отправлен в канал {channel.name}")
+    return {"success": True}, 200
 
 SWEAR_WORDS = [
     r'\b(bl[yi]a?t|blyad|fuck|shi[t]+|cyka|suka|pidaras|pidoras|p[ie]zd[aey]|hui|хуй|бляд|пизд|ебан|еб[ауоы]|сук[аи]|пидор|говн|мудак)\b'
@@ -2873,6 +3546,35 @@ def update_ai_config(guild_id):
     else:
         return jsonify({'error': 'Ошибка сохранения'}), 500
 
+# === SPAM CONFIG ===
+@app.route('/api/guilds/<guild_id>/spam-config', methods=['GET'])
+@require_auth
+def get_spam_config(guild_id):
+    """Пороги защиты от спама (настройки сервера поверх значений по умолчанию)"""
+    return jsonify({
+        'config': spam_tracker.config(guild_id),
+        'defaults': DEFAULT_SPAM_CONFIG
+    })
+
+@app.route('/api/guilds/<guild_id>/spam-config', methods=['POST'])
+@require_auth
+def update_spam_config(guild_id):
+    """Изменить пороги сервера; {"reset": true} - вернуть значения по умолчанию"""
+    data = request.get_json(silent=True) or {}
+    if data.get('reset'):
+        if guild_id in spam_config_store.data:
+            spam_config_store.delete(guild_id)
+        return jsonify({'success': True, 'config': spam_tracker.config(guild_id)})
+    try:
+        config = validate_spam_config(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not config:
+        return jsonify({'error': 'Нет параметров для изменения'}), 400
+    spam_config_store.set(guild_id, {**spam_config_store.data.get(guild_id, {}), **config})
+    print(f"✅ Пороги спама для guild {guild_id}: {config}")
+    return jsonify({'success': True, 'config': spam_tracker.config(guild_id)})
+
 # === SUSPICIOUS ACTIVITY CONFIG ===
 @app.route('/api/guilds/<guild_id>/suspicious-config', methods=['GET'])
 @require_auth
@@ -3041,6 +3743,9 @@ def save_temp_room_to_sheet(room_info):
 
 def update_temp_room_status(channel_id, status):
     """Обновить статус комнаты в Google Sheets"""
+    room = temp_rooms.get(str(channel_id))
+    event_bus.publish("temp_room", room['guild_id'] if room else None,
+                      {"channel_id": str(channel_id), "status": status})
     if SHEETS_ENABLED and temp_rooms_sheet:
         try:
             records = temp_rooms_sheet.get_all_records()
@@ -3052,13 +3757,14 @@ def update_temp_room_status(channel_id, status):
         except Exception as e:
             print(f"⚠️ Ошибка обновления статуса в Sheets: {e}")
 
-def load_active_rooms_from_sheet():
-    """Загрузить активные комнаты из Google Sheets при запуске"""
+def load_active_rooms_from_sheet(records=None):
+    """Загрузить активные комнаты из Google Sheets при запуске (вызывать в event loop)"""
     if not SHEETS_ENABLED or not temp_rooms_sheet:
         return
     
     try:
-        records = temp_rooms_sheet.get_all_records()
+        if records is None:
+            records = temp_rooms_sheet.get_all_records()
         active_count = 0
         
         for record in records:
@@ -3129,19 +3835,17 @@ async def cleanup_expired_room(channel_id, role_id):
                 await role.delete(reason="Удаление роли просроченной комнаты")
                 break
         
-        update_temp_room_status(str(channel_id), 'expired')
+        sheets_later(update_temp_room_status, str(channel_id), 'expired')
     except Exception as e:
         print(f"❌ Ошибка очистки комнаты: {e}")
 
-@app.route('/api/guilds/<guild_id>/temp-rooms', methods=['POST'])
-@require_auth
-def create_temp_room(guild_id):
-    """Создать временную голосовую комнату"""
+@bot_route('/api/guilds/<guild_id>/temp-rooms', methods=['POST'])
+async def create_temp_room(data, guild_id):
+    """Создать временную голосовую комнату (фоновая задача; проверки - сразу)"""
     guild = bot.get_guild(int(guild_id))
     if not guild:
-        return jsonify({"error": "Сервер не найден"}), 404
+        return {"error": "Сервер не найден"}, 404
     
-    data = request.json
     room_name = data.get('room_name', '').strip()
     duration = int(data.get('duration_minutes', 60))  # в минутах
     user_limit = int(data.get('user_limit', 10))
@@ -3152,169 +3856,169 @@ def create_temp_room(guild_id):
     
     # Валидация
     if not room_name or len(room_name) > 30:
-        return jsonify({"error": "Некорректное название (1-30 символов)"}), 400
+        return {"error": "Некорректное название (1-30 символов)"}, 400
     
     if duration < 1 or duration > 90:
-        return jsonify({"error": "Время должно быть от 1 до 90 минут"}), 400
+        return {"error": "Время должно быть от 1 до 90 минут"}, 400
     
     if user_limit < 1 or user_limit > 50:
-        return jsonify({"error": "Лимит должен быть от 1 до 50"}), 400
+        return {"error": "Лимит должен быть от 1 до 50"}, 400
     
     if not user_id or user_id == 'unknown':
-        return jsonify({"error": "Не указан ID пользователя"}), 400
+        return {"error": "Не указан ID пользователя"}, 400
     
+    # Проверяем что user_id - это число
     try:
-        # Проверяем что user_id - это число
-        try:
-            user_id_int = int(user_id)
-        except (ValueError, TypeError):
-            return jsonify({"error": f"Некорректный ID пользователя: {user_id}"}), 400
-        
-        # Получаем пользователя
-        user = guild.get_member(user_id_int)
-        if not user:
-            return jsonify({"error": "Пользователь не найден на сервере"}), 404
-        
-        # Получаем категорию
-        category = guild.get_channel(int(ROOM_CATEGORY_ID))
-        if not category:
-            return jsonify({"error": "Категория для комнат не найдена"}), 404
+        user_id_int = int(user_id)
+    except (ValueError, TypeError):
+        return {"error": f"Некорректный ID пользователя: {user_id}"}, 400
+    
+    # Получаем пользователя
+    user = guild.get_member(user_id_int)
+    if not user:
+        return {"error": "Пользователь не найден на сервере"}, 404
+    
+    # Получаем категорию
+    category = guild.get_channel(int(ROOM_CATEGORY_ID))
+    if not category:
+        return {"error": "Категория для комнат не найдена"}, 404
+    
+    async def run(job):
+        # Этапы: роль, приглашённые, канал, уведомление + сохранение
+        job.set_total(4)
         
         # Новая система именования: канал - просто название, роль - Room(название)
         voice_channel_name = room_name
         role_name = f"Room({room_name})"
         
-        async def create_room():
-            # Создаём роль
-            role = await guild.create_role(
-                name=role_name,
-                mentionable=True,
-                hoist=False,
-                reason=f"Роль-ключ для временной комнаты {voice_channel_name}"
-            )
-            
-            # Выдаём роль владельцу
-            await user.add_roles(role)
-            
-            # Ищем упоминания пользователей в сообщении и выдаём им роль
-            invited_users = []
-            if message_id and channel_id:
-                try:
-                    request_channel = bot.get_channel(int(channel_id))
-                    if request_channel:
-                        original_message = await request_channel.fetch_message(int(message_id))
-                        # Ищем всех упомянутых пользователей
-                        for mentioned_user in original_message.mentions:
-                            if mentioned_user.id != user.id:  # Не добавляем владельца повторно
-                                await mentioned_user.add_roles(role)
-                                invited_users.append(mentioned_user.name)
-                                print(f"✅ Роль {role_name} выдана {mentioned_user.name}")
-                except Exception as e:
-                    print(f"⚠️ Ошибка при выдаче ролей упомянутым: {e}")
-            
-            # Создаём голосовой канал
-            # Видимость: все видят, но подключиться могут только с ролью
-            # Владелец получает право управлять ролями
-            overwrites = {
-                guild.default_role: discord.PermissionOverwrite(view_channel=True, connect=False),
-                role: discord.PermissionOverwrite(connect=True, view_channel=True, speak=True),
-                user: discord.PermissionOverwrite(connect=True, view_channel=True, speak=True, manage_roles=True),
-                guild.me: discord.PermissionOverwrite(connect=True, view_channel=True, manage_channels=True, manage_roles=True)
-            }
-            
-            voice_channel = await guild.create_voice_channel(
-                name=voice_channel_name,
-                category=category,
-                user_limit=user_limit,
-                overwrites=overwrites,
-                reason=f"Временная комната для {user.name}"
-            )
-            
-            # Отправляем личное сообщение пользователю (видимо только ему)
+        # Создаём роль
+        role = await guild.create_role(
+            name=role_name,
+            mentionable=True,
+            hoist=False,
+            reason=f"Роль-ключ для временной комнаты {voice_channel_name}"
+        )
+        
+        # Выдаём роль владельцу
+        await user.add_roles(role)
+        job.advance({"step": "role", "role_id": str(role.id)})
+        
+        # Ищем упоминания пользователей в сообщении и выдаём им роль
+        invited_users = []
+        if message_id and channel_id:
             try:
-                # Формируем список пользователей с доступом
-                access_list = [user.name]
-                if invited_users:
-                    access_list.extend(invited_users)
-                access_text = ", ".join(access_list)
-                
-                dm_message = (
-                    f"👋 **Привет, {user.name}!**\n\n"
-                    f"🚀 Твоя приватная комната **{voice_channel_name}** готова!\n\n"
-                    f"📊 **Информация:**\n"
-                    f"⏰ Время: {duration} минут\n"
-                    f"👥 Лимит: {user_limit} человек\n"
-                    f"🔑 Кто имеет доступ: {access_text}\n\n"
-                    f"⚠️ *Комната автоматически удалится через {duration} минут*\n\n"
-                    f"ℹ️ У тебя и твоих друзей есть права подключаться к комнате **{voice_channel_name}**"
-                )
-                await user.send(dm_message)
-                print(f"✉️ Личное сообщение отправлено {user.name}")
-            except discord.Forbidden:
-                print(f"⚠️ Не удалось отправить DM {user.name} (закрыты личные сообщения)")
-                # Отправляем в канал заявок как запасной вариант
-                if channel_id and message_id:
-                    request_channel = bot.get_channel(int(REQUEST_CHANNEL_ID))
-                    if request_channel:
-                        try:
-                            original_message = await request_channel.fetch_message(int(message_id))
-                            await original_message.reply(
-                                f"{user.mention} твоя комната **{full_room_name}** готова! ⏰ {duration}мин",
-                                delete_after=60
-                            )
-                        except Exception as e:
-                            print(f"⚠️ Ошибка отправки реплая: {e}")
+                request_channel = bot.get_channel(int(channel_id))
+                if request_channel:
+                    original_message = await request_channel.fetch_message(int(message_id))
+                    # Ищем всех упомянутых пользователей
+                    for mentioned_user in original_message.mentions:
+                        if mentioned_user.id != user.id:  # Не добавляем владельца повторно
+                            await mentioned_user.add_roles(role)
+                            invited_users.append(mentioned_user.name)
+                            print(f"✅ Роль {role_name} выдана {mentioned_user.name}")
             except Exception as e:
-                print(f"⚠️ Ошибка отправки уведомления: {e}")
-            
-            # Сохраняем инфо о комнате
-            created_at = datetime.now()
-            expires_at = created_at + timedelta(minutes=duration)
-            
-            room_info = {
-                'channel_id': str(voice_channel.id),
-                'room_name': room_name,
-                'full_name': voice_channel_name,
-                'owner_id': str(user_id),
-                'owner_name': user.name,
-                'role_id': str(role.id),
-                'role_name': role_name,
-                'duration': duration,
-                'user_limit': user_limit,
-                'created_at': created_at.isoformat(),
-                'expires_at': expires_at.isoformat(),
-                'guild_id': str(guild_id),
-                'guild_name': guild.name
-            }
-            
-            temp_rooms[str(voice_channel.id)] = room_info
-            
-            # Сохраняем в Google Sheets
-            save_temp_room_to_sheet(room_info)
-            
-            # Запускаем таймер удаления
-            task = asyncio.create_task(auto_delete_room(voice_channel.id, role.id, duration * 60))
-            temp_room_tasks[str(voice_channel.id)] = task
-            
-            print(f"✅ Создана временная комната: {voice_channel_name} (ID: {voice_channel.id}, Роль: {role_name})")
+                print(f"⚠️ Ошибка при выдаче ролей упомянутым: {e}")
+        job.advance({"step": "invites", "invited": invited_users})
+        
+        # Создаём голосовой канал
+        # Видимость: все видят, но подключиться могут только с ролью
+        # Владелец получает право управлять ролями
+        overwrites = {
+            guild.default_role: discord.PermissionOverwrite(view_channel=True, connect=False),
+            role: discord.PermissionOverwrite(connect=True, view_channel=True, speak=True),
+            user: discord.PermissionOverwrite(connect=True, view_channel=True, speak=True, manage_roles=True),
+            guild.me: discord.PermissionOverwrite(connect=True, view_channel=True, manage_channels=True, manage_roles=True)
+        }
+        
+        voice_channel = await guild.create_voice_channel(
+            name=voice_channel_name,
+            category=category,
+            user_limit=user_limit,
+            overwrites=overwrites,
+            reason=f"Временная комната для {user.name}"
+        )
+        job.advance({"step": "channel", "channel_id": str(voice_channel.id)})
+        
+        # Отправляем личное сообщение пользователю (видимо только ему)
+        try:
+            # Формируем список пользователей с доступом
+            access_list = [user.name]
+            if invited_users:
+                access_list.extend(invited_users)
+            access_text = ", ".join(access_list)
             
-            return voice_channel.id, role.id
+            dm_message = (
+                f"👋 **Привет, {user.name}!**\n\n"
+                f"🚀 Твоя приватная комната **{voice_channel_name}** готова!\n\n"
+                f"📊 **Информация:**\n"
+                f"⏰ Время: {duration} минут\n"
+                f"👥 Лимит: {user_limit} человек\n"
+                f"🔑 Кто имеет доступ: {access_text}\n\n"
+                f"⚠️ *Комната автоматически удалится через {duration} минут*\n\n"
+                f"ℹ️ У тебя и твоих друзей есть права подключаться к комнате **{voice_channel_name}**"
+            )
+            await user.send(dm_message)
+            print(f"✉️ Личное сообщение отправлено {user.name}")
+        except discord.Forbidden:
+            print(f"⚠️ Не удалось отправить DM {user.name} (закрыты личные сообщения)")
+            # Отправляем в канал заявок как запасной вариант
+            if channel_id and message_id:
+                request_channel = bot.get_channel(int(REQUEST_CHANNEL_ID))
+                if request_channel:
+                    try:
+                        original_message = await request_channel.fetch_message(int(message_id))
+                        await original_message.reply(
+                            f"{user.mention} твоя комната **{full_room_name}** готова! ⏰ {duration}мин",
+                            delete_after=60
+                        )
+                    except Exception as e:
+                        print(f"⚠️ Ошибка отправки реплая: {e}")
+        except Exception as e:
+            print(f"⚠️ Ошибка отправки уведомления: {e}")
         
-        future = asyncio.run_coroutine_threadsafe(create_room(), bot.loop)
-        voice_channel_id, role_id = future.result(timeout=15)
+        # Сохраняем инфо о комнате
+        created_at = datetime.now()
+        expires_at = created_at + timedelta(minutes=duration)
         
-        return jsonify({
+        room_info = {
+            'channel_id': str(voice_channel.id),
+            'room_name': room_name,
+            'full_name': voice_channel_name,
+            'owner_id': str(user_id),
+            'owner_name': user.name,
+            'role_id': str(role.id),
+            'role_name': role_name,
+            'duration': duration,
+            'user_limit': user_limit,
+            'created_at': created_at.isoformat(),
+            'expires_at': expires_at.isoformat(),
+            'guild_id': str(guild_id),
+            'guild_name': guild.name
+        }
+        
+        temp_rooms[str(voice_channel.id)] = room_info
+        event_bus.publish("temp_room", guild_id, {"channel_id": str(voice_channel.id), "status": "active"})
+        
+        # Сохраняем в Google Sheets
+        sheets_later(save_temp_room_to_sheet, room_info)
+        
+        # Запускаем таймер удаления
+        task = asyncio.create_task(auto_delete_room(voice_channel.id, role.id, duration * 60))
+        temp_room_tasks[str(voice_channel.id)] = task
+        
+        job.advance({"step": "saved"})
+        print(f"✅ Создана временная комната: {voice_channel_name} (ID: {voice_channel.id}, Роль: {role_name})")
+        
+        return {
             "success": True,
-            "channel_id": str(voice_channel_id),
-            "role_id": str(role_id),
+            "channel_id": str(voice_channel.id),
+            "role_id": str(role.id),
             "room_name": voice_channel_name
-        }), 200
-        
-    except Exception as e:
-        print(f"❌ Ошибка создания временной комнаты: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        }
+    
+    # Частично созданную комнату отменять нельзя: роль без канала осталась бы на сервере
+    return job_accepted(job_manager.submit("create_temp_room", run, guild.id, cancellable=False,
+                                           params={"room_name": room_name}))
 
 @app.route('/api/guilds/<guild_id>/temp-rooms', methods=['GET'])
 @require_auth
@@ -3351,67 +4055,51 @@ def get_guild_emojis(guild_id):
     if not guild:
         return jsonify({"error": "Сервер не найден"}), 404
     
-    emojis = []
-    for emoji in guild.emojis:
-        emojis.append({
-            'id': str(emoji.id),
-            'name': emoji.name,
-            'animated': emoji.animated,
-            'url': str(emoji.url),
-            'format': f'<{"a" if emoji.animated else ""}:{emoji.name}:{emoji.id}>'
-        })
-    
-    print(f"📊 Найдено {len(emojis)} кастомных эмодзи на сервере {guild.name}")
-    return jsonify(emojis), 200
+    return cached_guild_response(guild.id, 'emojis', ('emojis',), lambda: emoji_index.get(guild).items)
 
-@app.route('/api/guilds/<guild_id>/temp-rooms/<channel_id>', methods=['DELETE'])
-@require_auth
-def delete_temp_room(guild_id, channel_id):
+@bot_route('/api/guilds/<guild_id>/temp-rooms/<channel_id>', methods=['DELETE'])
+async def delete_temp_room(data, guild_id, channel_id):
     """Удалить временную комнату досрочно"""
     guild = bot.get_guild(int(guild_id))
     if not guild:
-        return jsonify({"error": "Сервер не найден"}), 404
+        return {"error": "Сервер не найден"}, 404
     
     room_info = temp_rooms.get(channel_id)
     if not room_info:
-        return jsonify({"error": "Комната не найдена"}), 404
+        return {"error": "Комната не найдена"}, 404
     
     try:
-        async def remove_room():
-            # Отменяем таймер
-            if channel_id in temp_room_tasks:
-                temp_room_tasks[channel_id].cancel()
-                del temp_room_tasks[channel_id]
-            
-            # Удаляем канал
-            voice_channel = guild.get_channel(int(channel_id))
-            if voice_channel:
-                await voice_channel.delete(reason="Досрочное удаление администратором")
-            
-            # Удаляем роль
-            role = guild.get_role(int(room_info['role_id']))
-            if role:
-                await role.delete(reason="Удаление роли временной комнаты")
-            
-            # Обновляем статус в Google Sheets
-            update_temp_room_status(channel_id, 'deleted_by_admin')
-            
-            # Удаляем из списка
-            if channel_id in temp_rooms:
-                del temp_rooms[channel_id]
-            
-            print(f"🗑️ Удалена временная комната: {room_info['full_name']}")
+        # Отменяем таймер
+        if channel_id in temp_room_tasks:
+            temp_room_tasks[channel_id].cancel()
+            del temp_room_tasks[channel_id]
+        
+        # Удаляем канал
+        voice_channel = guild.get_channel(int(channel_id))
+        if voice_channel:
+            await voice_channel.delete(reason="Досрочное удаление администратором")
+        
+        # Удаляем роль
+        role = guild.get_role(int(room_info['role_id']))
+        if role:
+            await role.delete(reason="Удаление роли временной комнаты")
+        
+        # Обновляем статус в Google Sheets
+        sheets_later(update_temp_room_status, channel_id, 'deleted_by_admin')
+        
+        # Удаляем из списка
+        if channel_id in temp_rooms:
+            del temp_rooms[channel_id]
         
-        future = asyncio.run_coroutine_threadsafe(remove_room(), bot.loop)
-        future.result(timeout=10)
+        print(f"🗑️ Удалена временная комната: {room_info['full_name']}")
         
-        return jsonify({"success": True}), 200
+        return {"success": True}, 200
         
     except Exception as e:
         print(f"❌ Ошибка удаелния комнаты: {e}")
         import traceback
         traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        return {"error": str(e)}, 500
 
 async def auto_delete_room(channel_id, role_id, delay_seconds):
     """Автоматическое удаление комнаты по таймеру"""
@@ -3433,7 +4121,7 @@ async def auto_delete_room(channel_id, role_id, delay_seconds):
                 break
         
         # Обновляем статус в Google Sheets
-        update_temp_room_status(channel_id_str, 'expired')
+        sheets_later(update_temp_room_status, channel_id_str, 'expired')
         
         # Удаляем из списка
         if channel_id_str in temp_rooms:
@@ -3465,27 +4153,99 @@ def run_self_ping():
         except Exception as e:
             print(f"❌ Self-Ping ошибка: {e}")
 # --- START ---
+# Настройки production-сервера (WEB_SERVER=waitress)
+WEB_THREADS = int(os.getenv("WEB_THREADS", 8))
+WEB_CONNECTION_LIMIT = int(os.getenv("WEB_CONNECTION_LIMIT", 100))
+WEB_KEEPALIVE_TIMEOUT = int(os.getenv("WEB_KEEPALIVE_TIMEOUT", 120))  # простой keep-alive соединения, сек
+
 def run_flask():
     app.run(host='0.0.0.0', port=PORT, debug=False)
 
+def run_waitress():
+    """Production WSGI: пул потоков, keep-alive, корректная остановка по SIGTERM"""
+    try:
+        from waitress import create_server
+    except ImportError:
+        print("⚠️ waitress не установлен - запускаем dev-сервер Flask")
+        run_flask()
+        return
+    
+    server = create_server(
+        app,
+        host='0.0.0.0',
+        port=PORT,
+        threads=WEB_THREADS,
+        connection_limit=WEB_CONNECTION_LIMIT,
+        channel_timeout=WEB_KEEPALIVE_TIMEOUT,
+        ident='woushBOT'
+    )
+    
+    def handle_sigterm(signum, frame):
+        # waitress ловит SystemExit: новые соединения не принимаются, текущие запросы дорабатывают
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    
+    print(f"✅ Waitress: {WEB_THREADS} потоков, до {WEB_CONNECTION_LIMIT} соединений, keep-alive {WEB_KEEPALIVE_TIMEOUT}с")
+    server.run()
+
 def run_bot():
     bot.run(TOKEN)
 
+def shutdown():
+    """Остановить бота и сохранить локальное состояние"""
+    print("🛑 Остановка...")
+    if bot.is_ready() and not bot.is_closed():
+        try:
+            # Сначала дописываем то, что уже в очередях конвейера сообщений
+            asyncio.run_coroutine_threadsafe(ingest.drain(), bot.loop).result(timeout=15)
+            asyncio.run_coroutine_threadsafe(bot.close(), bot.loop).result(timeout=10)
+        except Exception as e:
+            print(f"⚠️ Ошибка остановки бота: {e}")
+    pending_roles = role_changes.drain()
+    if pending_roles:
+        log_activity_batch(pending_roles)
+    for store in (rr_store, punishments_store, welcome_store, scan_state_store, spam_config_store):
+        store.close()
+    print("✅ Состояние сохранено")
+
+async def shutdown_async():
+    await async_api.stop()
+    await ingest.drain()
+    await bot.close()
+
+@bot.event
+async def setup_hook():
+    # WEB_SERVER=aiohttp: API работает в том же event loop, что и бот
+    if WEB_SERVER == 'aiohttp':
+        await async_api.start()
+        bot.loop.add_signal_handler(signal.SIGTERM, lambda: asyncio.ensure_future(shutdown_async()))
+
 # === SUSPICIOUS ACTIVITY ===
 if __name__ == '__main__':
     print("🚀 Запуск Discord Bot Dashboard...")
-    print(f"🌐 Flask Port: {PORT}")
-    
-    bot_thread = threading.Thread(target=run_bot, daemon=True)
-    bot_thread.start()
+    print(f"🌐 Web Port: {PORT} ({WEB_SERVER})")
     
     ping_thread = threading.Thread(target=run_self_ping, daemon=True)
     ping_thread.start()
     
-    time.sleep(5)
-    print("✅ Flask сервер запускается...")
-
-    run_flask()
+    # В любом режиме при выходе: дописать конвейер и изменения ролей, сжать журналы состояния
+    try:
+        if WEB_SERVER == 'aiohttp':
+            # Бот и API в одном потоке: сервер стартует в setup_hook
+            run_bot()
+        else:
+            bot_thread = threading.Thread(target=run_bot, daemon=True)
+            bot_thread.start()
+            
+            time.sleep(5)
+            if WEB_SERVER == 'waitress':
+                print("✅ Production сервер запускается...")
+                run_waitress()
+            else:
+                print("✅ Flask сервер запускается...")
+                run_flask()
+    finally:
+        shutdown()
 
 # === USER INFO ===
 
@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+"""
+Ограничитель запросов к Google Sheets API
+- Token bucket на чтение и запись (квоты в минуту)
+- Классы приоритета: модерация > аналитика > массовая синхронизация
+- Повтор с экспоненциальной задержкой и джиттером при 429/5xx
+- Отложенная запись строк вместо потери при исчерпании квоты
+- В event loop бота ограничитель никогда не ждёт: нет токена или нужен повтор -
+  строки откладываются, прочие вызовы завершаются SheetsThrottled
+"""
+
+import asyncio
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from gspread.exceptions import APIError
+
+# Классы приоритета (меньше = важнее)
+PRIORITY_MODERATION = 0
+PRIORITY_ANALYTICS = 1
+PRIORITY_BULK = 2
+PRIORITY_NAMES = {
+    PRIORITY_MODERATION: 'moderation',
+    PRIORITY_ANALYTICS: 'analytics',
+    PRIORITY_BULK: 'bulk'
+}
+
+RETRY_STATUS_CODES = {429, 500, 502, 503}
+
+READ_METHODS = {
+    'get_all_records', 'get_all_values', 'get_values', 'get', 'batch_get',
+    'row_values', 'col_values', 'cell', 'acell', 'find', 'findall', 'range'
+}
+WRITE_METHODS = {
+    'append_row', 'append_rows', 'update', 'update_cell', 'update_cells',
+    'batch_update', 'batch_clear', 'clear', 'delete_rows', 'insert_row',
+    'insert_rows', 'add_rows', 'resize'
+}
+APPEND_METHODS = {'append_row', 'append_rows'}
+
+SPREADSHEET_READ_METHODS = {'worksheet', 'worksheets', 'fetch_sheet_metadata', 'values_batch_get', 'values_get'}
+SPREADSHEET_WRITE_METHODS = {'batch_update', 'values_batch_update', 'values_update', 'values_append', 'add_worksheet'}
+
+
+class SheetsThrottled(Exception):
+    """Вызов из event loop: квота исчерпана или нужен повтор - ждать в loop нельзя"""
+
+
+def _in_event_loop():
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+class TokenBucket:
+    """Корзина токенов: capacity запросов, пополнение rate токенов в секунду"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self):
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self):
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class SheetsRateLimiter:
+    """Общий ограничитель для всех вызовов листов"""
+
+    def __init__(self, reads_per_minute=60, writes_per_minute=60, max_retries=5,
+                 base_delay=1.0, max_delay=32.0, max_deferred_rows=5000):
+        self.buckets = {'read': TokenBucket(reads_per_minute), 'write': TokenBucket(writes_per_minute)}
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_deferred_rows = max_deferred_rows
+        self._cond = threading.Condition()
+        self._waiting = {(kind, p): 0 for kind in self.buckets for p in PRIORITY_NAMES}
+        self._local = threading.local()
+        self._deferred_sheets = []
+        self._flusher = None
+        self.metrics = {
+            'calls': 0,
+            'retries': 0,
+            'throttled': 0,
+            'failures': 0,
+            'deferred_rows': 0,
+            'dropped_rows': 0
+        }
+
+    # --- Приоритет текущего потока ---
+    @contextmanager
+    def priority(self, priority):
+        """Временно переопределить приоритет вызовов в текущем потоке"""
+        previous = getattr(self._local, 'priority', None)
+        self._local.priority = priority
+        try:
+            yield
+        finally:
+            self._local.priority = previous
+
+    def effective_priority(self, default):
+        override = getattr(self._local, 'priority', None)
+        return default if override is None else override
+
+    # --- Токены ---
+    def acquire(self, kind, priority, blocking=True):
+        """Получить токен; ждём, пока есть более приоритетные ожидающие"""
+        bucket = self.buckets[kind]
+        with self._cond:
+            self._waiting[(kind, priority)] += 1
+            try:
+                throttled = False
+                while True:
+                    higher_waiting = any(self._waiting[(kind, p)] for p in PRIORITY_NAMES if p < priority)
+                    if not higher_waiting and bucket.try_take():
+                        return True
+                    if not blocking:
+                        return False
+                    if not throttled:
+                        throttled = True
+                        self.metrics['throttled'] += 1
+                    self._cond.wait(timeout=max(bucket.wait_time(), 0.05))
+            finally:
+                self._waiting[(kind, priority)] -= 1
+                self._cond.notify_all()
+
+    def _backoff(self, attempt):
+        """Полный джиттер: случайная задержка в [0, min(max_delay, base * 2^attempt)]"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    @staticmethod
+    def _status_code(error):
+        response = getattr(error, 'response', None)
+        return getattr(response, 'status_code', None) or getattr(error, 'code', None)
+
+    def call(self, kind, priority, func, *args, **kwargs):
+        """Выполнить вызов API с учётом квоты и повторами при 429/5xx"""
+        return self.call_with_token(kind, priority, False, func, *args, **kwargs)
+
+    def call_with_token(self, kind, priority, token_held, func, *args, **kwargs):
+        """
+        То же, что call; token_held=True - токен для первой попытки уже получен.
+        Из event loop - одна попытка без ожидания: нет токена - SheetsThrottled,
+        429/5xx - исключение сразу (повтор с задержкой заблокировал бы бота и API).
+        """
+        on_loop = _in_event_loop()
+        attempt = 0
+        while True:
+            if not token_held and not self.acquire(kind, priority, blocking=not on_loop):
+                raise SheetsThrottled(f"квота Sheets ({kind}) исчерпана, вызов из event loop отклонён")
+            token_held = False
+            self.count('calls')
+            try:
+                return func(*args, **kwargs)
+            except APIError as e:
+                if self._status_code(e) not in RETRY_STATUS_CODES or attempt >= self.max_retries or on_loop:
+                    self.count('failures')
+                    raise
+                delay = self._backoff(attempt)
+                attempt += 1
+                self.count('retries')
+                print(f"⏳ Sheets API {self._status_code(e)}: повтор {attempt}/{self.max_retries} через {delay:.1f}с")
+                time.sleep(delay)
+
+    # --- Отложенные строки ---
+    def register_deferred(self, sheet):
+        with self._cond:
+            if sheet not in self._deferred_sheets:
+                self._deferred_sheets.append(sheet)
+        self._ensure_flusher()
+
+    def _ensure_flusher(self):
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self, interval=15):
+        while True:
+            time.sleep(interval)
+            with self._cond:
+                sheets = list(self._deferred_sheets)
+            for sheet in sheets:
+                try:
+                    sheet.flush_deferred()
+                except Exception as e:
+                    print(f"⚠️ Не удалось дозаписать отложенные строки ({sheet.title}): {e}")
+
+    # --- Метрики ---
+    def count(self, metric, value=1):
+        with self._cond:
+            self.metrics[metric] += value
+
+    def stats(self):
+        with self._cond:
+            queue_depth = {
+                kind: {PRIORITY_NAMES[p]: self._waiting[(kind, p)] for p in PRIORITY_NAMES}
+                for kind in self.buckets
+            }
+            return {
+                'queue_depth': queue_depth,
+                'queue_depth_total': sum(self._waiting.values()),
+                'tokens': {kind: round(b.tokens, 2) for kind, b in self.buckets.items()},
+                'deferred_pending': sum(len(s._deferred) for s in self._deferred_sheets),
+                **self.metrics
+            }
+
+
+class LimitedWorksheet:
+    """Прокси gspread.Worksheet: все чтения/записи идут через ограничитель"""
+
+    def __init__(self, worksheet, limiter, priority=PRIORITY_ANALYTICS, parent=None):
+        self._worksheet = worksheet
+        self._limiter = limiter
+        self._priority = priority
+        self._parent = parent
+        self._deferred = []
+        self._deferred_lock = threading.Lock()
+
+    @property
+    def spreadsheet(self):
+        if self._parent is not None:
+            return self._parent
+        return LimitedSpreadsheet(self._worksheet.spreadsheet, self._limiter, self._priority)
+
+    def __getattr__(self, name):
+        attr = getattr(self._worksheet, name)
+        if not callable(attr):
+            return attr
+        if name in APPEND_METHODS:
+            return lambda *args, **kwargs: self._append(name, *args, **kwargs)
+        if name in READ_METHODS:
+            kind = 'read'
+        elif name in WRITE_METHODS:
+            kind = 'write'
+        else:
+            return attr
+
+        def limited(*args, **kwargs):
+            priority = self._limiter.effective_priority(self._priority)
+            return self._limiter.call(kind, priority, attr, *args, **kwargs)
+        return limited
+
+    def __repr__(self):
+        return f"<LimitedWorksheet {self._worksheet.title!r}>"
+
+    # --- Добавление строк без потерь ---
+    def _append(self, name, *args, **kwargs):
+        rows = [args[0]] if name == 'append_row' else list(args[0])
+        priority = self._limiter.effective_priority(self._priority)
+
+        # В event loop бота не ждём квоту - откладываем строки
+        token_held = False
+        if _in_event_loop():
+            if not self._limiter.acquire('write', priority, blocking=False):
+                self._defer(rows)
+                return None
+            token_held = True
+
+        with self._deferred_lock:
+            pending, self._deferred = self._deferred, []
+        batch = pending + rows
+        try:
+            if len(batch) == 1:
+                return self._limiter.call_with_token('write', priority, token_held,
+                                                     self._worksheet.append_row, batch[0], *args[1:], **kwargs)
+            return self._limiter.call_with_token('write', priority, token_held,
+                                                 self._worksheet.append_rows, batch, *args[1:], **kwargs)
+        except APIError as e:
+            if SheetsRateLimiter._status_code(e) not in RETRY_STATUS_CODES:
+                with self._deferred_lock:
+                    self._deferred = pending + self._deferred
+                raise
+            self._defer(batch)
+            print(f"⚠️ Квота Sheets исчерпана: {len(batch)} строк отложено ({self._worksheet.title})")
+            return None
+
+    def append_rows_now(self, rows, *args, **kwargs):
+        """
+        Добавить строки без откладывания (SheetMirror: позиции строк должны совпадать с листом).
+        Ошибка квоты - исключение, строки не записаны.
+        """
+        priority = self._limiter.effective_priority(self._priority)
+        return self._limiter.call('write', priority, self._worksheet.append_rows, rows, *args, **kwargs)
+
+    def _defer(self, rows):
+        with self._deferred_lock:
+            self._deferred.extend(rows)
+            overflow = len(self._deferred) - self._limiter.max_deferred_rows
+            if overflow > 0:
+                del self._deferred[:overflow]
+                print(f"❌ Буфер отложенных строк переполнен ({self._worksheet.title}): потеряно {overflow}")
+        self._limiter.count('deferred_rows', len(rows))
+        if overflow > 0:
+            self._limiter.count('dropped_rows', overflow)
+        self._limiter.register_deferred(self)
+
+    def flush_deferred(self):
+        """Дозаписать отложенные строки одним запросом"""
+        with self._deferred_lock:
+            pending, self._deferred = self._deferred, []
+        if not pending:
+            return 0
+        try:
+            self._limiter.call('write', self._priority, self._worksheet.append_rows, pending)
+            print(f"✅ Дозаписано {len(pending)} отложенных строк ({self._worksheet.title})")
+            return len(pending)
+        except Exception:
+            with self._deferred_lock:
+                self._deferred = pending + self._deferred
+            raise
+
+
+class LimitedSpreadsheet:
+    """Прокси gspread.Spreadsheet: запросы уровня таблицы тоже через ограничитель"""
+
+    def __init__(self, spreadsheet, limiter, priority=PRIORITY_ANALYTICS, sheet_priorities=None):
+        self._spreadsheet = spreadsheet
+        self._limiter = limiter
+        self._priority = priority
+        self._sheet_priorities = sheet_priorities or {}
+        self._wrapped = {}
+
+    def wrap(self, worksheet):
+        """Обернуть лист (один прокси на лист - общий буфер отложенных строк)"""
+        if isinstance(worksheet, LimitedWorksheet):
+            return worksheet
+        key = worksheet.id
+        if key not in self._wrapped:
+            priority = self._sheet_priorities.get(worksheet.title, self._priority)
+            self._wrapped[key] = LimitedWorksheet(worksheet, self._limiter, priority, parent=self)
+        return self._wrapped[key]
+
+    def __getattr__(self, name):
+        attr = getattr(self._spreadsheet, name)
+        if not callable(attr):
+            return attr
+        if name in SPREADSHEET_READ_METHODS:
+            kind = 'read'
+        elif name in SPREADSHEET_WRITE_METHODS:
+            kind = 'write'
+        else:
+            return attr
+
+        def limited(*args, **kwargs):
+            priority = self._limiter.effective_priority(self._priority)
+            result = self._limiter.call(kind, priority, attr, *args, **kwargs)
+            if name in ('worksheet', 'add_worksheet'):
+                return self.wrap(result)
+            if name == 'worksheets':
+                return [self.wrap(ws) for ws in result]
+            return result
+        return limited
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Подготовка листов Google Sheets при запуске
+- Метаданные всех листов и строки заголовков - пакетными запросами
+- Недостающие листы создаются одним batch_update
+- Некритичные листы подготавливаются при первом обращении
+"""
+
+import threading
+
+
+def _a1(title, range_name):
+    return "'{}'!{}".format(title.replace("'", "''"), range_name)
+
+
+class SheetProvisioner:
+    """Создание листов и проверка заголовков с минимумом запросов к API"""
+
+    def __init__(self, spreadsheet, headers, rows=1000, cols=20):
+        self.spreadsheet = spreadsheet
+        self.headers = headers  # {name: [header, ...]}
+        self.rows = rows
+        self.cols = cols
+        self._worksheets = None  # {title: worksheet} - кеш метаданных
+        self._ready = {}
+        self._lock = threading.RLock()
+
+    def _load_metadata(self):
+        if self._worksheets is None:
+            self._worksheets = {ws.title: ws for ws in self.spreadsheet.worksheets()}
+
+    def provision(self, names):
+        """
+        Подготовить листы names: 1 запрос метаданных (кешируется),
+        1 пакетное чтение заголовков, и только при необходимости -
+        1 пакетное создание + 1 пакетная запись заголовков.
+        """
+        with self._lock:
+            names = [n for n in names if n not in self._ready]
+            if not names:
+                return {}
+            self._load_metadata()
+
+            existing = [n for n in names if n in self._worksheets]
+            missing = [n for n in names if n not in self._worksheets]
+
+            header_writes = []
+            if existing:
+                response = self.spreadsheet.values_batch_get([_a1(n, '1:1') for n in existing])
+                for name, value_range in zip(existing, response.get('valueRanges', [])):
+                    values = value_range.get('values') or [[]]
+                    first_row = values[0]
+                    if first_row != self.headers[name]:
+                        print(f"⚠️ Лист '{name}' имеет неправильные заголовки, обновляем...")
+                        # Дополняем пустыми ячейками, чтобы затереть лишние старые заголовки
+                        width = max(len(first_row), len(self.headers[name]))
+                        header_writes.append((name, self.headers[name] + [''] * (width - len(self.headers[name]))))
+                    else:
+                        print(f"✅ Лист '{name}' уже существует с правильными заголовками")
+
+            if missing:
+                self.spreadsheet.batch_update({'requests': [
+                    {'addSheet': {'properties': {
+                        'title': name,
+                        'gridProperties': {'rowCount': self.rows, 'columnCount': self.cols}
+                    }}}
+                    for name in missing
+                ]})
+                # Перечитываем метаданные, чтобы получить объекты новых листов
+                self._worksheets = None
+                self._load_metadata()
+                header_writes.extend((name, self.headers[name]) for name in missing)
+                print(f"✅ Созданы листы: {', '.join(missing)}")
+
+            if header_writes:
+                self.spreadsheet.values_batch_update({
+                    'valueInputOption': 'RAW',
+                    'data': [{'range': _a1(name, 'A1'), 'values': [row]} for name, row in header_writes]
+                })
+                print(f"✅ Заголовки обновлены (данные сохранены): {', '.join(n for n, _ in header_writes)}")
+
+            for name in names:
+                self._ready[name] = self._worksheets[name]
+            return {name: self._ready[name] for name in names}
+
+    def get(self, name):
+        """Лист по имени (подготавливается при первом обращении)"""
+        with self._lock:
+            if name not in self._ready:
+                self.provision([name])
+            return self._ready[name]
+
+    def lazy(self, name):
+        return LazySheet(self, name)
+
+
+class LazySheet:
+    """Прокси листа: подготовка откладывается до первого обращения к атрибуту"""
+
+    def __init__(self, provisioner, name):
+        self._provisioner = provisioner
+        self._name = name
+
+    def resolve(self):
+        return self._provisioner.get(self._name)
+
+    def __getattr__(self, attr):
+        return getattr(self.resolve(), attr)
+
+    def __bool__(self):
+        return True
+
+    def __repr__(self):
+        return f"<LazySheet {self._name!r}>"
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Дифференциальная синхронизация листов Google Sheets
+Локальное зеркало листа + применение только изменённых строк
+"""
+
+import threading
+
+from gspread.utils import rowcol_to_a1
+
+
+class SheetMirror:
+    """
+    Зеркало листа в памяти: ключи строк в порядке листа и их значения.
+    Позволяет вычислить разницу с желаемым состоянием и применить
+    только вставки, обновления и удаления (по одному запросу на тип).
+    """
+
+    def __init__(self, worksheet, key_func, header_rows=1, ignore_columns=()):
+        self.worksheet = worksheet
+        self.key_func = key_func  # row (list[str]) -> key или None
+        self.header_rows = header_rows
+        self.ignore_columns = set(ignore_columns)  # колонки, не влияющие на "изменено ли"
+        self._keys = None  # ключ для каждой строки данных (строка листа = idx + header_rows + 1)
+        self._rows = None  # {key: row}
+        self._lock = threading.RLock()
+
+    # --- Загрузка ---
+    def load(self):
+        """Прочитать лист целиком (один запрос)"""
+        with self._lock:
+            values = self.worksheet.get_all_values()
+            self._keys = []
+            self._rows = {}
+            for row in values[self.header_rows:]:
+                key = self.key_func(row) if any(str(v).strip() for v in row) else None
+                self._keys.append(key)
+                if key is not None:
+                    self._rows[key] = [str(v) for v in row]
+
+    def invalidate(self):
+        """Сбросить зеркало - следующая операция перечитает лист"""
+        with self._lock:
+            self._keys = None
+            self._rows = None
+
+    def _ensure_loaded(self):
+        if self._keys is None:
+            self.load()
+
+    def get(self, key):
+        with self._lock:
+            self._ensure_loaded()
+            return self._rows.get(key)
+
+    def keys(self, scope=None):
+        with self._lock:
+            self._ensure_loaded()
+            return [k for k in self._rows if scope is None or scope(k)]
+
+    # --- Сравнение ---
+    def _normalize(self, row):
+        return [str(v) if v is not None else '' for v in row]
+
+    def _same(self, old, new):
+        width = max(len(old), len(new))
+        for col in range(width):
+            if col in self.ignore_columns:
+                continue
+            a = old[col] if col < len(old) else ''
+            b = new[col] if col < len(new) else ''
+            if a != b:
+                return False
+        return True
+
+    # --- Публичный API ---
+    def sync(self, desired, scope=None):
+        """
+        Привести строки (в пределах scope) к desired = {key: row}.
+        Возвращает (inserted, updated, deleted).
+        """
+        with self._lock:
+            self._ensure_loaded()
+            desired = {k: self._normalize(r) for k, r in desired.items()}
+
+            updates = {}
+            deletes = []
+            seen = set()
+            for pos, key in enumerate(self._keys):
+                if key is None or (scope is not None and not scope(key)):
+                    continue
+                if key not in desired or key in seen:
+                    deletes.append(pos)
+                    continue
+                seen.add(key)
+                if not self._same(self._rows[key], desired[key]):
+                    updates[pos] = desired[key]
+
+            inserts = [(k, r) for k, r in desired.items() if k not in seen]
+            self._commit(updates, deletes, inserts)
+            return len(inserts), len(updates), len(deletes)
+
+    def patch(self, upserts=None, removals=None):
+        """
+        Точечное изменение: upserts = {key: row}, removals = iterable ключей.
+        Строки, которые не изменились, не записываются.
+        Возвращает (inserted, updated, deleted).
+        """
+        upserts = {k: self._normalize(r) for k, r in (upserts or {}).items()}
+        removals = set(removals or ())
+        with self._lock:
+            self._ensure_loaded()
+            updates = {}
+            deletes = []
+            seen = set()
+            for pos, key in enumerate(self._keys):
+                if key is None:
+                    continue
+                if key in removals or (key in upserts and key in seen):
+                    deletes.append(pos)
+                    continue
+                if key in upserts:
+                    seen.add(key)
+                    if not self._same(self._rows[key], upserts[key]):
+                        updates[pos] = upserts[key]
+
+            inserts = [(k, r) for k, r in upserts.items() if k not in seen and k not in removals]
+            self._commit(updates, deletes, inserts)
+            return len(inserts), len(updates), len(deletes)
+
+    # --- Применение изменений ---
+    def _sheet_row(self, pos):
+        return pos + self.header_rows + 1
+
+    def _commit(self, updates, deletes, inserts):
+        """Обновления -> удаления -> вставки; не более одного запроса на каждый тип"""
+        try:
+            if updates:
+                self.worksheet.batch_update([
+                    {
+                        'range': f"{rowcol_to_a1(self._sheet_row(pos), 1)}:{rowcol_to_a1(self._sheet_row(pos), len(row))}",
+                        'values': [row]
+                    }
+                    for pos, row in updates.items()
+                ])
+                for pos, row in updates.items():
+                    self._rows[self._keys[pos]] = row
+
+            if deletes:
+                sheet_id = self.worksheet.id
+                # Удаляем снизу вверх, чтобы индексы не сбивались
+                requests = [
+                    {
+                        'deleteDimension': {
+                            'range': {
+                                'sheetId': sheet_id,
+                                'dimension': 'ROWS',
+                                'startIndex': self._sheet_row(pos) - 1,
+                                'endIndex': self._sheet_row(pos)
+                            }
+                        }
+                    }
+                    for pos in sorted(deletes, reverse=True)
+                ]
+                self.worksheet.spreadsheet.batch_update({'requests': requests})
+                removed = set(deletes)
+                remaining = [k for pos, k in enumerate(self._keys) if pos not in removed]
+                remaining_keys = set(remaining)
+                for pos in removed:
+                    key = self._keys[pos]
+                    if key is not None and key not in remaining_keys:
+                        self._rows.pop(key, None)
+                self._keys = remaining
+
+            if inserts:
+                # Без отложенной записи: строки должны появиться в листе сейчас, иначе позиции разойдутся
+                append_rows = getattr(self.worksheet, 'append_rows_now', self.worksheet.append_rows)
+                append_rows([row for _, row in inserts])
+                for key, row in inserts:
+                    self._keys.append(key)
+                    self._rows[key] = row
+        except Exception:
+            # Состояние листа неизвестно - перечитаем при следующей операции
+            self.invalidate()
+            raise
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Учёт частоты сообщений (защита от спама)
+- Состояние по паре (сервер, пользователь): счёт на разных серверах не смешивается
+- Скользящее окно - deque не длиннее threshold+1, обновление амортизированно O(1)
+- Неактивные пользователи вытесняются: памяти не больше, чем активных за idle_ttl (и не больше max_users)
+- Пороги настраиваются для каждого сервера, без настройки - значения по умолчанию
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+# threshold - сообщений за window сек считается спамом (если больше),
+# activity_interval - в статистику активности засчитывается не больше 1 сообщения за интервал
+DEFAULT_SPAM_CONFIG = {'threshold': 5, 'window': 10, 'activity_interval': 5}
+# Верхние границы не больше idle_ttl трекера: состояние вытесняется не раньше, чем окно истечёт
+SPAM_CONFIG_LIMITS = {'threshold': (1, 100), 'window': (1, 600), 'activity_interval': (0, 600)}
+
+
+def validate_spam_config(data):
+    """Настройки из запроса -> {ключ: число}; ValueError - если значение вне допустимых границ"""
+    config = {}
+    for key, (low, high) in SPAM_CONFIG_LIMITS.items():
+        if key not in data:
+            continue
+        try:
+            value = float(data[key])
+        except (TypeError, ValueError):
+            raise ValueError(f"{key}: ожидается число")
+        if not low <= value <= high:
+            raise ValueError(f"{key}: допустимо от {low} до {high}")
+        config[key] = int(value) if key == 'threshold' else value
+    return config
+
+
+class _UserState:
+    __slots__ = ('times', 'last_counted', 'last_seen')
+
+    def __init__(self, threshold):
+        self.times = deque(maxlen=threshold + 1)
+        self.last_counted = None
+        self.last_seen = 0.0
+
+
+class SpamTracker:
+    def __init__(self, get_config=None, idle_ttl=600, max_users=100000, sweep_every=1000):
+        self.get_config = get_config  # get_config(guild_id) -> dict с переопределёнными порогами или None
+        self.idle_ttl = idle_ttl
+        self.max_users = max_users
+        self.sweep_every = sweep_every
+        self._users = OrderedDict()  # {(guild_id, user_id): _UserState}, от давно активных к недавним
+        self._lock = threading.Lock()
+        self._since_sweep = 0
+        self.checks = 0
+        self.spam_hits = 0
+        self.evicted = 0
+
+    def config(self, guild_id):
+        config = dict(DEFAULT_SPAM_CONFIG)
+        if self.get_config:
+            config.update(self.get_config(str(guild_id) if guild_id else 'DM') or {})
+        return config
+
+    def check(self, guild_id, user_id, now=None):
+        """
+        Учесть сообщение: (засчитать_в_активность, спам).
+        Спам - больше threshold сообщений за последние window секунд.
+        """
+        now = time.monotonic() if now is None else now
+        config = self.config(guild_id)
+        threshold, window = config['threshold'], config['window']
+        key = (guild_id, user_id)
+        with self._lock:
+            self.checks += 1
+            state = self._users.get(key)
+            if state is None:
+                state = self._users[key] = _UserState(threshold)
+            else:
+                self._users.move_to_end(key)
+                if state.times.maxlen != threshold + 1:
+                    # Порог сервера изменился - окно пересоздаётся с новой длиной
+                    state.times = deque(state.times, maxlen=threshold + 1)
+            state.last_seen = now
+
+            should_count = state.last_counted is None or now - state.last_counted >= config['activity_interval']
+            if should_count:
+                state.last_counted = now
+
+            state.times.append(now)
+            # В окне threshold+1 сообщений, и самое старое из них не вышло за window - порог превышен
+            is_spam = len(state.times) > threshold and now - state.times[0] < window
+            if is_spam:
+                self.spam_hits += 1
+
+            self._since_sweep += 1
+            if self._since_sweep >= self.sweep_every or len(self._users) > self.max_users:
+                self._sweep(now)
+        return should_count, is_spam
+
+    def _sweep(self, now):
+        """Вытеснить неактивных (и самых давних сверх max_users); порядок OrderedDict - по последней активности"""
+        self._since_sweep = 0
+        while self._users:
+            key, state = next(iter(self._users.items()))
+            if now - state.last_seen < self.idle_ttl and len(self._users) <= self.max_users:
+                break
+            del self._users[key]
+            self.evicted += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'tracked_users': len(self._users),
+                'checks': self.checks,
+                'spam_hits': self.spam_hits,
+                'evicted': self.evicted
+            }
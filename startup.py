@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Фоновый запуск бота по этапам
+- Этапы с приоритетами (сначала важные, одинаковый приоритет - параллельно)
+- Идемпотентность: этап once=True выполняется один раз за процесс
+- Флаги готовности для API
+"""
+
+import asyncio
+import time
+import traceback
+from datetime import datetime
+
+
+class StartupStage:
+    def __init__(self, name, func, priority, once, blocking):
+        self.name = name
+        self.func = func
+        self.priority = priority
+        self.once = once
+        self.blocking = blocking  # синхронная функция -> выполняем в потоке
+        self.state = 'pending'
+        self.runs = 0
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self.duration = None
+
+    def to_dict(self):
+        return {
+            'state': self.state,
+            'priority': self.priority,
+            'runs': self.runs,
+            'error': self.error,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'duration': self.duration
+        }
+
+
+class StartupOrchestrator:
+    """Реестр этапов запуска и их выполнение в фоне после on_ready"""
+
+    def __init__(self):
+        self.stages = {}
+        self.sessions = 0
+        self._task = None
+
+    def stage(self, name, priority=1, once=True, blocking=False):
+        """Декоратор: зарегистрировать этап запуска"""
+        def decorator(func):
+            self.stages[name] = StartupStage(name, func, priority, once, blocking)
+            return func
+        return decorator
+
+    async def _run_stage(self, stage):
+        if stage.once and stage.state in ('running', 'done'):
+            return
+        stage.state = 'running'
+        stage.runs += 1
+        stage.error = None
+        stage.started_at = datetime.now().isoformat()
+        started = time.monotonic()
+        try:
+            if stage.blocking:
+                await asyncio.to_thread(stage.func)
+            else:
+                await stage.func()
+            stage.state = 'done'
+        except Exception as e:
+            stage.state = 'failed'
+            stage.error = str(e)
+            print(f"❌ Этап запуска '{stage.name}' завершился ошибкой: {e}")
+            traceback.print_exc()
+        finally:
+            stage.duration = round(time.monotonic() - started, 2)
+            stage.finished_at = datetime.now().isoformat()
+
+    async def _run(self):
+        for priority in sorted({s.priority for s in self.stages.values()}):
+            group = [s for s in self.stages.values() if s.priority == priority]
+            await asyncio.gather(*(self._run_stage(s) for s in group))
+        print(f"✅ Запуск завершён: {', '.join(f'{s.name}={s.state}' for s in self.stages.values())}")
+
+    def start(self, loop):
+        """Запустить этапы новой сессии в фоне (если предыдущий запуск ещё идёт - пропускаем)"""
+        if self._task and not self._task.done():
+            return self._task
+        self.sessions += 1
+        self._task = loop.create_task(self._run())
+        return self._task
+
+    def is_ready(self, name=None):
+        if name:
+            stage = self.stages.get(name)
+            return bool(stage and stage.state == 'done')
+        return all(s.state == 'done' for s in self.stages.values())
+
+    def status(self):
+        return {
+            'ready': self.is_ready(),
+            'sessions': self.sessions,
+            'stages': {name: stage.to_dict() for name, stage in self.stages.items()}
+        }
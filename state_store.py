@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Локальное хранилище состояния (JSON)
+- Журнал изменений (append-only, одна JSON-строка на изменение)
+- Периодический снимок (compaction) через временный файл + rename
+"""
+
+import json
+import os
+import threading
+
+
+class JsonStateStore:
+    """
+    Словарь, сохраняемый на диск инкрементально.
+    Снимок - обычный JSON-файл (совместим со старым форматом),
+    журнал - файл <path>.journal с операциями set/delete по пути ключей.
+    """
+
+    def __init__(self, path, default=None, compact_every=200, fsync=True):
+        self.path = path
+        self.journal_path = f"{path}.journal"
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.data = default if default is not None else {}
+        self._journal = None
+        self._journal_entries = 0
+        self.version = 0  # растёт при каждом изменении - для производных индексов
+        self._lock = threading.RLock()
+        self._load()
+
+    # --- Загрузка ---
+    def _load(self):
+        """Снимок + повтор журнала. Если журнал не пуст - сразу сжимаем"""
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding='utf-8') as f:
+                    snapshot = json.load(f)
+                self.data.clear()
+                self.data.update(snapshot)
+            except Exception as e:
+                print(f"⚠️ Не удалось прочитать снимок {self.path}: {e}")
+
+        replayed = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r", encoding='utf-8') as f:
+                for line_no, line in enumerate(f, start=1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Оборванная запись (сбой во время записи) - дальше не читаем
+                        print(f"⚠️ {self.journal_path}: повреждённая строка {line_no}, журнал обрезан")
+                        break
+                    self._apply(entry)
+                    replayed += 1
+
+        if replayed:
+            print(f"🔄 {self.path}: применено {replayed} изменений из журнала")
+            self.compact()
+
+    # --- Операции ---
+    def _resolve(self, path, create=False):
+        node = self.data
+        for key in path[:-1]:
+            if key not in node:
+                if not create:
+                    return None
+                node[key] = {}
+            node = node[key]
+        return node
+
+    def _apply(self, entry):
+        path = entry.get("path") or []
+        if not path:
+            return
+        if entry.get("op") == "set":
+            self._resolve(path, create=True)[path[-1]] = entry.get("value")
+        elif entry.get("op") == "delete":
+            parent = self._resolve(path)
+            if parent is not None:
+                parent.pop(path[-1], None)
+        # Версия - после изменения: кто увидел новую версию, увидит и новые данные
+        self.version += 1
+
+    def read(self, func):
+        """(версия, func(data)) под блокировкой хранилища - производный индекс совпадает со своей версией"""
+        with self._lock:
+            return self.version, func(self.data)
+
+    @staticmethod
+    def _path(key):
+        return [str(k) for k in key] if isinstance(key, (list, tuple)) else [str(key)]
+
+    def set(self, key, value):
+        """Установить значение по ключу (или пути ключей) и записать в журнал"""
+        entry = {"op": "set", "path": self._path(key), "value": value}
+        with self._lock:
+            self._apply(entry)
+            self._append(entry)
+
+    def delete(self, key):
+        """Удалить ключ (или путь ключей) и записать в журнал"""
+        entry = {"op": "delete", "path": self._path(key)}
+        with self._lock:
+            self._apply(entry)
+            self._append(entry)
+
+    # --- Запись на диск ---
+    def _append(self, entry):
+        try:
+            if self._journal is None:
+                self._journal = open(self.journal_path, "a", encoding='utf-8')
+            self._journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+            self._journal_entries += 1
+        except Exception as e:
+            print(f"⚠️ Ошибка записи журнала {self.journal_path}: {e}")
+            return
+
+        if self._journal_entries >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        """Записать снимок атомарно и очистить журнал"""
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, "w", encoding='utf-8') as f:
+                    json.dump(self.data, f, ensure_ascii=False, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                print(f"⚠️ Ошибка записи снимка {self.path}: {e}")
+                return
+
+            # Снимок уже содержит все изменения - журнал можно обнулить
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            open(self.journal_path, "w", encoding='utf-8').close()
+            self._journal_entries = 0
+
+    def close(self):
+        """Сжать журнал и закрыть файлы (при остановке)"""
+        with self._lock:
+            if self._journal_entries:
+                self.compact()
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""Конвейер on_message: порядок по ключу, сброс аналитики раньше ожидания модерации, drain()"""
+
+import asyncio
+
+from ingest import IngestPipeline
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_keyed_stage_keeps_order_per_key():
+    pipeline = IngestPipeline()
+    seen = {}
+
+    @pipeline.stage('moderation', maxsize=4, workers=3, key=lambda item: item[0])
+    async def moderation(item):
+        await asyncio.sleep(0)
+        seen.setdefault(item[0], []).append(item[1])
+
+    async def main():
+        # Очереди малы - большинство постановок ждут места (backpressure)
+        results = await asyncio.gather(*(pipeline.submit('moderation', (i % 5, i)) for i in range(200)))
+        await pipeline.drain()
+        return results
+
+    results = run(main())
+    assert all(results)
+    assert sum(len(items) for items in seen.values()) == 200
+    for items in seen.values():
+        assert items == sorted(items)
+    stats = pipeline.stats()['stages']['moderation']
+    assert stats['blocked'] > 0
+    assert stats['dropped'] == 0
+
+
+def test_moderation_never_drops_while_blocked():
+    pipeline = IngestPipeline()
+    gate = asyncio.Event()
+    handled = []
+
+    @pipeline.stage('moderation', maxsize=2, workers=1)
+    async def moderation(item):
+        await gate.wait()
+        handled.append(item)
+
+    async def main():
+        tasks = [asyncio.create_task(pipeline.submit('moderation', i)) for i in range(10)]
+        await asyncio.sleep(0.01)
+        assert pipeline.waiting('moderation') > 0
+        gate.set()
+        results = await asyncio.gather(*tasks)
+        await pipeline.drain()
+        return results
+
+    assert run(main()) == [True] * 10
+    assert handled == list(range(10))
+    assert pipeline.stats()['stages']['moderation']['dropped'] == 0
+
+
+def test_droppable_stage_sheds_before_moderation_blocks():
+    pipeline = IngestPipeline(shed_ratio=0.5)
+    gate = asyncio.Event()
+
+    @pipeline.stage('moderation', maxsize=4, workers=1)
+    async def moderation(item):
+        await gate.wait()
+
+    @pipeline.stage('analytics', maxsize=100, droppable=True)
+    async def analytics(item):
+        pass
+
+    async def main():
+        assert await pipeline.submit('analytics', 'before')
+        # Воркер занят первым элементом, в очереди 2 из 4 - уже перегрузка, но ещё без ожидания
+        for i in range(3):
+            assert await pipeline.submit('moderation', i)
+        assert pipeline.overloaded()
+        assert pipeline.waiting('moderation') == 0
+        assert not await pipeline.submit('analytics', 'shed')
+        gate.set()
+        await pipeline.drain()
+        assert not pipeline.overloaded()
+        assert await pipeline.submit('analytics', 'after')
+        await pipeline.drain()
+
+    run(main())
+    analytics_stats = pipeline.stats()['stages']['analytics']
+    assert analytics_stats['dropped'] == 1
+    assert analytics_stats['processed'] == 2
+    assert pipeline.stats()['stages']['moderation']['dropped'] == 0
+
+
+def test_drain_processes_items_passed_to_later_stages():
+    pipeline = IngestPipeline()
+    written = []
+
+    # Очередь модерации просторная - аналитика не сбрасывается по перегрузке
+    @pipeline.stage('moderation', maxsize=100, workers=2)
+    async def moderation(item):
+        await asyncio.sleep(0.001)
+        await pipeline.submit('analytics', item)
+
+    @pipeline.stage('analytics', maxsize=100, droppable=True, batch_size=10, batch_delay=0.05)
+    async def analytics(items):
+        written.extend(items)
+
+    async def main():
+        for i in range(20):
+            await pipeline.submit('moderation', i)
+        await pipeline.drain(timeout=5)
+        return pipeline.stats()
+
+    stats = run(main())
+    assert sorted(written) == list(range(20))
+    assert all(stage['depth'] == 0 for stage in stats['stages'].values())
+
+
+def test_drain_times_out_without_raising(capsys):
+    pipeline = IngestPipeline()
+
+    @pipeline.stage('moderation', maxsize=10)
+    async def moderation(item):
+        await asyncio.sleep(10)
+
+    async def main():
+        await pipeline.submit('moderation', 1)
+        await pipeline.submit('moderation', 2)
+        await pipeline.drain(timeout=0.05)
+
+    run(main())
+    assert 'moderation=1' in capsys.readouterr().out